@@ -0,0 +1,52 @@
+import base64
+import hashlib
+
+# S3 additional checksums computed on the data as it is transferred. SHA-256 is in
+# hashlib, CRC32C would need the optional awscrt package
+
+ALGORITHM = "SHA256"
+FIELD = "ChecksumSHA256"
+
+
+class ChecksumMismatch(IOError):
+    pass
+
+
+class PartDigest:
+    # the checksum S3 keeps for a part and the MD5 behind its plain ETag, both fed
+    # from the same buffers
+    def __init__(self, data=b""):
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self.update(data)
+
+    def update(self, data):
+        self._sha256.update(data)
+        self._md5.update(data)
+
+    def digest(self):
+        return self._sha256.digest()
+
+    def checksum(self):
+        return base64.b64encode(self._sha256.digest()).decode()
+
+    def etag(self):
+        return '"{0}"'.format(self._md5.hexdigest())
+
+
+def composite_checksum(checksums):
+    # checksum of a multipart object: the hash of the part hashes, with the part count
+    digest = hashlib.sha256(b"".join(base64.b64decode(c) for c in checksums)).digest()
+    return "{0}-{1}".format(base64.b64encode(digest).decode(), len(checksums))
+
+
+def multipart_etag(etags):
+    # MD5 of the part MD5s with the part count; only meaningful while the part ETags
+    # are plain MD5s, which SSE-KMS and SSE-C objects do not have
+    digest = hashlib.md5(b"".join(bytes.fromhex(e.strip('"')) for e in etags)).hexdigest()
+    return '"{0}-{1}"'.format(digest, len(etags))
+
+
+def same_checksum(a, b):
+    # some servers leave the "-N" part count off composite checksums
+    return a.split("-")[0] == b.split("-")[0]
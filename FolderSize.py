@@ -0,0 +1,319 @@
+import json
+import os
+import queue
+import sqlite3
+import string
+import threading
+import time
+from bisect import bisect_right
+
+import S3Client
+import S3Config
+
+SIZE_WORKERS = 16
+# a listing still truncated after this many pages has the rest of its range split
+SPLIT_AFTER_PAGES = 2
+MAX_SPLIT_POINTS = 64
+PROGRESS_INTERVAL = 0.5
+# boundaries a key range is split at, by the kind of character found at a position
+SPLIT_CLASSES = (string.digits, string.ascii_uppercase, string.ascii_lowercase)
+
+
+class SizeTotals:
+    def __init__(self):
+        self.objects = 0
+        self.bytes = 0
+        self.newest = 0.0
+        # storage class -> [objects, bytes]
+        self.classes = {}
+
+    def add(self, size, mtime, storageClass):
+        self.objects += 1
+        self.bytes += size
+        if mtime > self.newest:
+            self.newest = mtime
+        counts = self.classes.get(storageClass)
+        if counts is None:
+            counts = self.classes[storageClass] = [0, 0]
+        counts[0] += 1
+        counts[1] += size
+
+    def merge(self, other):
+        self.objects += other.objects
+        self.bytes += other.bytes
+        self.newest = max(self.newest, other.newest)
+        for storageClass, (objects, size) in other.classes.items():
+            counts = self.classes.get(storageClass)
+            if counts is None:
+                counts = self.classes[storageClass] = [0, 0]
+            counts[0] += objects
+            counts[1] += size
+
+
+class FolderSizeCache:
+    # computed totals per (bucket, prefix) with the time they were computed, a
+    # computation stores its prefix and every direct child prefix
+    def __init__(self, path=None):
+        if path is None:
+            path = S3Config.db_path("folder_sizes.db")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS sizes (
+                bucket TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                computed REAL NOT NULL,
+                objects INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                newest REAL NOT NULL,
+                classes TEXT NOT NULL,
+                PRIMARY KEY (bucket, prefix))""")
+
+    def get(self, bucket, prefix):
+        # (computed, totals) or None
+        with self._lock:
+            row = self._db.execute("SELECT computed, objects, bytes, newest, classes FROM sizes "
+                                   "WHERE bucket = ? AND prefix = ?", (bucket, prefix)).fetchone()
+        return None if row is None else _totals(row)
+
+    def children(self, bucket, prefix):
+        # {name relative to prefix: (computed, totals)} of the direct child prefixes
+        where = "bucket = ?"
+        args = [bucket]
+        if "" != prefix:
+            where += " AND prefix > ? AND prefix < ?"
+            args += [prefix, _upper(prefix)]
+        with self._lock:
+            rows = self._db.execute("SELECT prefix, computed, objects, bytes, newest, classes FROM sizes "
+                                    "WHERE " + where, args).fetchall()
+        children = {}
+        for row in rows:
+            name = row[0][len(prefix):]
+            if "" != name and name.index("/") == len(name) - 1:
+                children[name] = _totals(row[1:])
+        return children
+
+    def put(self, bucket, prefix, total, children, computed=None):
+        # older results below prefix are superseded by this one
+        if computed is None:
+            computed = time.time()
+        rows = [(prefix, total)] + [(prefix + name, totals) for name, totals in children.items()]
+        with self._lock, self._db:
+            if "" == prefix:
+                self._db.execute("DELETE FROM sizes WHERE bucket = ? AND computed < ?", (bucket, computed))
+            else:
+                self._db.execute("DELETE FROM sizes WHERE bucket = ? AND prefix >= ? AND prefix < ? AND computed < ?",
+                                 (bucket, prefix, _upper(prefix), computed))
+            self._db.executemany("INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(bucket, p, computed, t.objects, t.bytes, t.newest, json.dumps(t.classes))
+                                  for p, t in rows])
+
+    def drop(self, bucket):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sizes WHERE bucket = ?", (bucket,))
+
+
+def _totals(row):
+    computed, objects, size, newest, classes = row
+    totals = SizeTotals()
+    totals.objects = objects
+    totals.bytes = size
+    totals.newest = newest
+    totals.classes = json.loads(classes)
+    return computed, totals
+
+
+def _upper(prefix):
+    # smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def split_points(prefix, first, lower, upper):
+    # boundaries b with lower < b < upper that divide the keys after lower; first is
+    # the first key the range listed, the positions where first and lower differ are
+    # where the keys vary, and the split happens at those and shallower positions
+    depth = min(len(os.path.commonprefix([first, lower])), len(lower) - 1)
+    points = []
+    while depth >= len(prefix) and len(points) < MAX_SPLIT_POINTS:
+        head = lower[:depth]
+        for chars in SPLIT_CLASSES:
+            if lower[depth] in chars:
+                points.extend(head + c for c in chars if c > lower[depth] and (upper is None or head + c < upper))
+        depth -= 1
+    return sorted(points[:MAX_SPLIT_POINTS])
+
+
+class FolderSizer:
+    # totals of every key under a prefix. the key space is split by CommonPrefixes and,
+    # where one level holds too many keys, into key ranges; the shards are listed
+    # concurrently and every page is added as it arrives
+    def __init__(self, bucket, prefix, workers=SIZE_WORKERS, progress=None, cancelled=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.workers = workers
+        # progress(totals) from listing threads, at most every PROGRESS_INTERVAL seconds
+        self.progress = progress
+        self.cancelled = cancelled
+        self.total = SizeTotals()
+        # direct child prefix name -> SizeTotals
+        self.children = {}
+        self.requests = 0
+        self._s3 = S3Client.for_bucket(bucket)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._error = None
+        self._reported = 0.0
+
+    def run(self):
+        # returns False if cancelled, raises the first listing error
+        self._queue.put((self._walk, (self.prefix,)))
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        self._queue.join()
+        for _ in threads:
+            self._queue.put(None)
+        if self._error is not None:
+            raise self._error
+        if self.progress is not None:
+            self.progress(self.total)
+        return not self._stopped()
+
+    def _stopped(self):
+        return self._error is not None or (self.cancelled is not None and self.cancelled.is_set())
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            run, args = item
+            try:
+                if not self._stopped():
+                    run(*args)
+            except Exception as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _list(self, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return self._s3.list_objects_v2(Bucket=self.bucket, **kwargs)
+
+    def _add(self, contents):
+        total = SizeTotals()
+        children = {}
+        start = len(self.prefix)
+        for obj in contents:
+            size = obj["Size"]
+            mtime = obj["LastModified"].timestamp()
+            storageClass = obj.get("StorageClass", "STANDARD")
+            total.add(size, mtime, storageClass)
+            slash = obj["Key"].find("/", start)
+            if slash >= 0:
+                name = obj["Key"][start:slash + 1]
+                child = children.get(name)
+                if child is None:
+                    child = children[name] = SizeTotals()
+                child.add(size, mtime, storageClass)
+        report = False
+        with self._lock:
+            self.total.merge(total)
+            for name, totals in children.items():
+                child = self.children.get(name)
+                if child is None:
+                    self.children[name] = totals
+                else:
+                    child.merge(totals)
+            now = time.monotonic()
+            if now - self._reported >= PROGRESS_INTERVAL:
+                self._reported = now
+                report = True
+        if report and self.progress is not None:
+            self.progress(self.total)
+
+    def _walk(self, prefix):
+        # one level by delimiter, child prefixes become shards of their own
+        kwargs = {"Prefix": prefix, "Delimiter": "/"}
+        first = None
+        pages = 0
+        while True:
+            response = self._list(**kwargs)
+            pages += 1
+            contents = response.get("Contents", [])
+            self._add(contents)
+            prefixes = [p["Prefix"] for p in response.get("CommonPrefixes", [])]
+            # walking every folder of a deep tree costs a request per folder, so levels
+            # are only walked while there are fewer shards than workers; the rest is
+            # scanned flat and long scans split themselves into key ranges
+            walk = len(prefixes) + self._queue.qsize() < self.workers
+            for child in prefixes:
+                if walk:
+                    self._queue.put((self._walk, (child,)))
+                else:
+                    self._queue.put((self._scan, (child, None, None)))
+            if not response.get("IsTruncated") or self._stopped():
+                return
+            if contents and first is None:
+                first = contents[0]["Key"]
+            # a long level of plain keys, everything after the last one is split
+            # into ranges; keys of folders listed so far sort before it
+            if (pages >= SPLIT_AFTER_PAGES and contents and (not prefixes or contents[-1]["Key"] > prefixes[-1])
+                    and self._split(prefix, first, contents[-1]["Key"], None)):
+                return
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def _scan(self, prefix, lower, upper):
+        # every key under prefix in the range (lower, upper], None is unbounded
+        kwargs = {"Prefix": prefix}
+        if lower is not None:
+            kwargs["StartAfter"] = lower
+        first = None
+        pages = 0
+        while True:
+            response = self._list(**kwargs)
+            pages += 1
+            contents = response.get("Contents", [])
+            done = not response.get("IsTruncated")
+            if upper is not None and contents and contents[-1]["Key"] > upper:
+                contents = contents[:bisect_right([obj["Key"] for obj in contents], upper)]
+                done = True
+            self._add(contents)
+            if done or not contents or self._stopped():
+                return
+            if first is None:
+                first = contents[0]["Key"]
+            # split only while workers would otherwise go idle
+            if (pages >= SPLIT_AFTER_PAGES and self._queue.qsize() < self.workers
+                    and self._split(prefix, first, contents[-1]["Key"], upper)):
+                return
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def _split(self, prefix, first, lower, upper):
+        points = split_points(prefix, first, lower, upper)
+        if not points:
+            return False
+        bounds = [lower] + points + [upper]
+        for i in range(len(bounds) - 1):
+            self._queue.put((self._scan, (prefix, bounds[i], bounds[i + 1])))
+        return True
+
+
+def compute(bucket, prefix, progress=None, cancelled=None, workers=SIZE_WORKERS):
+    # lists everything under prefix and caches the totals, returns (total, children)
+    # or None if cancelled
+    computed = time.time()
+    sizer = FolderSizer(bucket, prefix, workers, progress, cancelled)
+    if not sizer.run():
+        return None
+    Sizes.put(bucket, prefix, sizer.total, sizer.children, computed)
+    return sizer.total, sizer.children
+
+
+Sizes = FolderSizeCache()
@@ -0,0 +1,353 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import unquote
+
+import S3Client
+import S3Config
+from FolderSize import SizeTotals
+
+# S3 Inventory reports as a stand-in for LIST: the data files are read once into a
+# sorted table, folders are key ranges of it and their totals are summed up front
+
+CSV = "CSV"
+ORC = "ORC"
+PARQUET = "Parquet"
+# rows appended between progress reports
+PROGRESS_ROWS = 100000
+INSERT_BATCH = 10000
+# rows read from the table at a time while listing
+PAGE_ROWS = 10000
+# SQLite page cache of a loaded report, the rest stays in its temporary file
+CACHE_KB = 64 * 1024
+CACHE_DIR = "inventory"
+# field names of the CSV schema, ORC and Parquet name the same columns in snake case
+COLUMN_NAMES = {"Key": "key", "Size": "size", "LastModifiedDate": "last_modified_date", "ETag": "e_tag",
+                "StorageClass": "storage_class", "IsLatest": "is_latest", "IsDeleteMarker": "is_delete_marker"}
+
+
+def parse_location(location):
+    # (bucket, key) for s3://bucket/key, None for a local path
+    if not location.startswith("s3://"):
+        return None
+    bucket, _, key = location[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def load_manifest(location):
+    s3_location = parse_location(location)
+    if s3_location is None:
+        with open(location, "rb") as f:
+            return json.load(f)
+    bucket, key = s3_location
+    body = S3Client.for_bucket(bucket).get_object(Bucket=bucket, Key=key)["Body"]
+    return json.loads(body.read())
+
+
+def data_file(manifest, location, entry):
+    # a local copy of one data file: next to a local manifest as laid out by the
+    # report (or flattened), otherwise fetched once into the cache directory
+    name = os.path.basename(entry["key"])
+    if parse_location(location) is None:
+        folder = os.path.dirname(os.path.abspath(location))
+        for candidate in (os.path.join(folder, name), os.path.join(folder, "data", name),
+                          os.path.join(folder, os.pardir, "data", name)):
+            if os.path.exists(candidate):
+                return candidate
+    bucket = manifest["destinationBucket"].split(":::")[-1]
+    path = os.path.join(S3Config.db_path(CACHE_DIR), bucket, *entry["key"].split("/"))
+    if os.path.exists(path) and os.path.getsize(path) == entry["size"]:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    S3Client.for_bucket(bucket).download_file(bucket, entry["key"], path + ".part")
+    os.replace(path + ".part", path)
+    return path
+
+
+def iter_csv_rows(path, fields):
+    # (key, size, mtime, storage class, etag) of the current versions
+    index = {name: i for i, name in enumerate(fields)}
+    latest = index.get("IsLatest")
+    marker = index.get("IsDeleteMarker")
+    size, mtime, storageClass, etag = (index.get(name) for name in ("Size", "LastModifiedDate", "StorageClass", "ETag"))
+    with io.TextIOWrapper(gzip.open(path), encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if (latest is not None and "false" == row[latest]) or (marker is not None and "true" == row[marker]):
+                continue
+            yield (unquote(row[index["Key"]]),
+                   int(row[size]) if size is not None and row[size] else 0,
+                   _timestamp(row[mtime]) if mtime is not None and row[mtime] else 0.0,
+                   row[storageClass] if storageClass is not None else "",
+                   row[etag] if etag is not None else "")
+
+
+def iter_columnar_rows(path, fields, fileFormat):
+    # ORC and Parquet need the optional pyarrow package
+    try:
+        if ORC == fileFormat:
+            from pyarrow import orc
+        else:
+            import pyarrow.parquet as parquet
+    except ImportError:
+        raise RuntimeError("reading {0} inventory reports needs pyarrow, pip install pyarrow".format(fileFormat))
+    columns = [COLUMN_NAMES[name] for name in fields if name in COLUMN_NAMES]
+    if ORC == fileFormat:
+        reader = orc.ORCFile(path)
+        batches = (reader.read_stripe(i, columns=columns) for i in range(reader.nstripes))
+    else:
+        batches = parquet.ParquetFile(path).iter_batches(columns=columns)
+    for batch in batches:
+        data = {name: batch.column(name).to_pylist() for name in columns}
+        keys = data["key"]
+        sizes = data.get("size") or [0] * len(keys)
+        mtimes = data.get("last_modified_date") or [None] * len(keys)
+        classes = data.get("storage_class") or [""] * len(keys)
+        etags = data.get("e_tag") or [""] * len(keys)
+        latest = data.get("is_latest")
+        marker = data.get("is_delete_marker")
+        for i, key in enumerate(keys):
+            if (latest is not None and latest[i] is False) or (marker is not None and marker[i]):
+                continue
+            yield key, sizes[i] or 0, mtimes[i].timestamp() if mtimes[i] else 0.0, classes[i] or "", etags[i] or ""
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _upper(prefix):
+    # smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _key_range(prefix):
+    # (lower, upper) bounds of the keys starting with prefix, upper None for all keys
+    return prefix, _upper(prefix) if "" != prefix else None
+
+
+def _totals(row):
+    objects, size, newest, classes = row
+    totals = SizeTotals()
+    totals.objects = objects
+    totals.bytes = size
+    totals.newest = newest
+    totals.classes = json.loads(classes)
+    return totals
+
+
+class BucketInventory:
+    # every current object of one report in a private SQLite database, which SQLite
+    # moves to a temporary file once it outgrows the cache and removes when it is
+    # closed. the keys are sorted once loading ends, then one pass in key order
+    # stores the totals of every folder
+    def __init__(self, bucket, created):
+        self.bucket = bucket
+        # report time, the listings are as old as this
+        self.created = created
+        self.count = 0
+        self.classNames = []
+        self._codes = {}
+        self._pending = []
+        self._db = sqlite3.connect("", check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA cache_size=-{0}".format(CACHE_KB))
+            self._db.execute("CREATE TABLE loaded (key TEXT, size INTEGER, mtime REAL, class INTEGER, etag TEXT)")
+
+    def __len__(self):
+        return self.count
+
+    def append(self, key, size, mtime, storageClass, etag):
+        code = self._codes.get(storageClass)
+        if code is None:
+            code = self._codes[storageClass] = len(self.classNames)
+            self.classNames.append(storageClass)
+        self._pending.append((key, size, mtime, code, etag))
+        self.count += 1
+        if len(self._pending) >= INSERT_BATCH:
+            self._flush()
+
+    def _flush(self):
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO loaded VALUES (?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def finish(self, cancelled=None):
+        # sorts the keys and sums the folders, returns False if cancelled
+        self._flush()
+        with self._lock, self._db:
+            # inventory data files are not in key order, SQLite sorts them with a merge
+            # sort on disk and the table is then filled in key order
+            self._db.execute("""CREATE TABLE objects (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                class INTEGER NOT NULL,
+                etag TEXT NOT NULL) WITHOUT ROWID""")
+            self._db.execute("INSERT OR REPLACE INTO objects SELECT * FROM loaded ORDER BY key")
+            self._db.execute("DROP TABLE loaded")
+            self._db.execute("""CREATE TABLE folders (
+                prefix TEXT PRIMARY KEY,
+                parent TEXT,
+                objects INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                newest REAL NOT NULL,
+                classes TEXT NOT NULL) WITHOUT ROWID""")
+            self._db.execute("CREATE INDEX folders_parent ON folders (parent)")
+            self.count = self._db.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+        return self._sum_folders(cancelled)
+
+    def _sum_folders(self, cancelled):
+        # the open folders from the root down to the last key's folder; a folder is
+        # complete at the first key outside it, it is stored and added to its parent
+        folders = [("", SizeTotals())]
+        rows = []
+        with self._lock, self._db:
+            cursor = self._db.execute("SELECT key, size, mtime, class FROM objects")
+            for n, (key, size, mtime, code) in enumerate(cursor):
+                if 0 == n % PROGRESS_ROWS and cancelled is not None and cancelled.is_set():
+                    return False
+                folder = key[:key.rfind("/") + 1]
+                while not folder.startswith(folders[-1][0]):
+                    rows.append(_close_folder(folders))
+                start = len(folders[-1][0])
+                while start < len(folder):
+                    start = folder.index("/", start) + 1
+                    folders.append((folder[:start], SizeTotals()))
+                folders[-1][1].add(size, mtime, self.classNames[code])
+                if len(rows) >= INSERT_BATCH:
+                    self._db.executemany("INSERT INTO folders VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    rows = []
+            while len(folders) > 1:
+                rows.append(_close_folder(folders))
+            total = folders[0][1]
+            rows.append(("", None, total.objects, total.bytes, total.newest, json.dumps(total.classes)))
+            self._db.executemany("INSERT INTO folders VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return True
+
+    def _rows(self, lower, upper, limit):
+        # a cursor over the objects with lower <= key < upper in key order
+        sql = "SELECT key, size, mtime, class, etag FROM objects WHERE key >= ?"
+        args = [lower]
+        if upper is not None:
+            sql += " AND key < ?"
+            args.append(upper)
+        return self._db.execute(sql + " ORDER BY key LIMIT ?", args + [limit])
+
+    def iter_objects(self, prefix):
+        # (key, size, mtime, storage class, etag) of every key under prefix, a page at a time
+        lower, upper = _key_range(prefix)
+        while True:
+            with self._lock:
+                rows = self._rows(lower, upper, PAGE_ROWS).fetchall()
+            for key, size, mtime, code, etag in rows:
+                yield key, size, mtime, self.classNames[code], etag
+            if len(rows) < PAGE_ROWS:
+                return
+            # the smallest string after the last key
+            lower = rows[-1][0] + "\0"
+
+    def iter_children(self, prefix):
+        # the direct children of prefix in key order: ("Dir", name) for folders, which
+        # are stepped over with a single seek, and ("File", key, size, mtime, storage
+        # class, etag) for keys
+        start = len(prefix)
+        lower, upper = _key_range(prefix)
+        while lower is not None:
+            items = []
+            with self._lock:
+                while lower is not None and len(items) < PAGE_ROWS:
+                    read = 0
+                    limit = PAGE_ROWS - len(items)
+                    for key, size, mtime, code, etag in self._rows(lower, upper, limit):
+                        read += 1
+                        slash = key.find("/", start)
+                        if slash >= 0:
+                            items.append(("Dir", key[start:slash + 1]))
+                            lower = _upper(key[:slash + 1])
+                            break
+                        items.append(("File", key, size, mtime, self.classNames[code], etag))
+                        lower = key + "\0"
+                    else:
+                        if read < limit:
+                            lower = None
+            yield from items
+
+    def totals(self, prefix):
+        # SizeTotals of the folder prefix, "" for the whole bucket
+        with self._lock:
+            row = self._db.execute("SELECT objects, bytes, newest, classes FROM folders WHERE prefix = ?",
+                                   (prefix,)).fetchone()
+        return SizeTotals() if row is None else _totals(row)
+
+    def children_totals(self, prefix):
+        # {name: SizeTotals} of the folders directly under prefix
+        with self._lock:
+            rows = self._db.execute("SELECT prefix, objects, bytes, newest, classes FROM folders WHERE parent = ?",
+                                    (prefix,)).fetchall()
+        return {row[0][len(prefix):]: _totals(row[1:]) for row in rows}
+
+
+def _close_folder(folders):
+    # the folders row of the innermost open folder, whose totals go to its parent
+    prefix, totals = folders.pop()
+    folders[-1][1].merge(totals)
+    return prefix, folders[-1][0], totals.objects, totals.bytes, totals.newest, json.dumps(totals.classes)
+
+
+def load(location, progress=None, cancelled=None):
+    # the BucketInventory of a manifest.json, local or s3://; progress(rows, files, of)
+    # is called from the loading thread. returns None if cancelled
+    manifest = load_manifest(location)
+    fileFormat = manifest.get("fileFormat", CSV)
+    fields = [name.strip() for name in manifest.get("fileSchema", "").split(",")]
+    if "Key" not in fields:
+        raise ValueError("inventory schema without a Key field: {0}".format(manifest.get("fileSchema")))
+    created = int(manifest.get("creationTimestamp", 0)) / 1000
+    inventory = BucketInventory(manifest["sourceBucket"], created)
+    files = manifest.get("files", [])
+    for n, entry in enumerate(files):
+        path = data_file(manifest, location, entry)
+        if CSV == fileFormat:
+            rows = iter_csv_rows(path, fields)
+        else:
+            rows = iter_columnar_rows(path, fields, fileFormat)
+        for row in rows:
+            inventory.append(*row)
+            if 0 == len(inventory) % PROGRESS_ROWS:
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                if progress is not None:
+                    progress(len(inventory), n, len(files))
+    if not inventory.finish(cancelled):
+        return None
+    if progress is not None:
+        progress(len(inventory), len(files), len(files))
+    return inventory
+
+
+class Inventories:
+    # loaded inventories by bucket, the object view lists from them instead of S3
+    def __init__(self):
+        self._inventories = {}
+        self._lock = threading.Lock()
+
+    def get(self, bucket):
+        with self._lock:
+            return self._inventories.get(bucket)
+
+    def put(self, inventory):
+        with self._lock:
+            self._inventories[inventory.bucket] = inventory
+
+    def drop(self, bucket):
+        with self._lock:
+            return self._inventories.pop(bucket, None) is not None
+
+
+Loaded = Inventories()
@@ -0,0 +1,217 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+import S3Client
+import S3Config
+
+INDEX_MAX_AGE = 3600
+INSERT_BATCH = 5000
+MAX_RESULTS = 5000
+GLOB_CHARS = "*?["
+
+
+class KeyIndex:
+    # every key of a bucket, filled by a background full listing and kept current by
+    # the app's own uploads and deletes. key ranges answer prefixes, the reversed key
+    # answers suffixes and a trigram FTS table answers substrings
+    def __init__(self, path=None):
+        if path is None:
+            path = S3Config.db_path("key_index.db")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS keys (
+                id INTEGER PRIMARY KEY,
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                rkey TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                etag TEXT NOT NULL,
+                storage_class TEXT NOT NULL,
+                seen INTEGER NOT NULL,
+                UNIQUE (bucket, key))""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS keys_rkey ON keys (bucket, rkey)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                bucket TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL,
+                built REAL,
+                complete INTEGER NOT NULL)""")
+            try:
+                self._db.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS keys_fts
+                    USING fts5(key, content='keys', content_rowid='id', tokenize='trigram')""")
+                self._db.execute("""CREATE TRIGGER IF NOT EXISTS keys_ai AFTER INSERT ON keys BEGIN
+                    INSERT INTO keys_fts (rowid, key) VALUES (new.id, new.key); END""")
+                self._db.execute("""CREATE TRIGGER IF NOT EXISTS keys_ad AFTER DELETE ON keys BEGIN
+                    INSERT INTO keys_fts (keys_fts, rowid, key) VALUES ('delete', old.id, old.key); END""")
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite without FTS5 or the trigram tokenizer, substrings fall back to a scan
+                self.fts = False
+        # the GUI thread reads through its own connection: in WAL mode it sees the last
+        # committed batch and never waits for the build thread's writes
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA query_only=ON")
+        self._readLock = threading.Lock()
+
+    def status(self, bucket):
+        # (complete, built) or None if the bucket was never indexed
+        with self._readLock:
+            row = self._reader.execute("SELECT complete, built FROM buckets WHERE bucket = ?", (bucket,)).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), row[1]
+
+    def begin(self, bucket):
+        with self._lock, self._db:
+            self._db.execute("""INSERT INTO buckets VALUES (?, 1, NULL, 0) ON CONFLICT (bucket)
+                DO UPDATE SET generation = generation + 1, complete = 0""", (bucket,))
+            return self._db.execute("SELECT generation FROM buckets WHERE bucket = ?", (bucket,)).fetchone()[0]
+
+    def finish(self, bucket, generation):
+        # keys the listing did not see again are gone from the bucket
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM keys WHERE bucket = ? AND seen < ?", (bucket, generation))
+            self._db.execute("UPDATE buckets SET complete = 1, built = ? WHERE bucket = ?", (time.time(), bucket))
+
+    def put_many(self, bucket, rows, generation=None):
+        # rows of (key, size, mtime, etag, storage_class)
+        with self._lock, self._db:
+            if generation is None:
+                row = self._db.execute("SELECT generation FROM buckets WHERE bucket = ?", (bucket,)).fetchone()
+                if row is None:
+                    return
+                generation = row[0]
+            self._db.executemany("""INSERT INTO keys (bucket, key, rkey, size, mtime, etag, storage_class, seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (bucket, key) DO UPDATE SET
+                size = excluded.size, mtime = excluded.mtime, etag = excluded.etag,
+                storage_class = excluded.storage_class, seen = excluded.seen""",
+                [(bucket, key, key[::-1], size, mtime, etag, storage_class, generation)
+                 for key, size, mtime, etag, storage_class in rows])
+
+    def put(self, bucket, key, size, mtime, etag="", storage_class="STANDARD"):
+        self.put_many(bucket, [(key, size, mtime, etag, storage_class)])
+
+    def remove(self, bucket, keys):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM keys WHERE bucket = ? AND key = ?", [(bucket, key) for key in keys])
+
+    def remove_prefix(self, bucket, prefix):
+        with self._lock, self._db:
+            if "" == prefix:
+                self._db.execute("DELETE FROM keys WHERE bucket = ?", (bucket,))
+            else:
+                self._db.execute("DELETE FROM keys WHERE bucket = ? AND key >= ? AND key < ?",
+                                 (bucket, prefix, _upper(prefix)))
+
+    def drop(self, bucket):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM keys WHERE bucket = ?", (bucket,))
+            self._db.execute("DELETE FROM buckets WHERE bucket = ?", (bucket,))
+
+    def search(self, bucket, pattern, after=None, before=None, limit=MAX_RESULTS):
+        # returns rows of (key, size, mtime, etag, storage_class) ordered by key
+        where = ["bucket = ?"]
+        args = [bucket]
+        if any(c in pattern for c in GLOB_CHARS):
+            first = min(pattern.find(c) for c in GLOB_CHARS if c in pattern)
+            last = max(pattern.rfind(c) for c in GLOB_CHARS if c in pattern)
+            prefix = pattern[:first]
+            suffix = pattern[last + 1:]
+            if "[" == pattern[last] or "]" in suffix:
+                suffix = ""
+            # narrow with an index range before the GLOB filter
+            if "" != prefix:
+                where.append("key >= ? AND key < ?")
+                args += [prefix, _upper(prefix)]
+            elif "" != suffix:
+                rsuffix = suffix[::-1]
+                where.append("rkey >= ? AND rkey < ?")
+                args += [rsuffix, _upper(rsuffix)]
+            where.append("key GLOB ?")
+            args.append(pattern)
+        elif "" != pattern:
+            if self.fts and len(pattern) >= 3:
+                where.append("id IN (SELECT rowid FROM keys_fts WHERE keys_fts MATCH ?)")
+                args.append('"{0}"'.format(pattern.replace('"', '""')))
+            else:
+                where.append("instr(lower(key), ?) > 0")
+                args.append(pattern.lower())
+        if after is not None:
+            where.append("mtime >= ?")
+            args.append(after)
+        if before is not None:
+            where.append("mtime < ?")
+            args.append(before)
+        args.append(limit)
+        with self._readLock:
+            return self._reader.execute(
+                "SELECT key, size, mtime, etag, storage_class FROM keys WHERE {0} ORDER BY key LIMIT ?".format(
+                    " AND ".join(where)), args).fetchall()
+
+
+def _upper(prefix):
+    # smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def parse_query(text):
+    # "after:YYYY-MM-DD" and "before:YYYY-MM-DD" bound the modification date,
+    # the remaining words are a glob when they contain * ? [ and a substring otherwise
+    words = []
+    after = None
+    before = None
+    for word in text.split():
+        name, sep, value = word.partition(":")
+        if sep and name in ("after", "before"):
+            try:
+                day = datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+            except ValueError:
+                words.append(word)
+                continue
+            if "after" == name:
+                after = day.timestamp()
+            else:
+                before = day.timestamp()
+        else:
+            words.append(word)
+    return " ".join(words), after, before
+
+
+def build_index(bucket, progress=None, cancelled=None):
+    # a full listing of the bucket into the index; progress(keys) is called after every
+    # batch, returns False if cancelled, which leaves the index incomplete
+    generation = Index.begin(bucket)
+    paginator = S3Client.for_bucket(bucket).get_paginator('list_objects_v2')
+    rows = []
+    listed = 0
+    for response in paginator.paginate(Bucket=bucket):
+        if cancelled is not None and cancelled.is_set():
+            return False
+        for obj in response.get("Contents", []):
+            rows.append((obj["Key"], obj["Size"], obj["LastModified"].timestamp(), obj.get("ETag", ""),
+                         obj.get("StorageClass", "")))
+        if len(rows) >= INSERT_BATCH:
+            Index.put_many(bucket, rows, generation)
+            listed += len(rows)
+            rows = []
+            if progress is not None:
+                progress(listed)
+    Index.put_many(bucket, rows, generation)
+    Index.finish(bucket, generation)
+    if progress is not None:
+        progress(listed + len(rows))
+    return True
+
+
+def needs_build(bucket, maxAge=INDEX_MAX_AGE):
+    # the index is missing, incomplete or older than maxAge
+    status = Index.status(bucket)
+    return status is None or not status[0] or time.time() - status[1] >= maxAge
+
+
+Index = KeyIndex()
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_ROWS = 500000
+
+
+class ListingCache:
+    # LRU of complete listings keyed by (bucket, prefix), bounded by entry count
+    # and by the total number of rows held
+    def __init__(self, ttl=DEFAULT_TTL, maxEntries=DEFAULT_MAX_ENTRIES, maxRows=DEFAULT_MAX_ROWS):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.maxRows = maxRows
+        self._entries = OrderedDict()
+        self._rows = 0
+
+    def get(self, bucket, prefix):
+        key = (bucket, prefix)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored, columns = entry
+        if time.monotonic() - stored > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return columns
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def put(self, bucket, prefix, columns):
+        key = (bucket, prefix)
+        if len(columns) > self.maxRows:
+            self._remove(key)
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic(), columns)
+        self._rows += len(columns)
+        while len(self._entries) > self.maxEntries or self._rows > self.maxRows:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, bucket, prefix=None):
+        if prefix is not None:
+            self._remove((bucket, prefix))
+            return
+        for key in [k for k in self._entries if k[0] == bucket]:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._rows = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= len(entry[1])
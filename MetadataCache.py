@@ -0,0 +1,41 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_PREFIX_TTL = 60
+
+
+class MetadataCache:
+    # LRU of fetched object properties keyed by (bucket, key, etag), a new ETag is a
+    # new entry so a replaced object is fetched again. folders have no ETag, their
+    # summaries expire after prefixTtl seconds instead
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES, prefixTtl=DEFAULT_PREFIX_TTL):
+        self.maxEntries = maxEntries
+        self.prefixTtl = prefixTtl
+        self._entries = OrderedDict()
+
+    def get(self, bucket, key, etag):
+        cacheKey = (bucket, key, etag)
+        entry = self._entries.get(cacheKey)
+        if entry is None:
+            return None
+        stored, properties = entry
+        if "" == etag and time.monotonic() - stored > self.prefixTtl:
+            del self._entries[cacheKey]
+            return None
+        self._entries.move_to_end(cacheKey)
+        return properties
+
+    def put(self, bucket, key, etag, properties):
+        cacheKey = (bucket, key, etag)
+        self._entries.pop(cacheKey, None)
+        self._entries[cacheKey] = (time.monotonic(), properties)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, bucket, key=None):
+        for cacheKey in [k for k in self._entries if k[0] == bucket and (key is None or k[1] == key)]:
+            del self._entries[cacheKey]
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,162 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+import S3Client
+
+# ranged reads of objects for previews, nothing is downloaded beyond what is shown
+
+PREVIEW_CHUNK = 64 * 1024
+# bytes of fetched ranges kept across previews
+RANGE_CACHE_BYTES = 64 * 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+# a NUL byte in the first chunk shows the object as a hex dump
+HEX_WIDTH = 16
+
+
+class RangeCache:
+    # LRU of fetched chunks keyed by (bucket, key, etag, chunk number), a new ETag
+    # is a different object so replaced objects are never mixed with old chunks
+    def __init__(self, maxBytes=RANGE_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bucket, key, etag, n):
+        with self._lock:
+            data = self._chunks.get((bucket, key, etag, n))
+            if data is not None:
+                self._chunks.move_to_end((bucket, key, etag, n))
+            return data
+
+    def put(self, bucket, key, etag, n, data):
+        with self._lock:
+            old = self._chunks.pop((bucket, key, etag, n), None)
+            if old is not None:
+                self.size -= len(old)
+            self._chunks[(bucket, key, etag, n)] = data
+            self.size += len(data)
+            while self.size > self.maxBytes and len(self._chunks) > 1:
+                _, evicted = self._chunks.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self.size = 0
+
+
+class RangeReader:
+    # reads of any byte range, fetched in aligned PREVIEW_CHUNK ranges; consecutive
+    # missing chunks are fetched with a single ranged GET
+    def __init__(self, bucket, key, size, etag, cache=None):
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.cache = Ranges if cache is None else cache
+        self.requests = 0
+
+    def read(self, start, length):
+        end = min(start + length, self.size)
+        if start >= end:
+            return b""
+        first, last = start // PREVIEW_CHUNK, (end - 1) // PREVIEW_CHUNK
+        chunks = {}
+        missing = []
+        for n in range(first, last + 1):
+            data = self.cache.get(self.bucket, self.key, self.etag, n)
+            if data is None:
+                missing.append(n)
+            else:
+                chunks[n] = data
+        # runs of consecutive missing chunks
+        runs = []
+        for n in missing:
+            if runs and runs[-1][1] == n - 1:
+                runs[-1][1] = n
+            else:
+                runs.append([n, n])
+        for a, b in runs:
+            data = self._get(a * PREVIEW_CHUNK, min((b + 1) * PREVIEW_CHUNK, self.size))
+            for n in range(a, b + 1):
+                chunk = data[(n - a) * PREVIEW_CHUNK:(n - a + 1) * PREVIEW_CHUNK]
+                self.cache.put(self.bucket, self.key, self.etag, n, chunk)
+                chunks[n] = chunk
+        data = b"".join(chunks[n] for n in range(first, last + 1))
+        offset = start - first * PREVIEW_CHUNK
+        return data[offset:offset + end - start]
+
+    def _get(self, start, end):
+        self.requests += 1
+        kwargs = {"Bucket": self.bucket, "Key": self.key, "Range": "bytes={0}-{1}".format(start, end - 1)}
+        if self.etag:
+            # fails instead of mixing chunks of a replaced object
+            kwargs["IfMatch"] = self.etag
+        response = S3Client.for_bucket(self.bucket).get_object(**kwargs)
+        return response["Body"].read()
+
+
+class GzipReader:
+    # decompresses forward from the start of the object; a gzip stream cannot be
+    # entered in the middle, so pages are produced in order and never from the tail
+    def __init__(self, reader):
+        self.reader = reader
+        self.offset = 0
+        self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = b""
+
+    def at_end(self):
+        return self.offset >= self.reader.size and not self._pending
+
+    def read(self, length):
+        # up to length decompressed bytes, b"" at the end of the object
+        out = [self._pending]
+        produced = len(self._pending)
+        while produced < length and self.offset < self.reader.size:
+            data = self.reader.read(self.offset, PREVIEW_CHUNK)
+            self.offset += len(data)
+            chunk = self._inflate.decompress(data)
+            while self._inflate.eof and self._inflate.unused_data:
+                # concatenated members, as written by cat a.gz b.gz
+                data = self._inflate.unused_data
+                self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                chunk += self._inflate.decompress(data)
+            out.append(chunk)
+            produced += len(chunk)
+        data = b"".join(out)
+        self._pending = data[length:]
+        return data[:length]
+
+
+def is_gzip(key, head):
+    return key.endswith(".gz") or head.startswith(GZIP_MAGIC)
+
+
+def is_binary(data):
+    return b"\x00" in data
+
+
+def hex_dump(data, offset):
+    # offset is a multiple of HEX_WIDTH for aligned lines
+    lines = []
+    for i in range(0, len(data), HEX_WIDTH):
+        row = data[i:i + HEX_WIDTH]
+        text = "".join(chr(b) if 32 <= b < 127 else "." for b in row)
+        lines.append("{0:08x}  {1:<{2}}  {3}".format(offset + i, row.hex(" "), HEX_WIDTH * 3 - 1, text))
+    return "\n".join(lines)
+
+
+def split_utf8(data, at_start):
+    # (leading continuation bytes, rest) so a page starting inside a character
+    # hands the partial character to the page before it
+    if at_start:
+        return b"", data
+    i = 0
+    while i < min(len(data), 3) and 0x80 == data[i] & 0xC0:
+        i += 1
+    return data[:i], data[i:]
+
+
+Ranges = RangeCache()
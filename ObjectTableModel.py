@@ -0,0 +1,407 @@
+import json
+import threading
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+from PySide6.QtCore import QAbstractTableModel, QAbstractProxyModel, QModelIndex, Qt, QTimer
+from PySide6.QtWidgets import QStyle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SIZE_UNIT = [" KB", " MB", " GB", " TB"]
+SIZE_POWER = 1024
+
+HEADERS = ["Name", "Size", "Type", "Last Modified", "Storage Type"]
+
+# storage classes are stored as one byte per row, unknown classes are added on the fly
+STORAGE_CLASSES = ["", "STANDARD", "REDUCED_REDUNDANCY", "STANDARD_IA", "ONEZONE_IA",
+                   "INTELLIGENT_TIERING", "GLACIER", "DEEP_ARCHIVE", "OUTPOSTS",
+                   "GLACIER_IR", "SNOW", "EXPRESS_ONEZONE"]
+_storage_codes = {name: code for code, name in enumerate(STORAGE_CLASSES)}
+_storage_lock = threading.Lock()
+
+# raw value of the Size column, -1 for Dir rows
+SizeRole = Qt.UserRole + 1
+
+# rows arriving while sorted are appended and the view is re-sorted at most this often
+RESORT_DELAY_MS = 300
+
+
+def format_size(objSize):
+    objsizestr = str(objSize) + " bytes"
+    for unit in SIZE_UNIT:
+        if objSize > SIZE_POWER:
+            objSize = objSize / SIZE_POWER
+            objsizestr = "{:.2f}".format(objSize) + unit
+    return objsizestr
+
+
+def storage_class_code(storageClass):
+    code = _storage_codes.get(storageClass)
+    if code is None:
+        # listing workers meet new classes concurrently, each must get one code
+        with _storage_lock:
+            code = _storage_codes.get(storageClass)
+            if code is None:
+                code = len(STORAGE_CLASSES)
+                STORAGE_CLASSES.append(storageClass)
+                _storage_codes[storageClass] = code
+    return code
+
+
+class ObjectColumns:
+    # one listing page in columnar form, built off the GUI thread
+    def __init__(self):
+        self.names = []
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.classes = array('b')
+        self.etags = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, name, size=-1, mtime=0.0, storageClass="", etag=""):
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.classes.append(storage_class_code(storageClass))
+        self.etags.append(etag)
+
+    def append_object(self, obj):
+        if "Dir" == obj["Type"]:
+            self.append(obj["Key"])
+        else:
+            self.append(obj["Key"], obj["Size"], obj["LastModified"].timestamp(),
+                        obj.get("StorageClass", ""), obj.get("ETag", ""))
+
+    def extend(self, columns):
+        self.names.extend(columns.names)
+        self.sizes.extend(columns.sizes)
+        self.mtimes.extend(columns.mtimes)
+        self.classes.extend(columns.classes)
+        self.etags.extend(columns.etags)
+
+    def __eq__(self, other):
+        return (isinstance(other, ObjectColumns) and self.names == other.names and self.sizes == other.sizes
+                and self.mtimes == other.mtimes and self.classes == other.classes and self.etags == other.etags)
+
+    def dump(self):
+        # storage classes are written by name, their codes differ between sessions
+        data = {
+            "names": self.names,
+            "sizes": self.sizes.tolist(),
+            "mtimes": self.mtimes.tolist(),
+            "classes": [STORAGE_CLASSES[code] for code in self.classes],
+            "etags": self.etags,
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def load(cls, blob):
+        data = json.loads(zlib.decompress(blob).decode("utf-8"))
+        columns = cls()
+        columns.names = data["names"]
+        columns.sizes = array('q', data["sizes"])
+        columns.mtimes = array('d', data["mtimes"])
+        columns.classes = array('b', [storage_class_code(name) for name in data["classes"]])
+        columns.etags = data["etags"]
+        return columns
+
+
+class ObjectTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._columns = ObjectColumns()
+        # computed totals of Dir rows, name -> (computed, SizeTotals)
+        self._dirSizes = {}
+        self._dirIcon = None
+        self._fileIcon = None
+
+    def set_style(self, w):
+        self._dirIcon = w.standardIcon(QStyle.SP_DirIcon)
+        self._fileIcon = w.standardIcon(QStyle.SP_FileIcon)
+
+    def clear(self):
+        self.beginResetModel()
+        self._columns = ObjectColumns()
+        self.endResetModel()
+
+    def set_dir_sizes(self, sizes):
+        self._dirSizes = sizes
+        if len(self._columns):
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self._columns) - 1, 3))
+
+    def append_columns(self, columns):
+        if 0 == len(columns):
+            return
+        first = len(self._columns)
+        self.beginInsertRows(QModelIndex(), first, first + len(columns) - 1)
+        self._columns.extend(columns)
+        self.endInsertRows()
+
+    def find(self, name):
+        try:
+            return self._columns.names.index(name)
+        except ValueError:
+            return -1
+
+    def name(self, row):
+        return self._columns.names[row]
+
+    def is_dir(self, row):
+        return self._columns.sizes[row] < 0
+
+    def sort_keys(self, column):
+        # typed keys of a column in source row order, names are keyed by the proxy
+        c = self._columns
+        if 1 == column:
+            if not self._dirSizes:
+                return c.sizes
+            # computed folder sizes sort among the files, the others stay first
+            return array('q', (self._dirSizes[name][1].bytes if size < 0 and name in self._dirSizes else size
+                               for name, size in zip(c.names, c.sizes)))
+        if 2 == column:
+            # Dir before File
+            return array('b', (size >= 0 for size in c.sizes))
+        if 3 == column:
+            if not self._dirSizes:
+                return c.mtimes
+            return array('d', (self._dirSizes[name][1].newest if size < 0 and name in self._dirSizes else mtime
+                               for name, size, mtime in zip(c.names, c.sizes, c.mtimes)))
+        if 4 == column:
+            rank = {code: i for i, code in enumerate(sorted(range(len(STORAGE_CLASSES)),
+                                                            key=STORAGE_CLASSES.__getitem__))}
+            return array('b', (rank[code] for code in c.classes))
+        return c.names
+
+    def object_info(self, row):
+        c = self._columns
+        if c.sizes[row] < 0:
+            return {"Key": c.names[row], "Type": "Dir"}
+        info = {
+            "Key": c.names[row],
+            "LastModified": datetime.fromtimestamp(c.mtimes[row], tz=timezone.utc),
+            "ETag": c.etags[row],
+            "Size": c.sizes[row],
+            "StorageClass": STORAGE_CLASSES[c.classes[row]],
+            "Type": "File",
+        }
+        return info
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        c = self._columns
+        isDir = c.sizes[row] < 0
+        if role == Qt.DisplayRole:
+            if 0 == column:
+                return c.names[row]
+            if 2 == column:
+                return "Dir" if isDir else "File"
+            if isDir:
+                if c.names[row] not in self._dirSizes:
+                    return ""
+                totals = self._dirSizes[c.names[row]][1]
+                if 1 == column:
+                    return format_size(totals.bytes)
+                if 3 == column and totals.newest:
+                    return datetime.fromtimestamp(totals.newest, tz=timezone.utc).strftime("%m/%d/%Y %H:%M:%S")
+                return ""
+            if 1 == column:
+                return format_size(c.sizes[row])
+            if 3 == column:
+                return datetime.fromtimestamp(c.mtimes[row], tz=timezone.utc).strftime("%m/%d/%Y %H:%M:%S")
+            if 4 == column:
+                return STORAGE_CLASSES[c.classes[row]]
+        elif role == Qt.ToolTipRole and isDir and 1 == column and c.names[row] in self._dirSizes:
+            computed, totals = self._dirSizes[c.names[row]]
+            return "{0} objects, computed {1}".format(
+                totals.objects, datetime.fromtimestamp(computed).strftime("%Y-%m-%d %H:%M:%S"))
+        elif role == Qt.DecorationRole and 0 == column:
+            return self._dirIcon if isDir else self._fileIcon
+        elif role == SizeRole:
+            return c.sizes[row]
+        return None
+
+
+class ObjectSortFilterProxy(QAbstractProxyModel):
+    # the rows shown are a permutation of source rows; sorting argsorts the
+    # column's typed keys instead of comparing rows through data()
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = array('q')
+        self._inverse = None
+        self._lowerNames = []
+        self._filter = ""
+        self._sortColumn = -1
+        self._sortOrder = Qt.AscendingOrder
+        self._resortTimer = QTimer(self)
+        self._resortTimer.setSingleShot(True)
+        self._resortTimer.setInterval(RESORT_DELAY_MS)
+        self._resortTimer.timeout.connect(self._resort)
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.dataChanged.connect(self._source_data_changed)
+        self._lowerNames = [model.name(row).lower() for row in range(model.rowCount())]
+        self._rows = self._sorted(self._matching(range(model.rowCount())))
+        self._inverse = None
+        self.endResetModel()
+
+    def set_filter(self, text):
+        text = text.lower()
+        if text == self._filter:
+            return
+        self.beginResetModel()
+        if self._filter in text:
+            # narrowing keeps the current order, only the visible rows are tested
+            self._filter = text
+            self._rows = self._matching(self._rows)
+        else:
+            self._filter = text
+            self._rows = self._sorted(self._matching(range(len(self._lowerNames))))
+        self._inverse = None
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sortColumn = column
+        self._sortOrder = order
+        self._resortTimer.stop()
+        self._relayout(self._sorted(self._rows if column >= 0 else array('q', sorted(self._rows))))
+
+    def _resort(self):
+        if self._sortColumn >= 0:
+            self._relayout(self._sorted(self._rows))
+
+    def _relayout(self, rows):
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sources = [self.mapToSource(index) for index in persistent]
+        self._rows = rows
+        self._inverse = None
+        self.changePersistentIndexList(persistent, [self.mapFromSource(index) for index in sources])
+        self.layoutChanged.emit()
+
+    def _matching(self, rows):
+        if "" == self._filter:
+            return array('q', rows)
+        text = self._filter
+        names = self._lowerNames
+        return array('q', (row for row in rows if text in names[row]))
+
+    def _sorted(self, rows):
+        if self._sortColumn < 0 or len(rows) < 2:
+            return rows
+        descending = self._sortOrder == Qt.DescendingOrder
+        keys = self._lowerNames if 0 == self._sortColumn else self.sourceModel().sort_keys(self._sortColumn)
+        if numpy is not None and not isinstance(keys, list):
+            # one stable argsort over the gathered keys
+            source = numpy.asarray(rows)
+            order = source[numpy.argsort(numpy.asarray(keys)[source], kind="stable")]
+            if descending:
+                order = order[::-1]
+            result = array('q')
+            result.frombytes(order.astype(numpy.int64).tobytes())
+            return result
+        return array('q', sorted(rows, key=keys.__getitem__, reverse=descending))
+
+    def _source_reset(self):
+        model = self.sourceModel()
+        self._lowerNames = [model.name(row).lower() for row in range(model.rowCount())]
+        self._rows = self._sorted(self._matching(range(model.rowCount())))
+        self._inverse = None
+        self.endResetModel()
+
+    def _source_rows_inserted(self, parent, first, last):
+        model = self.sourceModel()
+        self._lowerNames.extend(model.name(row).lower() for row in range(first, last + 1))
+        rows = self._matching(range(first, last + 1))
+        if 0 == len(rows):
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self._inverse = None
+        self.endInsertRows()
+        if self._sortColumn >= 0 and not self._resortTimer.isActive():
+            self._resortTimer.start()
+
+    def _source_data_changed(self, topLeft, bottomRight, roles=None):
+        if 0 == len(self._rows):
+            return
+        self.dataChanged.emit(self.index(0, topLeft.column()),
+                              self.index(len(self._rows) - 1, bottomRight.column()), roles or [])
+        if topLeft.column() <= self._sortColumn <= bottomRight.column() and not self._resortTimer.isActive():
+            self._resortTimer.start()
+
+    def mapToSource(self, proxyIndex):
+        if not proxyIndex.isValid() or proxyIndex.row() >= len(self._rows):
+            return QModelIndex()
+        return self.sourceModel().index(self._rows[proxyIndex.row()], proxyIndex.column())
+
+    def mapFromSource(self, sourceIndex):
+        if not sourceIndex.isValid():
+            return QModelIndex()
+        if self._inverse is None:
+            self._inverse = array('q', [-1]) * len(self._lowerNames)
+            for i, row in enumerate(self._rows):
+                self._inverse[row] = i
+        row = sourceIndex.row()
+        if row >= len(self._inverse) or self._inverse[row] < 0:
+            return QModelIndex()
+        return self.index(self._inverse[row], sourceIndex.column())
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or row < 0 or row >= len(self._rows) or column < 0 or column >= len(HEADERS):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            return self.sourceModel().headerData(section, orientation, role)
+        return super().headerData(section, orientation, role)
+
@@ -0,0 +1,202 @@
+import codecs
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QFont, QTextCursor
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPlainTextEdit, QPushButton, QWidget
+
+import ObjectPreview
+from ObjectPreview import PREVIEW_CHUNK, HEX_WIDTH
+from ObjectTableModel import format_size
+
+
+# keeps workers alive when the dialog is closed before they finish
+_running = set()
+
+HEAD = "Head"
+TAIL = "Tail"
+
+
+class PageSignals(QObject):
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class PageWorker(QRunnable):
+    # one page at a time, the dialog starts the next only after this one is shown
+    def __init__(self, fetch):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = PageSignals()
+        self.fetch = fetch
+
+    def run(self):
+        try:
+            page = self.fetch()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            _running.discard(self)
+        self.signals.finished.emit(page)
+
+
+class PreviewDialog(QDialog):
+    # the first or the last PREVIEW_CHUNK bytes of an object, more pages are fetched
+    # with ranged GETs when the view is scrolled to its end (or its start for the tail)
+    def __init__(self, bucket, key, size, etag, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.reader = ObjectPreview.RangeReader(bucket, key, size, etag)
+        self.gzip = None
+        self.binary = False
+        self.mode = HEAD
+        self.loading = False
+        self.done = False
+        # head: next raw (or decompressed) offset, tail: first offset shown
+        self.offset = 0
+        self.carry = b""
+        self.decoder = None
+
+        self.setWindowTitle("Preview s3://{0}/{1}".format(bucket, key))
+        self.resize(800, 600)
+        self.layout = QVBoxLayout()
+
+        buttonWidget = QWidget()
+        self.headButton = QPushButton("Head")
+        self.headButton.clicked.connect(lambda: self.show_mode(HEAD))
+        self.tailButton = QPushButton("Tail")
+        self.tailButton.clicked.connect(lambda: self.show_mode(TAIL))
+        self.statusLabel = QLabel("")
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.headButton)
+        buttonLayout.addWidget(self.tailButton)
+        buttonLayout.addWidget(self.statusLabel, 1)
+        buttonWidget.setLayout(buttonLayout)
+
+        self.textView = QPlainTextEdit()
+        self.textView.setReadOnly(True)
+        self.textView.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.textView.setFont(QFont("Monospace"))
+        self.textView.verticalScrollBar().valueChanged.connect(self.scrolled)
+
+        self.layout.addWidget(buttonWidget)
+        self.layout.addWidget(self.textView)
+        self.setLayout(self.layout)
+        self.show_mode(HEAD)
+
+    def show_mode(self, mode):
+        if self.loading:
+            return
+        # clearing scrolls to the top, which must not page the old mode
+        self.loading = True
+        self.textView.clear()
+        self.mode = mode
+        self.done = False
+        self.carry = b""
+        if HEAD == mode:
+            self.offset = 0
+            self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+            self.load(self.fetch_first)
+        else:
+            # aligned so hex dump lines keep their offsets
+            self.offset = max(0, self.reader.size - PREVIEW_CHUNK) // HEX_WIDTH * HEX_WIDTH
+            self.load(self.fetch_tail)
+
+    def load(self, fetch):
+        self.loading = True
+        worker = PageWorker(fetch)
+        worker.signals.finished.connect(self.on_page, type=Qt.QueuedConnection)
+        worker.signals.failed.connect(self.on_failed, type=Qt.QueuedConnection)
+        _running.add(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    # fetches run on the thread pool, one at a time
+
+    def fetch_first(self):
+        head = self.reader.read(0, PREVIEW_CHUNK)
+        if ObjectPreview.is_gzip(self.reader.key, head):
+            self.gzip = ObjectPreview.GzipReader(self.reader)
+        first = self.gzip.read(PREVIEW_CHUNK) if self.gzip is not None else head
+        self.binary = ObjectPreview.is_binary(first)
+        return self.head_page(first)
+
+    def fetch_next(self):
+        if self.gzip is not None:
+            return self.head_page(self.gzip.read(PREVIEW_CHUNK))
+        return self.head_page(self.reader.read(self.offset, PREVIEW_CHUNK))
+
+    def head_page(self, data):
+        offset = self.offset
+        self.offset += len(data)
+        if self.gzip is not None:
+            last = self.gzip.at_end()
+        else:
+            last = self.offset >= self.reader.size
+        if self.binary:
+            return ObjectPreview.hex_dump(data, offset) + "\n", last
+        return self.decoder.decode(data, last), last
+
+    def fetch_tail(self):
+        data = self.reader.read(self.offset, self.reader.size - self.offset)
+        if 0 == self.offset:
+            self.binary = ObjectPreview.is_binary(data[:PREVIEW_CHUNK])
+        else:
+            self.binary = ObjectPreview.is_binary(self.reader.read(0, PREVIEW_CHUNK))
+        return self.tail_page(data, self.offset)
+
+    def fetch_previous(self):
+        start = max(0, self.offset - PREVIEW_CHUNK)
+        return self.tail_page(self.reader.read(start, self.offset - start), start)
+
+    def tail_page(self, data, start):
+        self.offset = start
+        if self.binary:
+            return ObjectPreview.hex_dump(data, start) + "\n", 0 == start
+        data += self.carry
+        self.carry, data = ObjectPreview.split_utf8(data, 0 == start)
+        return data.decode("utf-8", "replace"), 0 == start
+
+    def on_page(self, page):
+        text, self.done = page
+        self.loading = False
+        scrollBar = self.textView.verticalScrollBar()
+        cursor = self.textView.textCursor()
+        if HEAD == self.mode:
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        else:
+            # keep the lines on screen in place above the prepended page
+            fromBottom = scrollBar.maximum() - scrollBar.value()
+            cursor.movePosition(QTextCursor.Start)
+            cursor.insertText(text)
+            scrollBar.setValue(scrollBar.maximum() - fromBottom)
+        self.show_status()
+        # a page that fits without scrolling cannot be scrolled past
+        if not self.done and 0 == scrollBar.maximum():
+            self.load(self.fetch_next if HEAD == self.mode else self.fetch_previous)
+
+    def on_failed(self, message):
+        self.loading = False
+        self.done = True
+        self.statusLabel.setText("Preview failed: {0}".format(message))
+
+    def show_status(self):
+        size = self.reader.size
+        self.tailButton.setEnabled(self.gzip is None)
+        if self.gzip is not None:
+            text = "gzip, {0} of {1} compressed, {2} shown".format(
+                format_size(self.gzip.offset), format_size(size), format_size(self.offset))
+        elif HEAD == self.mode:
+            text = "{0} - {1} of {2}".format(format_size(0), format_size(self.offset), format_size(size))
+        else:
+            text = "{0} - {1} of {2}".format(format_size(self.offset), format_size(size), format_size(size))
+        self.statusLabel.setText("{0}, {1} requests".format(text, self.reader.requests))
+
+    def scrolled(self, value):
+        if self.loading or self.done:
+            return
+        scrollBar = self.textView.verticalScrollBar()
+        if HEAD == self.mode and value == scrollBar.maximum():
+            self.load(self.fetch_next)
+        elif TAIL == self.mode and value == scrollBar.minimum():
+            self.load(self.fetch_previous)
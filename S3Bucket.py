@@ -1,20 +1,23 @@
 import logging
-import boto3
-from PySide6.QtCore import QStringListModel
+from PySide6.QtCore import QStringListModel, QObject, QRunnable, QThreadPool, Qt, Signal, Slot
 from PySide6.QtGui import QStandardItemModel, QStandardItem, QIcon
 from  PySide6 import QtGui
 from PySide6.QtWidgets import QStyle
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 import rc_icons
+import S3Bucket
+import S3Catalog
+import S3Client
 
-s3 = boto3.client('s3')
-ec2 = boto3.client('ec2')
+BucketsModel = QStandardItemModel()
+bucketIcon = None
+bucketWorker = None
 
 def list_bucket():
     bucketsModel = QStringListModel()
     buckets = []
 
-    response = s3.list_buckets()
+    response = S3Client.client().list_buckets()
 
     print('Existing buckets:')
     for bucket in response['Buckets']:
@@ -26,7 +29,7 @@ def list_bucket():
 def list_bucket_with_icon(w):
     bucketsModel = QStandardItemModel()
     buckets = []
-    response = s3.list_buckets()
+    response = S3Client.client().list_buckets()
     for bucket in response['Buckets']:
         item = QStandardItem(bucket["Name"])
         item.setEditable(False)
@@ -34,59 +37,74 @@ def list_bucket_with_icon(w):
         bucketsModel.appendRow(item)
     return bucketsModel
 
+def set_bucket_names(names):
+    current = [BucketsModel.item(i).text() for i in range(BucketsModel.rowCount())]
+    if current == names:
+        return
+    BucketsModel.clear()
+    for name in names:
+        item = QStandardItem(name)
+        item.setEditable(False)
+        item.setIcon(S3Bucket.bucketIcon)
+        BucketsModel.appendRow(item)
+
+def update_buckets_model(w, cached=True):
+    # the catalog's bucket list is shown at once, list_buckets replaces it when it returns
+    S3Bucket.bucketIcon = w.standardIcon(QStyle.SP_DirClosedIcon)
+    if cached:
+        names = S3Catalog.Catalog.buckets()
+        if names is not None:
+            set_bucket_names(names)
+    if S3Bucket.bucketWorker is not None:
+        return
+    S3Bucket.bucketWorker = BucketListWorker()
+    S3Bucket.bucketWorker.signals.finished.connect(on_buckets_listed, type=Qt.QueuedConnection)
+    S3Bucket.bucketWorker.signals.failed.connect(on_buckets_failed, type=Qt.QueuedConnection)
+    QThreadPool.globalInstance().start(S3Bucket.bucketWorker)
+
+@Slot()
+def on_buckets_listed(names):
+    S3Bucket.bucketWorker = None
+    set_bucket_names(names)
+
+@Slot()
+def on_buckets_failed(message):
+    S3Bucket.bucketWorker = None
+    print("list buckets failed: {0}".format(message))
+
 def get_regions():
-    regions = []
-    response = ec2.describe_regions()
-    if "Regions" in response:
-        for r in response["Regions"]:
-            regions.append(r["RegionName"])
-    return regions
+    return S3Client.available_regions('s3')
 
 def new_bucket(name, region):
-    response = s3.create_bucket(
-        Bucket = name,
-        CreateBucketConfiguration={
-            'LocationConstraint': region
-        }
-    )
+    # us-east-1 is the default location and rejects an explicit constraint
+    if S3Client.DEFAULT_REGION == region:
+        response = S3Client.client(region).create_bucket(Bucket = name)
+    else:
+        response = S3Client.client(region).create_bucket(
+            Bucket = name,
+            CreateBucketConfiguration={
+                'LocationConstraint': region
+            }
+        )
+    S3Client.set_bucket_region(name, region)
     print(response)
 
 
-def delete_bucket(bucket):
-    print(f"Delete Bucket: {(bucket)}")
-    ContinuationToken = ""
-    isTruncated = True
-    while(isTruncated):
-        if ContinuationToken != "":
-            response = s3.list_objects_v2(
-                Bucket = bucket,
-                ContinuationToken = ContinuationToken
-            )
-        else:
-            response = s3.list_objects_v2(
-                Bucket=bucket
-            )
-        isTruncated = response["IsTruncated"]
-        if (isTruncated):
-            ContinuationToken = response["ContinuationToken"]
-        if "Contents" in response:
-            obj_keys = []
-            contents = response["Contents"]
-            for i in contents:
-                obj_keys.append({
-                    "Key": i["Key"]
-                })
-            # delete obj
-            del_response = s3.delete_objects(
-                Bucket = bucket,
-                Delete = {
-                    'Objects': obj_keys
-                }
-            )
-            if "Errors" in del_response:
-                print(del_response["Errors"])
-        else:
-            # delete bucket
-            print("empty bucket, delete it.")
-            s3.delete_bucket(Bucket = bucket)
+class BucketSignals(QObject):
+    finished = Signal(object)
+    failed = Signal(str)
+
+class BucketListWorker(QRunnable):
+    def __init__(self):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = BucketSignals()
 
+    def run(self):
+        try:
+            names = [bucket["Name"] for bucket in S3Client.client().list_buckets()["Buckets"]]
+        except (ClientError, BotoCoreError) as e:
+            self.signals.failed.emit(str(e))
+            return
+        S3Catalog.Catalog.set_buckets(names)
+        self.signals.finished.emit(names)
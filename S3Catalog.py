@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+
+import S3Config
+
+MAX_LISTINGS = 256
+MAX_LISTING_ROWS = 100000
+
+
+class S3Catalog:
+    # last known buckets, bucket regions and recently viewed listings, shown at
+    # once on the next start and revalidated against S3 in the background
+    def __init__(self, path=None):
+        if path is None:
+            path = S3Config.db_path("catalog.db")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                position INTEGER NOT NULL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS regions (
+                bucket TEXT PRIMARY KEY,
+                region TEXT NOT NULL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS listings (
+                bucket TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                stored REAL NOT NULL,
+                viewed REAL NOT NULL,
+                columns BLOB NOT NULL,
+                PRIMARY KEY (bucket, prefix))""")
+
+    def buckets(self):
+        # None until the bucket list has been fetched once
+        with self._lock:
+            known = self._db.execute("SELECT value FROM meta WHERE key = 'buckets'").fetchone()
+            rows = self._db.execute("SELECT name FROM buckets ORDER BY position").fetchall()
+        if known is None:
+            return None
+        return [row[0] for row in rows]
+
+    def set_buckets(self, names):
+        # everything known about a bucket that no longer exists is dropped
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM buckets")
+            self._db.executemany("INSERT INTO buckets VALUES (?, ?)", [(name, i) for i, name in enumerate(names)])
+            self._db.execute("DELETE FROM regions WHERE bucket NOT IN (SELECT name FROM buckets)")
+            self._db.execute("DELETE FROM listings WHERE bucket NOT IN (SELECT name FROM buckets)")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('buckets', ?)", (str(time.time()),))
+
+    def region(self, bucket):
+        with self._lock:
+            row = self._db.execute("SELECT region FROM regions WHERE bucket = ?", (bucket,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_region(self, bucket, region):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO regions VALUES (?, ?)", (bucket, region))
+
+    def forget_bucket(self, bucket):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM buckets WHERE name = ?", (bucket,))
+            self._db.execute("DELETE FROM regions WHERE bucket = ?", (bucket,))
+            self._db.execute("DELETE FROM listings WHERE bucket = ?", (bucket,))
+
+    def listing(self, bucket, prefix):
+        with self._lock, self._db:
+            row = self._db.execute("SELECT columns FROM listings WHERE bucket = ? AND prefix = ?",
+                                   (bucket, prefix)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE listings SET viewed = ? WHERE bucket = ? AND prefix = ?",
+                                 (time.time(), bucket, prefix))
+        return None if row is None else row[0]
+
+    def put_listing(self, bucket, prefix, rows, blob):
+        if rows > MAX_LISTING_ROWS:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                             (bucket, prefix, now, now, blob))
+            self._db.execute("""DELETE FROM listings WHERE rowid NOT IN (
+                SELECT rowid FROM listings ORDER BY viewed DESC LIMIT ?)""", (MAX_LISTINGS,))
+
+    def invalidate(self, bucket, prefix=None):
+        with self._lock, self._db:
+            if prefix is None:
+                self._db.execute("DELETE FROM listings WHERE bucket = ?", (bucket,))
+            else:
+                self._db.execute("DELETE FROM listings WHERE bucket = ? AND prefix = ?", (bucket, prefix))
+
+
+Catalog = S3Catalog()
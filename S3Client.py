@@ -0,0 +1,83 @@
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import S3Catalog
+import S3Metrics
+import TransferScheduler
+
+DEFAULT_REGION = "us-east-1"
+# every transfer part may hold a connection, plus listings, deletes and metadata calls
+MAX_POOL_CONNECTIONS = TransferScheduler.MAX_CONCURRENT_PARTS + 16
+
+_session = None
+_clients = {}
+_regions = {}
+_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def client(region=None, service='s3'):
+    # one client per (service, region), created on first use and shared by all modules
+    with _lock:
+        session = _get_session()
+        if region is None:
+            region = session.region_name or DEFAULT_REGION
+        key = (service, region)
+        c = _clients.get(key)
+        if c is None:
+            c = session.client(service, region_name=region,
+                               config=Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+            S3Metrics.ClientMetrics.register(c)
+            _clients[key] = c
+        return c
+
+
+def bucket_region(bucket):
+    region = _regions.get(bucket)
+    if region is not None:
+        return region
+    # bucket regions never change, the catalog spares the lookup on later starts
+    region = S3Catalog.Catalog.region(bucket)
+    if region is not None:
+        _regions[bucket] = region
+        return region
+    try:
+        location = client().get_bucket_location(Bucket=bucket).get("LocationConstraint")
+        # legacy names returned for the oldest regions
+        region = {None: DEFAULT_REGION, "": DEFAULT_REGION, "EU": "eu-west-1"}.get(location, location)
+    except ClientError as e:
+        headers = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        region = headers.get("x-amz-bucket-region")
+        if region is None:
+            raise
+    set_bucket_region(bucket, region)
+    return region
+
+
+def set_bucket_region(bucket, region):
+    _regions[bucket] = region
+    S3Catalog.Catalog.set_region(bucket, region)
+
+
+def forget_bucket(bucket):
+    _regions.pop(bucket, None)
+    S3Catalog.Catalog.forget_bucket(bucket)
+
+
+def available_regions(service='s3'):
+    # from the endpoint data bundled with botocore, no request is made
+    with _lock:
+        return _get_session().get_available_regions(service)
+
+
+def for_bucket(bucket):
+    return client(bucket_region(bucket))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+APP_NAME = "S3Tools"
+# overrides the per-user directory, e.g. to keep benchmark or batch runs apart
+CONFIG_DIR_ENV = "S3TOOLS_CONFIG_DIR"
+
+
+def config_dir():
+    if os.environ.get(CONFIG_DIR_ENV):
+        path = os.environ[CONFIG_DIR_ENV]
+    else:
+        if sys.platform.startswith("win"):
+            base = os.environ.get("APPDATA", os.path.expanduser("~"))
+        elif sys.platform == "darwin":
+            base = os.path.expanduser("~/Library/Application Support")
+        else:
+            base = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+        path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def db_path(name):
+    return os.path.join(config_dir(), name)
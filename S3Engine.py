@@ -0,0 +1,859 @@
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import partial
+from botocore.exceptions import BotoCoreError, ClientError
+
+import Checksums
+import FolderSize
+import Inventory
+import KeyIndex
+import S3Client
+import TransferJournal
+from TransferScheduler import (TransferScheduler, TransferJob, TransferCancelled, MAX_CONCURRENT_FILES,
+                               MAX_CONCURRENT_PARTS, COMPLETED, FAILED, CANCELLED)
+
+# listing, transfers and deletes without Qt, the GUI drives them through S3Tasks
+# and s3cli.py runs them headless
+
+UPLOAD = TransferJournal.UPLOAD
+DOWNLOAD = TransferJournal.DOWNLOAD
+COPY = "Copy"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# progress samples are taken at most this often (seconds)
+SAMPLE_INTERVAL = 0.1
+SPEED_WINDOW = 3.0
+# folder transfers enumerate only this far ahead of the scheduler
+MAX_QUEUED_TRANSFERS = 1000
+# larger transfers are journaled part by part and survive a restart
+RESUMABLE_THRESHOLD = 64 * 1024 * 1024
+MAX_PARTS = 10000
+DOWNLOAD_CHUNK = 1024 * 1024
+# ranged downloads of large objects
+RANGE_SIZE = 16 * 1024 * 1024
+RANGE_CONCURRENCY = 8
+# parts or ranges failing verification are transferred again this often
+VERIFY_RETRIES = 2
+
+# copy_object takes objects up to 5 GB, larger ones are copied part by part
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * 1024 * 1024
+COPY_PART_SIZE = 512 * 1024 * 1024
+HEAD_COPY_FIELDS = ("ContentType", "ContentEncoding", "ContentDisposition", "ContentLanguage",
+                    "CacheControl", "Expires", "Metadata", "StorageClass")
+
+DELETE_BATCH_SIZE = 1000
+DELETE_WORKERS = 8
+DELETE_RETRIES = 5
+DELETE_BACKOFF = 0.2
+
+_write_lock = threading.Lock()
+
+
+def parent_prefix(key):
+    head, sep, _ = key.rstrip('/').rpartition('/')
+    return head + sep
+
+def local_target(dir, rel):
+    # the path of key remainder rel under dir, None if "..", a leading "/" or a
+    # drive letter would place it outside dir
+    root = os.path.abspath(dir)
+    target = os.path.normpath(os.path.join(root, *rel.split('/')))
+    if os.path.commonpath([root, target]) != root or target == root:
+        return None
+    return target
+
+def iter_object_pages(bucketName, Delimiter="/", Prefix=""):
+    if "" == bucketName:
+        return
+    paginator = S3Client.for_bucket(bucketName).get_paginator('list_objects_v2')
+    for response in paginator.paginate(Bucket=bucketName, Delimiter=Delimiter, Prefix=Prefix):
+        page = {}
+        for common_prefix in response.get("CommonPrefixes", []):
+            key = common_prefix["Prefix"][len(Prefix):]
+            page[key] = {
+                "Key": key,
+                "Type": "Dir",
+            }
+        for obj in response.get("Contents", []):
+            key = obj["Key"][len(Prefix):]
+            # skip the folder placeholder object of the prefix itself
+            if "" == key:
+                continue
+            obj["Type"] = "File"
+            obj["Key"] = key
+            page[key] = obj
+        yield page
+
+def list_objects(bucketName, Delimiter="/", Prefix=""):
+    objlist = {}
+    for page in iter_object_pages(bucketName, Delimiter=Delimiter, Prefix=Prefix):
+        objlist.update(page)
+    return objlist
+
+def iter_prefix_objects(bucket, prefix):
+    paginator = S3Client.for_bucket(bucket).get_paginator('list_objects_v2')
+    for response in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in response.get("Contents", []):
+            yield obj
+
+def iter_local_files(root):
+    # depth-first os.scandir walk, files are yielded as soon as they are seen
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path, entry.stat().st_size
+        except OSError as e:
+            print("skip {0}: {1}".format(path, e))
+
+
+def is_versioned(bucket):
+    response = S3Client.for_bucket(bucket).get_bucket_versioning(Bucket=bucket)
+    return response.get("Status") in ("Enabled", "Suspended")
+
+def iter_delete_batches(bucket, Prefix=""):
+    # yields lists of at most DELETE_BATCH_SIZE {"Key", ["VersionId"]} entries
+    s3 = S3Client.for_bucket(bucket)
+    batch = []
+    if is_versioned(bucket):
+        paginator = s3.get_paginator('list_object_versions')
+        for response in paginator.paginate(Bucket=bucket, Prefix=Prefix):
+            for obj in response.get("Versions", []) + response.get("DeleteMarkers", []):
+                batch.append({"Key": obj["Key"], "VersionId": obj["VersionId"]})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+    else:
+        paginator = s3.get_paginator('list_objects_v2')
+        for response in paginator.paginate(Bucket=bucket, Prefix=Prefix):
+            for obj in response.get("Contents", []):
+                batch.append({"Key": obj["Key"]})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+def iter_object_batches(bucket, keys=(), prefixes=()):
+    # the given keys and every key under the given prefixes, as delete_objects batches;
+    # in a versioned bucket these deletes add delete markers like single deletes do
+    batch = []
+    for key in keys:
+        batch.append({"Key": key})
+        if len(batch) == DELETE_BATCH_SIZE:
+            yield batch
+            batch = []
+    paginator = S3Client.for_bucket(bucket).get_paginator('list_objects_v2')
+    for prefix in prefixes:
+        for response in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in response.get("Contents", []):
+                batch.append({"Key": obj["Key"]})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+def delete_batch(bucket, batch):
+    # returns (deleted, failed), keys rejected by S3 are retried with backoff
+    s3 = S3Client.for_bucket(bucket)
+    deleted = 0
+    removed = []
+    for attempt in range(DELETE_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(DELETE_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random()))
+        try:
+            response = s3.delete_objects(
+                Bucket = bucket,
+                Delete = {
+                    'Objects': batch,
+                    'Quiet': True
+                }
+            )
+        except ClientError as e:
+            print("delete_objects failed: {0}".format(e))
+            continue
+        errors = response.get("Errors", [])
+        deleted += len(batch) - len(errors)
+        failed = {(e["Key"], e.get("VersionId")) for e in errors}
+        # deleting a single version may leave the key in place
+        removed.extend(o["Key"] for o in batch
+                       if "VersionId" not in o and (o["Key"], None) not in failed)
+        if not errors:
+            break
+        batch = [o for o in batch if (o["Key"], o.get("VersionId")) in failed]
+    else:
+        print("failed to delete {0} objects from {1}".format(len(batch), bucket))
+        KeyIndex.Index.remove(bucket, removed)
+        return deleted, len(batch)
+    KeyIndex.Index.remove(bucket, removed)
+    return deleted, 0
+
+def delete_objects_pipelined(bucket, batches, progress=None):
+    # the caller's thread lists and feeds a pool of delete_objects workers,
+    # keeping a bounded number of batches in flight
+    deleted = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        pending = set()
+        for batch in batches:
+            pending.add(executor.submit(delete_batch, bucket, batch))
+            if len(pending) >= DELETE_WORKERS * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    d, f = future.result()
+                    deleted += d
+                    failed += f
+                if progress is not None:
+                    progress(deleted, failed)
+        for future in pending:
+            d, f = future.result()
+            deleted += d
+            failed += f
+    if progress is not None:
+        progress(deleted, failed)
+    return deleted, failed
+
+def delete_objects(bucket, keys=(), prefixes=(), progress=None):
+    deleted, failed = delete_objects_pipelined(bucket, iter_object_batches(bucket, keys, prefixes), progress)
+    if failed:
+        raise RuntimeError("{0} objects could not be deleted from {1}".format(failed, bucket))
+    return deleted
+
+def delete_bucket(bucket, progress=None):
+    print(f"Delete Bucket: {(bucket)}")
+    # listing while deleting can skip entries whose markers were just removed,
+    # so keep making passes until one finds nothing left to delete
+    total = 0
+    while True:
+        pass_progress = None
+        if progress is not None:
+            pass_progress = lambda d, f, base=total: progress(base + d, f)
+        deleted, failed = delete_objects_pipelined(bucket, iter_delete_batches(bucket), pass_progress)
+        total += deleted
+        if failed or 0 == deleted:
+            break
+    if failed:
+        raise RuntimeError("{0} objects could not be deleted from {1}".format(failed, bucket))
+    print("empty bucket, delete it.")
+    S3Client.for_bucket(bucket).delete_bucket(Bucket = bucket)
+    S3Client.forget_bucket(bucket)
+    KeyIndex.Index.drop(bucket)
+    FolderSize.Sizes.drop(bucket)
+    Inventory.Loaded.drop(bucket)
+
+
+class EngineListener:
+    # the engine's events, called from whichever thread caused them; the GUI
+    # adapter hands them to the Qt thread, the CLI prints them
+    def task_added(self, task_id, task, progress):
+        # task is {"Type", "Bucket", "Key", "LocalPath", "Size", "JournalId"}, copies
+        # also have "SourceBucket" and "SourceKey"
+        pass
+
+    def task_progress(self, task_id):
+        pass
+
+    def task_state(self, task_id, state, error):
+        pass
+
+
+class TransferProgress:
+    def __init__(self, task_id, target_size, changed=None):
+        self.job = None
+        self.task_id = task_id
+        self.target_size = max(target_size, 1)
+        # changed(task_id) after every update, it must be cheap
+        self.changed = changed
+        self._total_transferred = 0
+        # (time, total) samples over the last SPEED_WINDOW seconds
+        self._samples = deque()
+        self._lock = threading.Lock()
+        self.ranges_total = 0
+        self.ranges_done = 0
+
+    def __call__(self, bytes_transferred):
+        # raises TransferCancelled to abort, blocks while the task is paused
+        if self.job is not None:
+            self.job.checkpoint()
+        now = time.monotonic()
+        with self._lock:
+            self._total_transferred += bytes_transferred
+            if not self._samples or now - self._samples[-1][0] >= SAMPLE_INTERVAL:
+                self._samples.append((now, self._total_transferred))
+                while now - self._samples[0][0] > SPEED_WINDOW:
+                    self._samples.popleft()
+        if self.changed is not None:
+            self.changed(self.task_id)
+
+    def set_ranges(self, total, done):
+        self.ranges_total = total
+        self.ranges_done = done
+
+    def range_done(self):
+        with self._lock:
+            self.ranges_done += 1
+        if self.changed is not None:
+            self.changed(self.task_id)
+
+    def snapshot(self):
+        with self._lock:
+            total = self._total_transferred
+            if len(self._samples) < 2:
+                return total, None
+            t0, b0 = self._samples[0]
+            t1, b1 = self._samples[-1]
+        if t1 == t0:
+            return total, None
+        return total, (b1 - b0) / (t1 - t0)
+
+
+class CopyBatch:
+    # the copy tasks of one copy_objects call, the sources of the finished ones are
+    # collected for the deletes of a move
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.copied = []
+        self.failed = 0
+        self.deleted = 0
+        self._pending = {}
+        self._idle = threading.Condition()
+
+    def add(self, task_id, key):
+        with self._idle:
+            self._pending[task_id] = key
+
+    def done(self, task_id, state):
+        with self._idle:
+            key = self._pending.pop(task_id)
+            if COMPLETED == state:
+                self.copied.append(key)
+            else:
+                self.failed += 1
+            self._idle.notify_all()
+        self.report(self.deleted)
+
+    def report(self, deleted):
+        self.deleted = deleted
+        if self.progress is not None:
+            self.progress(len(self.copied), self.failed, deleted)
+
+    def wait(self):
+        # the copied source keys once no copy is queued or running
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending)
+            return list(self.copied)
+
+
+class TransferEngine:
+    # queues journaled uploads and downloads on a TransferScheduler and reports
+    # them to one EngineListener
+    def __init__(self, listener=None, journal=None, maxFiles=MAX_CONCURRENT_FILES, maxParts=MAX_CONCURRENT_PARTS):
+        self.listener = listener if listener is not None else EngineListener()
+        self.journal = journal if journal is not None else TransferJournal.TransferJournal()
+        self.scheduler = TransferScheduler(maxFiles, maxParts, listener=self._job_state)
+        self._task_ids = itertools.count(1)
+        # task id -> CopyBatch waiting for it
+        self._batches = {}
+
+    def new_task_id(self):
+        return str(next(self._task_ids))
+
+    def _job_state(self, job):
+        self.listener.task_state(job.task_id, job.state, job.error)
+        if job.state in FINISHED_STATES:
+            batch = self._batches.pop(job.task_id, None)
+            if batch is not None:
+                batch.done(job.task_id, job.state)
+
+    def _submit(self, task, run, priority, batch=None):
+        task_id = self.new_task_id()
+        progress = TransferProgress(task_id, task["Size"], self.listener.task_progress)
+        self.listener.task_added(task_id, task, progress)
+        job = TransferJob(task_id, partial(run, progress), priority)
+        progress.job = job
+        if batch is not None:
+            batch.add(task_id, task["SourceKey"])
+            self._batches[task_id] = batch
+        self.scheduler.submit(job)
+        return task_id
+
+    def upload_file(self, bucket, key, file, size, priority=0, journal_id=None):
+        if journal_id is None:
+            journal_id = self.journal.add(UPLOAD, bucket, key, file, size)
+        task = {"Type": UPLOAD, "Bucket": bucket, "Key": key, "LocalPath": file, "Size": size, "JournalId": journal_id}
+        return self._submit(task, partial(self._upload, bucket=bucket, key=key, file=file, size=size,
+                                          journal_id=journal_id), priority)
+
+    def download_file(self, bucket, key, dir, file_name, size, priority=0, journal_id=None):
+        target = dir+'/'+file_name
+        if journal_id is None:
+            journal_id = self.journal.add(DOWNLOAD, bucket, key, target, size)
+        task = {"Type": DOWNLOAD, "Bucket": bucket, "Key": key, "LocalPath": target, "Size": size,
+                "JournalId": journal_id}
+        return self._submit(task, partial(self._download, bucket=bucket, key=key, target=target, size=size,
+                                          journal_id=journal_id), priority)
+
+    def upload_folder(self, bucket, prefix, folder):
+        # folder /a/b is uploaded under prefix + "b/", returns the number of queued files
+        base = os.path.dirname(os.path.normpath(folder))
+        count = 0
+        for path, size in iter_local_files(folder):
+            self.scheduler.wait_for_capacity(MAX_QUEUED_TRANSFERS)
+            key = prefix + os.path.relpath(path, base).replace(os.sep, '/')
+            self.upload_file(bucket, key, path, size)
+            count += 1
+        return count
+
+    def download_prefix(self, bucket, prefix, dir):
+        # prefix a/b/ is downloaded into dir/b/, returns the number of queued files
+        base = parent_prefix(prefix)
+        count = 0
+        for obj in iter_prefix_objects(bucket, prefix):
+            target = local_target(dir, obj["Key"][len(base):])
+            if target is None:
+                print("skipped {0}, it would be written outside {1}".format(obj["Key"], dir))
+                continue
+            if obj["Key"].endswith('/'):
+                os.makedirs(target, exist_ok=True)
+                continue
+            self.scheduler.wait_for_capacity(MAX_QUEUED_TRANSFERS)
+            self.download_file(bucket, obj["Key"], os.path.dirname(target), os.path.basename(target), obj["Size"])
+            count += 1
+        return count
+
+    def copy_object(self, bucket, key, dst_bucket, dst_key, size, priority=0, batch=None):
+        # server-side, the source and the destination may be in different regions
+        task = {"Type": COPY, "Bucket": dst_bucket, "Key": dst_key, "LocalPath": "", "Size": size, "JournalId": None,
+                "SourceBucket": bucket, "SourceKey": key}
+        return self._submit(task, partial(self._copy, bucket=bucket, key=key, dst_bucket=dst_bucket, dst_key=dst_key,
+                                          size=size), priority, batch)
+
+    def copy_objects(self, bucket, objects, prefixes, dst_bucket, base, dst_prefix, move=False, progress=None):
+        # objects are (key, size), prefixes are copied recursively; every key has its
+        # leading base replaced by dst_prefix, so base "a/b.txt" and dst_prefix "a/c.txt"
+        # renames one object and base "a/" and dst_prefix "x/" copies a/... to x/...
+        # a move deletes the sources that were copied once every copy has finished.
+        # progress(copied, failed, deleted) is called from transfer threads
+        for prefix in prefixes:
+            if bucket == dst_bucket and (dst_prefix + prefix[len(base):]).startswith(prefix):
+                raise ValueError("cannot copy s3://{0}/{1} into itself".format(bucket, prefix))
+        batch = CopyBatch(progress)
+        for key, size in itertools.chain(objects, ((obj["Key"], obj["Size"]) for prefix in prefixes
+                                                   for obj in iter_prefix_objects(bucket, prefix))):
+            dst_key = dst_prefix + key[len(base):]
+            if bucket == dst_bucket and key == dst_key:
+                continue
+            self.scheduler.wait_for_capacity(MAX_QUEUED_TRANSFERS)
+            self.copy_object(bucket, key, dst_bucket, dst_key, size, batch=batch)
+        copied = batch.wait()
+        if move and copied:
+            batches = [[{"Key": key} for key in copied[i:i + DELETE_BATCH_SIZE]]
+                       for i in range(0, len(copied), DELETE_BATCH_SIZE)]
+            deleted, failed = delete_objects_pipelined(
+                bucket, batches, lambda d, f: batch.report(d))
+            if failed:
+                raise RuntimeError("{0} moved objects could not be deleted from {1}".format(failed, bucket))
+        if batch.failed:
+            raise RuntimeError("{0} of {1} objects could not be copied".format(batch.failed, batch.failed + len(copied)))
+        return len(copied)
+
+    def wait_idle(self):
+        # blocks until every queued and running transfer has finished, paused ones
+        # are left for the user to resume
+        self.scheduler.wait_for_capacity(1)
+
+    def pause(self, task_id):
+        self.scheduler.pause(task_id)
+
+    def resume(self, task_id):
+        self.scheduler.resume(task_id)
+
+    def cancel(self, task_id):
+        self.scheduler.cancel(task_id)
+
+    def prioritize(self, task_id):
+        # queued tasks run in priority order, lower first
+        self.scheduler.set_priority(task_id, -1)
+
+    def _upload(self, transfer_callback, job, bucket, key, file, size, journal_id):
+        try:
+            if size >= RESUMABLE_THRESHOLD:
+                self._upload_multipart(transfer_callback, bucket, key, file, size, journal_id, job)
+            else:
+                # botocore hashes the body as it is sent and S3 rejects it if it differs
+                S3Client.for_bucket(bucket).upload_file(file, bucket, key, Callback=transfer_callback,
+                                                        Config=self.scheduler.config,
+                                                        ExtraArgs={"ChecksumAlgorithm": Checksums.ALGORITHM})
+        except TransferCancelled:
+            self.journal.remove(journal_id)
+            raise
+        self.journal.remove(journal_id)
+        KeyIndex.Index.put(bucket, key, size, time.time())
+
+    def part_size(self, size):
+        chunksize = self.scheduler.config.multipart_chunksize
+        # S3 allows at most MAX_PARTS parts per upload
+        while math.ceil(size / chunksize) > MAX_PARTS:
+            chunksize *= 2
+        return chunksize
+
+    def _upload_multipart(self, transfer_callback, bucket, key, file, size, journal_id, job):
+        s3 = S3Client.for_bucket(bucket)
+        entry = self.journal.get(journal_id)
+        upload_id = entry["UploadId"]
+        chunksize = entry["ChunkSize"]
+        remote = {}
+        if upload_id is not None:
+            # S3 is the reference for finished parts, the journal may lag behind it
+            try:
+                remote = self._list_parts(s3, bucket, key, upload_id)
+            except ClientError as e:
+                if "NoSuchUpload" != e.response["Error"]["Code"]:
+                    raise
+                upload_id = None
+            # parts sent without a checksum cannot make up an object that has one
+            if upload_id is not None and (os.path.getsize(file) != size
+                                          or any(checksum is None for _, checksum in remote.values())):
+                s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+                upload_id = None
+        if upload_id is None:
+            remote = {}
+            chunksize = self.part_size(size)
+            upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key,
+                                                   ChecksumAlgorithm=Checksums.ALGORITHM)["UploadId"]
+            self.journal.set_upload(journal_id, upload_id, chunksize)
+
+        count = math.ceil(size / chunksize)
+        # part number -> (ETag, PartDigest); parts of an earlier run are hashed from
+        # the file, a part that changed since is sent again
+        done = {}
+        for n, (etag, checksum) in remote.items():
+            digest = Checksums.PartDigest(_read_part(file, n, chunksize))
+            if checksum == digest.checksum():
+                done[n] = (etag, digest)
+        resumed = sum(min(chunksize, size - (n - 1) * chunksize) for n in done)
+        if resumed:
+            transfer_callback(resumed)
+        todo = [n for n in range(1, count + 1) if n not in done]
+        try:
+            for attempt in range(VERIFY_RETRIES + 1):
+                with ThreadPoolExecutor(max_workers=self.scheduler.config.max_concurrency) as executor:
+                    futures = [executor.submit(self._upload_part, transfer_callback, bucket, key, file, upload_id,
+                                               journal_id, n, chunksize, job, 0 == attempt)
+                               for n in todo]
+                    for future in as_completed(futures):
+                        n, etag, digest = future.result()
+                        done[n] = (etag, digest)
+                # every part S3 holds must be the one hashed here, the others go again
+                todo = self._verify_parts(s3, bucket, key, upload_id, count, done)
+                if not todo:
+                    break
+                print("{0}: {1} parts failed verification, sending them again".format(key, len(todo)))
+                for n in todo:
+                    done.pop(n, None)
+            else:
+                raise Checksums.ChecksumMismatch("{0} parts of {1} failed verification".format(len(todo), key))
+        except TransferCancelled:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
+        response = s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [{"PartNumber": n, "ETag": done[n][0], Checksums.FIELD: done[n][1].checksum()}
+                          for n in sorted(done)]
+            }
+        )
+        self._verify_upload(key, response, done)
+
+    def _list_parts(self, s3, bucket, key, upload_id):
+        # part number -> (ETag, checksum or None)
+        parts = {}
+        paginator = s3.get_paginator('list_parts')
+        for response in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+            for part in response.get("Parts", []):
+                parts[part["PartNumber"]] = (part["ETag"], part.get(Checksums.FIELD))
+        return parts
+
+    def _verify_parts(self, s3, bucket, key, upload_id, count, done):
+        # part numbers to send again: missing, or holding other data than was hashed
+        remote = self._list_parts(s3, bucket, key, upload_id)
+        todo = []
+        for n in range(1, count + 1):
+            if n not in remote or n not in done:
+                todo.append(n)
+                continue
+            etag, checksum = remote[n]
+            if etag != done[n][0] or (checksum is not None and checksum != done[n][1].checksum()):
+                todo.append(n)
+        return todo
+
+    def _verify_upload(self, key, response, done):
+        # the object S3 assembled against the part hashes; a mismatch fails the task
+        parts = [done[n] for n in sorted(done)]
+        checksum = response.get(Checksums.FIELD)
+        if checksum is not None:
+            expected = Checksums.composite_checksum([digest.checksum() for _, digest in parts])
+            if not Checksums.same_checksum(checksum, expected):
+                raise Checksums.ChecksumMismatch("{0}: checksum {1}, expected {2}".format(key, checksum, expected))
+        # encrypted objects have no MD5 ETags, only plain ones are compared
+        if all(etag == digest.etag() for etag, digest in parts):
+            expected = Checksums.multipart_etag([etag for etag, _ in parts])
+            if response["ETag"] != expected:
+                raise Checksums.ChecksumMismatch("{0}: ETag {1}, expected {2}".format(key, response["ETag"], expected))
+
+    def _upload_part(self, transfer_callback, bucket, key, file, upload_id, journal_id, n, chunksize, job, report):
+        job.checkpoint()
+        data = _read_part(file, n, chunksize)
+        # hashed from the buffer that is sent, the file is read once
+        digest = Checksums.PartDigest(data)
+        response = S3Client.for_bucket(bucket).upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                                           PartNumber=n, Body=data,
+                                                           **{Checksums.FIELD: digest.checksum()})
+        self.journal.add_part(journal_id, n, response["ETag"])
+        # parts sent again were counted the first time
+        if report:
+            transfer_callback(len(data))
+        return n, response["ETag"], digest
+
+    def _download(self, transfer_callback, job, bucket, key, target, size, journal_id):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            if size >= RESUMABLE_THRESHOLD:
+                self._download_ranged(transfer_callback, bucket, key, target, size, journal_id, job)
+            else:
+                # botocore checks the object's full checksum, if it has one, as the body arrives
+                S3Client.for_bucket(bucket).download_file(bucket, key, target, Callback=transfer_callback,
+                                                          Config=self.scheduler.config,
+                                                          ExtraArgs={"ChecksumMode": "ENABLED"})
+        except TransferCancelled:
+            if size >= RESUMABLE_THRESHOLD and os.path.exists(target):
+                os.remove(target)
+            self.journal.remove(journal_id)
+            raise
+        self.journal.remove(journal_id)
+
+    def _download_ranged(self, transfer_callback, bucket, key, target, size, journal_id, job):
+        # ranges are fetched concurrently and written in place into the preallocated
+        # target, finished ranges are journaled so a restart only fetches the rest
+        # an object uploaded with part checksums is fetched part by part, each part
+        # hashed as it is written and fetched again if it differs
+        entry = self.journal.get(journal_id)
+        s3 = S3Client.for_bucket(bucket)
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+        parts = self._checksummed_parts(s3, bucket, key, etag)
+        done = set()
+        if (entry["ETag"] == etag and entry["ChunkSize"] and os.path.exists(target)
+                and os.path.getsize(target) == size):
+            range_size = entry["ChunkSize"]
+            done = {start for start, _ in self.journal.ranges(journal_id)}
+        else:
+            range_size = RANGE_SIZE if parts is None else parts[0][1] - parts[0][0]
+            self.journal.set_download(journal_id, etag, range_size)
+            _preallocate(target, size)
+        if parts is None:
+            parts = [(start, min(start + range_size, size), None) for start in range(0, size, range_size)]
+
+        transfer_callback.set_ranges(len(parts), len(done))
+        resumed = sum(end - start for start, end, _ in parts if start in done)
+        if resumed:
+            transfer_callback(resumed)
+        fd = os.open(target, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            with ThreadPoolExecutor(max_workers=RANGE_CONCURRENCY) as executor:
+                futures = [executor.submit(self._download_range, transfer_callback, bucket, key, etag, fd,
+                                           start, end, checksum, journal_id, job)
+                           for start, end, checksum in parts if start not in done]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            os.close(fd)
+
+    def _checksummed_parts(self, s3, bucket, key, etag):
+        # [(start, end, checksum)] of the object's parts, None without part checksums
+        parts = []
+        kwargs = {"Bucket": bucket, "Key": key, "ObjectAttributes": ["ETag", "ObjectParts"], "MaxParts": 1000}
+        try:
+            while True:
+                attributes = s3.get_object_attributes(**kwargs)
+                # GetObjectAttributes has no IfMatch, a replaced object shows in its ETag
+                if attributes.get("ETag", "").strip('"') != etag.strip('"'):
+                    raise IOError("{0} was replaced since the download began".format(key))
+                response = attributes.get("ObjectParts", {})
+                parts.extend(response.get("Parts", []))
+                if not response.get("IsTruncated"):
+                    break
+                kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+        except ClientError as e:
+            print("no part checksums for {0}: {1}".format(key, e))
+            return None
+        if not parts or any(part.get(Checksums.FIELD) is None for part in parts):
+            return None
+        ranges = []
+        start = 0
+        for part in sorted(parts, key=lambda part: part["PartNumber"]):
+            ranges.append((start, start + part["Size"], part[Checksums.FIELD]))
+            start += part["Size"]
+        return ranges
+
+    def _download_range(self, transfer_callback, bucket, key, etag, fd, start, end, checksum, journal_id, job):
+        for attempt in range(VERIFY_RETRIES + 1):
+            job.checkpoint()
+            digest = Checksums.PartDigest()
+            # IfMatch fails the request if the object was replaced since the download began
+            response = S3Client.for_bucket(bucket).get_object(Bucket=bucket, Key=key,
+                                                              Range="bytes={0}-{1}".format(start, end - 1),
+                                                              IfMatch=etag)
+            body = response["Body"]
+            offset = start
+            while True:
+                chunk = body.read(DOWNLOAD_CHUNK)
+                if not chunk:
+                    break
+                _write_at(fd, chunk, offset)
+                digest.update(chunk)
+                offset += len(chunk)
+                # a range fetched again was counted the first time
+                if 0 == attempt:
+                    transfer_callback(len(chunk))
+            if offset != end:
+                raise IOError("short read for {0} bytes {1}-{2}".format(key, start, end - 1))
+            if checksum is None or checksum == digest.checksum():
+                break
+            print("{0} bytes {1}-{2} failed verification".format(key, start, end - 1))
+        else:
+            raise Checksums.ChecksumMismatch("{0} bytes {1}-{2}: checksum {3}, expected {4}".format(
+                key, start, end - 1, digest.checksum(), checksum))
+        self.journal.add_range(journal_id, start, end)
+        transfer_callback.range_done()
+
+    def _copy(self, transfer_callback, job, bucket, key, dst_bucket, dst_key, size):
+        job.checkpoint()
+        source = {"Bucket": bucket, "Key": key}
+        if size <= MAX_COPY_OBJECT_SIZE:
+            S3Client.for_bucket(dst_bucket).copy_object(Bucket=dst_bucket, Key=dst_key, CopySource=source)
+            transfer_callback(size)
+        else:
+            self._copy_multipart(transfer_callback, source, dst_bucket, dst_key, size, job)
+        KeyIndex.Index.put(dst_bucket, dst_key, size, time.time())
+
+    def _copy_multipart(self, transfer_callback, source, dst_bucket, dst_key, size, job):
+        # copy_object keeps metadata by itself, a multipart copy takes it from the source
+        head = S3Client.for_bucket(source["Bucket"]).head_object(**source)
+        args = {field: head[field] for field in HEAD_COPY_FIELDS if head.get(field)}
+        s3 = S3Client.for_bucket(dst_bucket)
+        upload_id = s3.create_multipart_upload(Bucket=dst_bucket, Key=dst_key, **args)["UploadId"]
+        chunksize = COPY_PART_SIZE
+        while math.ceil(size / chunksize) > MAX_PARTS:
+            chunksize *= 2
+        parts = {}
+        executor = ThreadPoolExecutor(max_workers=self.scheduler.config.max_concurrency)
+        try:
+            futures = [executor.submit(self._copy_part, transfer_callback, source, head["ETag"], dst_bucket, dst_key,
+                                       upload_id, n, start, min(start + chunksize, size), job)
+                       for n, start in enumerate(range(0, size, chunksize), 1)]
+            for future in as_completed(futures):
+                n, etag = future.result()
+                parts[n] = etag
+        except BaseException:
+            # nothing to resume, the parts copied so far are dropped
+            executor.shutdown(cancel_futures=True)
+            s3.abort_multipart_upload(Bucket=dst_bucket, Key=dst_key, UploadId=upload_id)
+            raise
+        executor.shutdown()
+        s3.complete_multipart_upload(
+            Bucket=dst_bucket,
+            Key=dst_key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [{"PartNumber": n, "ETag": parts[n]} for n in sorted(parts)]
+            }
+        )
+
+    def _copy_part(self, transfer_callback, source, etag, dst_bucket, dst_key, upload_id, n, start, end, job):
+        job.checkpoint()
+        # CopySourceIfMatch fails the part if the source was replaced during the copy
+        response = S3Client.for_bucket(dst_bucket).upload_part_copy(
+            Bucket=dst_bucket, Key=dst_key, UploadId=upload_id, PartNumber=n, CopySource=source,
+            CopySourceRange="bytes={0}-{1}".format(start, end - 1), CopySourceIfMatch=etag)
+        transfer_callback(end - start)
+        return n, response["CopyPartResult"]["ETag"]
+
+    def resume_journal(self):
+        # requeue the transfers left unfinished by the last session
+        for entry in self.journal.pending():
+            if UPLOAD == entry["Type"]:
+                self.upload_file(entry["Bucket"], entry["Key"], entry["LocalPath"], entry["Size"],
+                                 journal_id=entry["Id"])
+            else:
+                dir, file_name = os.path.split(entry["LocalPath"])
+                self.download_file(entry["Bucket"], entry["Key"], dir, file_name, entry["Size"],
+                                   journal_id=entry["Id"])
+
+    def discard_journal(self, progress=None):
+        # progress(discarded) is called after each entry
+        for n, entry in enumerate(self.journal.pending(), 1):
+            try:
+                if entry["UploadId"] is not None:
+                    S3Client.for_bucket(entry["Bucket"]).abort_multipart_upload(
+                        Bucket=entry["Bucket"], Key=entry["Key"], UploadId=entry["UploadId"])
+                # a started ranged download has already truncated its target
+                if DOWNLOAD == entry["Type"] and entry["ETag"] and os.path.exists(entry["LocalPath"]):
+                    os.remove(entry["LocalPath"])
+            except (ClientError, BotoCoreError, OSError) as e:
+                print("discard {0} failed: {1}".format(entry["Key"], e))
+            self.journal.remove(entry["Id"])
+            if progress is not None:
+                progress(n)
+
+    def list_stale_uploads(self, bucket):
+        # incomplete multipart uploads of the bucket that no journaled task will resume
+        tracked = self.journal.upload_ids(bucket)
+        return [u for u in TransferJournal.list_multipart_uploads(S3Client.for_bucket(bucket), bucket)
+                if u["UploadId"] not in tracked]
+
+    def abort_stale_uploads(self, bucket, uploads, progress=None):
+        return TransferJournal.abort_multipart_uploads(S3Client.for_bucket(bucket), bucket, uploads, progress)
+
+
+def _read_part(file, n, chunksize):
+    with open(file, "rb") as f:
+        f.seek((n - 1) * chunksize)
+        return f.read(chunksize)
+
+def _preallocate(target, size):
+    fd = os.open(target, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+def _write_at(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+        return
+    with _write_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
@@ -0,0 +1,196 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+THROTTLE_CODES = {"Throttling", "ThrottlingException", "ThrottledException", "RequestThrottled",
+                  "RequestThrottledException", "SlowDown", "RequestLimitExceeded",
+                  "TooManyRequestsException"}
+PROMETHEUS_PREFIX = "s3tools"
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.latencySum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th call
+        if 0 == self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "bytes_out": self.bytesOut,
+            "bytes_in": self.bytesIn,
+            "latency_sum": self.latencySum,
+            "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class Metrics:
+    # per operation counters fed by botocore event hooks; every hook is a dict
+    # update under one lock so it can stay enabled all the time
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inFlightCalls = 0
+        self.inFlightRequests = 0
+        self.reset()
+
+    def reset(self):
+        # the in-flight gauges describe calls still running and are kept
+        with self._lock:
+            self.operations = {}
+            self.peakRequests = self.inFlightRequests
+            self.started = time.time()
+
+    def _stats(self, operation):
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = OperationStats()
+        return stats
+
+    def register(self, client):
+        events = client.meta.events
+        events.register('before-call', self._before_call)
+        events.register('before-send', self._before_send)
+        events.register('response-received', self._response_received)
+        events.register('after-call', self._after_call)
+        events.register('after-call-error', self._after_call_error)
+
+    def _before_call(self, model, context, **kwargs):
+        context["metrics_operation"] = model.name
+        context["metrics_start"] = time.perf_counter()
+        context["metrics_attempts"] = 0
+        with self._lock:
+            self.inFlightCalls += 1
+
+    def _before_send(self, request, **kwargs):
+        # one HTTP attempt, in flight until its response (or error) is received
+        length = request.headers.get("Content-Length")
+        with self._lock:
+            self.inFlightRequests += 1
+            self.peakRequests = max(self.peakRequests, self.inFlightRequests)
+            if length is not None and "metrics_operation" in request.context:
+                self._stats(request.context["metrics_operation"]).bytesOut += int(length)
+
+    def _response_received(self, response_dict, parsed_response, context, exception, **kwargs):
+        context["metrics_attempts"] = context.get("metrics_attempts", 0) + 1
+        received = 0
+        throttled = False
+        if response_dict is not None:
+            received = int(response_dict["headers"].get("content-length") or 0)
+            code = (parsed_response or {}).get("Error", {}).get("Code")
+            throttled = code in THROTTLE_CODES or response_dict["status_code"] in (429, 503)
+        with self._lock:
+            self.inFlightRequests -= 1
+            operation = context.get("metrics_operation")
+            if operation is not None:
+                stats = self._stats(operation)
+                stats.bytesIn += received
+                if throttled:
+                    stats.throttles += 1
+
+    def _finish(self, context, failed):
+        start = context.get("metrics_start")
+        if start is None:
+            return
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.inFlightCalls -= 1
+            stats = self._stats(context["metrics_operation"])
+            stats.calls += 1
+            stats.retries += max(0, context.get("metrics_attempts", 1) - 1)
+            if failed:
+                stats.errors += 1
+            stats.latencySum += latency
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def _after_call(self, http_response, context, **kwargs):
+        self._finish(context, http_response.status_code >= 300)
+
+    def _after_call_error(self, context, **kwargs):
+        self._finish(context, True)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "in_flight_calls": self.inFlightCalls,
+                "in_flight_requests": self.inFlightRequests,
+                "peak_requests": self.peakRequests,
+                "operations": {name: stats.as_dict() for name, stats in sorted(self.operations.items())},
+            }
+
+    def rows(self):
+        # (operation, stats copy) for display
+        with self._lock:
+            rows = []
+            for name, stats in sorted(self.operations.items()):
+                copy = OperationStats()
+                copy.__dict__.update(stats.__dict__)
+                copy.buckets = list(stats.buckets)
+                rows.append((name, copy))
+            return rows
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append("# HELP {0}_{1} {2}".format(p, name, help))
+            lines.append("# TYPE {0}_{1} {2}".format(p, name, kind))
+            lines.extend(samples)
+
+        operations = snapshot["operations"]
+        for name, key, help in (("requests_total", "calls", "API calls by operation."),
+                                ("request_errors_total", "errors", "API calls that failed."),
+                                ("retries_total", "retries", "Retried HTTP attempts."),
+                                ("throttles_total", "throttles", "Throttled HTTP responses."),
+                                ("bytes_sent_total", "bytes_out", "Request body bytes sent."),
+                                ("bytes_received_total", "bytes_in", "Response bytes announced by Content-Length.")):
+            family(name, "counter", help,
+                   ['{0}_{1}{{operation="{2}"}} {3}'.format(p, name, op, stats[key]) for op, stats in operations.items()])
+        samples = []
+        for op, stats in operations.items():
+            cumulative = 0
+            for bound, count in stats["latency_buckets"].items():
+                cumulative += count
+                samples.append('{0}_request_duration_seconds_bucket{{operation="{1}",le="{2}"}} {3}'.format(
+                    p, op, bound, cumulative))
+            samples.append('{0}_request_duration_seconds_sum{{operation="{1}"}} {2}'.format(p, op, stats["latency_sum"]))
+            samples.append('{0}_request_duration_seconds_count{{operation="{1}"}} {2}'.format(p, op, stats["calls"]))
+        family("request_duration_seconds", "histogram", "API call latency including retries.", samples)
+        family("in_flight_calls", "gauge", "API calls in progress.",
+               ["{0}_in_flight_calls {1}".format(p, snapshot["in_flight_calls"])])
+        family("in_flight_requests", "gauge", "HTTP requests on open connections.",
+               ["{0}_in_flight_requests {1}".format(p, snapshot["in_flight_requests"])])
+        family("in_flight_requests_peak", "gauge", "Most HTTP requests in flight at once.",
+               ["{0}_in_flight_requests_peak {1}".format(p, snapshot["peak_requests"])])
+        return "\n".join(lines) + "\n"
+
+
+ClientMetrics = Metrics()
@@ -1,114 +1,200 @@
-import boto3
-from PySide6.QtCore import QStringListModel
+import sqlite3
+import threading
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+from PySide6.QtCore import QStringListModel, QObject, QRunnable, QThreadPool, QTimer, Qt, Signal, Slot
 from PySide6.QtGui import QStandardItemModel, QStandardItem, QIcon
 from dateutil.tz import tzutc
 import datetime
-from PySide6.QtWidgets import QStyle, QCommonStyle, QMessageBox
+from PySide6.QtWidgets import QCommonStyle, QMessageBox
 
+import FolderSize
+import Inventory
+import KeyIndex
+import S3Catalog
+import S3Client
+import S3Engine
 import S3Object
 import S3Tasks
+from ObjectTableModel import ObjectTableModel, ObjectSortFilterProxy, ObjectColumns, SizeRole
+from ListingCache import ListingCache
+from MetadataCache import MetadataCache
+from PreviewDialog import PreviewDialog
+from ObjectTableModel import format_size
 
-ObjectsModel = QStandardItemModel()
+ObjectsModel = ObjectTableModel()
+ObjectsProxyModel = ObjectSortFilterProxy()
+ObjectsProxyModel.setSourceModel(ObjectsModel)
 ObjectsPropertiesModel = QStandardItemModel()
-currentObjectList = {}
 currentBucket = ""
 currentPrefix = ""
-style = QCommonStyle()
-
-SIZE_UNIT = [" KB", " MB", " GB", " TB"]
-SIZE_POWER = 1024
+# the view shows key index results instead of a folder
+searching = False
+listGeneration = 0
+viewGeneration = 0
+ListWorkers = {}
+ListThreadPool = QThreadPool()
+ListThreadPool.setMaxThreadCount(4)
+PrefetchThreadPool = QThreadPool()
+PrefetchThreadPool.setMaxThreadCount(2)
+ListingsCache = ListingCache()
+refreshTimer = None
+# properties fetched for clicked rows, only the newest request is shown
+MetadataThreadPool = QThreadPool()
+MetadataThreadPool.setMaxThreadCount(2)
+MetadataWorkers = {}
+MetadatasCache = MetadataCache()
+metadataGeneration = 0
 
-s3 = boto3.client('s3')
+PREFETCH_CHILDREN = 8
+REFRESH_DELAY_MS = 500
+PREFIX_SUMMARY_LIMIT = 100000
+style = QCommonStyle()
 
-def list_objects(bucketName, Delimiter="", Prefix=""):
-    objlist = {}
-    if "" == bucketName:
-        return objlist
-    response = s3.list_objects(Bucket=bucketName, Delimiter=Delimiter, Prefix=Prefix)
-    if "Contents" in response:
-        for obj in response['Contents']:
-            key = obj['Key']
-
-            if "" != Prefix:
-                _, _, key = key.partition(Prefix)
-
-            if "" == key:
-                continue
-            if (-1 == key.find('/')):
-                obj["Type"] = "File"
-                obj["Key"] = key
-                objlist[key] = obj
-            else:
-                d = key.split("/", 1)[0] + "/"
-                o = {
-                    "Key": d,
-                    "Type": "Dir",
-                }
-                if d not in objlist:
-                    objlist[d] =  o
-    S3Object.currentObjectList = objlist
-    return objlist
-
-def update_objects_listview():
+def update_objects_listview(cached=True):
     if "" != S3Object.currentBucket:
-        update_objects_model(S3Object.currentBucket, S3Object.style, Delimiter="", Prefix=S3Object.currentPrefix)
+        update_objects_model(S3Object.currentBucket, S3Object.style, Prefix=S3Object.currentPrefix, cached=cached)
 
-def update_objects_model(bucketName, w, Delimiter="", Prefix=""):
+def update_objects_model(bucketName, w, Delimiter="/", Prefix="", cached=True):
     S3Object.currentBucket = bucketName
     S3Object.style = w
     S3Object.currentPrefix = Prefix
-    objlist = list_objects(bucketName, Delimiter=Delimiter, Prefix=Prefix)
-    ObjectsModel.setRowCount(len(objlist))
-    ObjectsModel.setColumnCount(5)
-    ObjectsModel.setHorizontalHeaderLabels(["Name", "Size", "Type", "Last Modified", "Storage Type"])
+    S3Object.searching = False
+    S3Object.listGeneration += 1
+    S3Object.viewGeneration = S3Object.listGeneration
+    ObjectsModel.set_style(w)
+    ObjectsModel.clear()
 
-    i = 0
-    for obj in objlist.values():
-        item_name = QStandardItem(obj["Key"])
-        ObjectsModel.setItem(i, 0, item_name)
-        item_name.setEditable(False)
-        if -1 != obj["Key"].find('/'):
-            item_name.setIcon(w.standardIcon(QStyle.SP_DirIcon))
-        else:
-            item_name.setIcon(w.standardIcon(QStyle.SP_FileIcon))
+    for worker in ListWorkers.values():
+        worker.cancel()
+    ObjectsModel.set_dir_sizes({})
+    if "" == bucketName:
+        return
+    inventory = Inventory.Loaded.get(bucketName)
+    if inventory is not None and "/" == Delimiter:
+        show_inventory_listing(inventory, Prefix)
+        return
+    show_folder_sizes(bucketName)
+    if cached and "/" == Delimiter:
+        columns = ListingsCache.get(bucketName, Prefix)
+        if columns is not None:
+            ObjectsModel.append_columns(columns)
+            prefetch_children(bucketName, Prefix, columns)
+            return
+        # a listing from an earlier session is shown while it is revalidated
+        blob = S3Catalog.Catalog.listing(bucketName, Prefix)
+        if blob is not None:
+            columns = ObjectColumns.load(blob)
+            ObjectsModel.append_columns(columns)
+            start_list_worker(ListWorker(S3Object.listGeneration, bucketName, Delimiter, Prefix, stale=columns))
+            return
+    start_list_worker(ListWorker(S3Object.listGeneration, bucketName, Delimiter, Prefix))
 
-        if "Size" in obj:
-            objSize = obj["Size"]
-            objsizestr = str(objSize) + " bytes"
-            for unit in SIZE_UNIT:
-                if objSize > SIZE_POWER:
-                    objSize = objSize / SIZE_POWER
-                    objsizestr = "{:.2f}".format(objSize) + unit
+def show_inventory_listing(inventory, Prefix):
+    # the folder as of the inventory report, read on the list pool without any request
+    worker = InventoryListWorker(S3Object.listGeneration, inventory, Prefix)
+    worker.signals.page_ready.connect(on_list_page, type=Qt.QueuedConnection)
+    worker.signals.finished.connect(on_inventory_listed, type=Qt.QueuedConnection)
+    worker.signals.failed.connect(on_list_failed, type=Qt.QueuedConnection)
+    ListWorkers[worker.generation] = worker
+    ListThreadPool.start(worker)
 
-            item_size = QStandardItem(objsizestr)
-        else:
-            item_size = QStandardItem("")
-        item_size.setEditable(False)
-        ObjectsModel.setItem(i, 1, item_size)
+def show_search_results(bucketName, w, rows):
+    # rows from KeyIndex.search, named by full key so every action works from the root
+    S3Object.currentBucket = bucketName
+    S3Object.currentPrefix = ""
+    S3Object.searching = True
+    S3Object.listGeneration += 1
+    S3Object.viewGeneration = S3Object.listGeneration
+    for worker in ListWorkers.values():
+        worker.cancel()
+    columns = ObjectColumns()
+    for key, size, mtime, etag, storageClass in rows:
+        columns.append(key, size, mtime, storageClass, etag)
+    ObjectsModel.set_style(w)
+    ObjectsModel.clear()
+    ObjectsModel.set_dir_sizes({})
+    ObjectsModel.append_columns(columns)
 
-        if "Type" in obj:
-            item_type = QStandardItem(obj["Type"])
-        else:
-            item_type = QStandardItem("")
-        item_type.setEditable(False)
-        ObjectsModel.setItem(i, 2, item_type)
+def start_list_worker(worker):
+    worker.signals.page_ready.connect(on_list_page, type=Qt.QueuedConnection)
+    worker.signals.finished.connect(on_list_finished, type=Qt.QueuedConnection)
+    worker.signals.failed.connect(on_list_failed, type=Qt.QueuedConnection)
+    # cancelled workers stay referenced until their last request returns
+    ListWorkers[worker.generation] = worker
+    if worker.prefetch:
+        PrefetchThreadPool.start(worker)
+    else:
+        ListThreadPool.start(worker)
 
-        if "LastModified" in obj:
-            dt = obj["LastModified"].strftime("%m/%d/%Y %H:%M:%S")
-            item_lastmodified = QStandardItem(dt)
-        else:
-            item_lastmodified = QStandardItem("")
-        item_lastmodified.setEditable(False)
-        ObjectsModel.setItem(i, 3, item_lastmodified)
+def prefetch_children(bucketName, Prefix, columns):
+    prefetching = {(w.bucketName, w.prefix) for w in ListWorkers.values() if w.prefetch}
+    count = 0
+    for name, size in zip(columns.names, columns.sizes):
+        if count >= PREFETCH_CHILDREN:
+            break
+        if size >= 0:
+            continue
+        count += 1
+        child = Prefix + name
+        if (bucketName, child) in ListingsCache or (bucketName, child) in prefetching:
+            continue
+        S3Object.listGeneration += 1
+        start_list_worker(ListWorker(S3Object.listGeneration, bucketName, "/", child, prefetch=True))
 
-        if "StorageClass" in obj:
-            item_storageClass = QStandardItem(obj["StorageClass"])
-        else:
-            item_storageClass = QStandardItem("")
-        item_storageClass.setEditable(False)
-        ObjectsModel.setItem(i, 4, item_storageClass)
+@Slot()
+def on_list_page(generation, columns):
+    # results for a location the user has already left
+    if generation != S3Object.viewGeneration:
+        return
+    ObjectsModel.append_columns(columns)
+
+@Slot()
+def on_list_finished(generation):
+    worker = ListWorkers.pop(generation, None)
+    if worker is None or not worker.complete:
+        return
+    if "/" == worker.delimiter:
+        ListingsCache.put(worker.bucketName, worker.prefix, worker.columns)
+    if generation == S3Object.viewGeneration:
+        if worker.stale is not None and worker.stale != worker.columns:
+            ObjectsModel.clear()
+            ObjectsModel.append_columns(worker.columns)
+        prefetch_children(worker.bucketName, worker.prefix, worker.columns)
+
+@Slot()
+def on_inventory_listed(generation):
+    worker = ListWorkers.pop(generation, None)
+    if worker is not None and generation == S3Object.viewGeneration:
+        ObjectsModel.set_dir_sizes(worker.sizes)
+
+@Slot()
+def on_list_failed(generation, message):
+    if generation == S3Object.viewGeneration:
+        print("list objects failed: {0}".format(message))
 
-        i = i+1
+def show_folder_sizes(bucketName):
+    # cached totals of the folders on screen, after a size computation of the bucket
+    if bucketName != S3Object.currentBucket or S3Object.searching:
+        return
+    ObjectsModel.set_dir_sizes(FolderSize.Sizes.children(bucketName, S3Object.currentPrefix))
+
+def invalidate_listing(bucketName, Prefix=None):
+    ListingsCache.invalidate(bucketName, Prefix)
+    S3Catalog.Catalog.invalidate(bucketName, Prefix)
+
+def request_refresh(bucketName, Prefix):
+    # many transfers finishing together produce a single listing
+    invalidate_listing(bucketName, Prefix)
+    if bucketName != S3Object.currentBucket or Prefix != S3Object.currentPrefix or S3Object.searching:
+        return
+    if S3Object.refreshTimer is None:
+        S3Object.refreshTimer = QTimer()
+        S3Object.refreshTimer.setSingleShot(True)
+        S3Object.refreshTimer.setInterval(REFRESH_DELAY_MS)
+        S3Object.refreshTimer.timeout.connect(update_objects_listview)
+    if not S3Object.refreshTimer.isActive():
+        S3Object.refreshTimer.start()
 
 def flat_dict(parent,value):
     kv = {}
@@ -129,54 +215,328 @@ def flat_dict(parent,value):
     return kv
 
 def update_object_properties_model(bucketName, objKey, objFullKey):
-    if objKey in S3Object.currentObjectList:
-        obj_properties = S3Object.currentObjectList[objKey]
-        ObjectsPropertiesModel.setHorizontalHeaderLabels(["Property", "Value"])
-        ObjectsPropertiesModel.setColumnCount(2)
-        i = 0
-        flat_obj_properties = flat_dict("", obj_properties)
-        ObjectsPropertiesModel.setRowCount(len(flat_obj_properties))
-
-        for k, v in flat_obj_properties.items():
-            if isinstance(v, datetime.datetime):
-                v = v.strftime("%m/%d/%Y %H:%M:%S")
-            elif isinstance(v, int):
-                v = str(v)
-
-            item_k = QStandardItem(k)
-            item_k.setEditable(False)
-            item_v = QStandardItem(v)
-            item_v.setEditable(False)
-            ObjectsPropertiesModel.setItem(i, 0, item_k)
-            ObjectsPropertiesModel.setItem(i, 1, item_v)
-            i = i + 1
-
-def delete_object_with_item(index):
-    item = ObjectsModel.itemFromIndex(index)
-    obj_name = item.text()
-    obj_key = currentPrefix + obj_name
-    ret = QMessageBox.warning(None, "Delete Object", "Do you want to delete {0}".format(obj_key),
+    row = ObjectsModel.find(objKey)
+    if -1 != row:
+        obj_properties = ObjectsModel.object_info(row)
+        etag = obj_properties.get("ETag", "")
+        # the listing's fields are shown at once, the rest follows from the cache or a worker
+        S3Object.metadataGeneration += 1
+        for generation, worker in list(MetadataWorkers.items()):
+            worker.cancel()
+            # requests still queued are dropped, running ones return into the cache
+            if MetadataThreadPool.tryTake(worker):
+                del MetadataWorkers[generation]
+        properties = MetadatasCache.get(bucketName, objFullKey, etag)
+        if properties is not None:
+            obj_properties.update(properties)
+        else:
+            obj_properties["Loading"] = "..."
+            worker = MetadataWorker(S3Object.metadataGeneration, bucketName, objFullKey, etag,
+                                    ObjectsModel.is_dir(row), obj_properties)
+            worker.signals.finished.connect(on_metadata, type=Qt.QueuedConnection)
+            worker.signals.failed.connect(on_metadata_failed, type=Qt.QueuedConnection)
+            MetadataWorkers[worker.generation] = worker
+            MetadataThreadPool.start(worker)
+        show_properties(obj_properties)
+
+def preview_object(name, parent=None):
+    # ranged preview of a file row of the current folder
+    row = ObjectsModel.find(name)
+    if -1 == row or ObjectsModel.is_dir(row):
+        return None
+    info = ObjectsModel.object_info(row)
+    dialog = PreviewDialog(currentBucket, currentPrefix + name, info["Size"], info["ETag"], parent)
+    dialog.show()
+    return dialog
+
+def show_properties(obj_properties):
+    ObjectsPropertiesModel.clear()
+    ObjectsPropertiesModel.setHorizontalHeaderLabels(["Property", "Value"])
+    ObjectsPropertiesModel.setColumnCount(2)
+    i = 0
+    flat_obj_properties = flat_dict("", obj_properties)
+    ObjectsPropertiesModel.setRowCount(len(flat_obj_properties))
+
+    for k, v in flat_obj_properties.items():
+        if isinstance(v, datetime.datetime):
+            v = v.strftime("%m/%d/%Y %H:%M:%S")
+        elif not isinstance(v, str):
+            v = str(v)
+
+        item_k = QStandardItem(k)
+        item_k.setEditable(False)
+        item_v = QStandardItem(v)
+        item_v.setEditable(False)
+        ObjectsPropertiesModel.setItem(i, 0, item_k)
+        ObjectsPropertiesModel.setItem(i, 1, item_v)
+        i = i + 1
+
+def fetch_object_metadata(bucketName, key):
+    s3 = S3Client.for_bucket(bucketName)
+    response = s3.head_object(Bucket=bucketName, Key=key)
+    response.pop("ResponseMetadata", None)
+    try:
+        tags = s3.get_object_tagging(Bucket=bucketName, Key=key).get("TagSet", [])
+        response["Tags"] = {tag["Key"]: tag["Value"] for tag in tags}
+    except ClientError as e:
+        response["Tags"] = e.response["Error"]["Code"]
+    return response
+
+def fetch_prefix_summary(bucketName, prefix, cancelled):
+    # object count and total size below a folder, counting stops at PREFIX_SUMMARY_LIMIT
+    count = 0
+    total = 0
+    latest = None
+    paginator = S3Client.for_bucket(bucketName).get_paginator('list_objects_v2')
+    for response in paginator.paginate(Bucket=bucketName, Prefix=prefix):
+        if cancelled():
+            return None
+        for obj in response.get("Contents", []):
+            count += 1
+            total += obj["Size"]
+            if latest is None or obj["LastModified"] > latest:
+                latest = obj["LastModified"]
+        if count >= PREFIX_SUMMARY_LIMIT:
+            break
+    summary = {
+        "Objects": "{0}+".format(count) if count >= PREFIX_SUMMARY_LIMIT else count,
+        "TotalSize": format_size(total),
+    }
+    if latest is not None:
+        summary["LastModified"] = latest
+    return summary
+
+@Slot()
+def on_metadata(generation, properties):
+    worker = MetadataWorkers.pop(generation, None)
+    if worker is None:
+        return
+    MetadatasCache.put(worker.bucketName, worker.key, worker.etag, properties)
+    if generation == S3Object.metadataGeneration:
+        worker.listed.pop("Loading", None)
+        worker.listed.update(properties)
+        show_properties(worker.listed)
+
+@Slot()
+def on_metadata_failed(generation, message):
+    worker = MetadataWorkers.pop(generation, None)
+    if worker is not None and generation == S3Object.metadataGeneration:
+        worker.listed.pop("Loading", None)
+        worker.listed["Error"] = message
+        show_properties(worker.listed)
+
+def delete_objects_from_indexes(indexes):
+    # one confirmation for the whole selection, Dir rows are deleted with everything below them
+    keys = []
+    prefixes = []
+    for index in indexes:
+        obj_key = currentPrefix + index.siblingAtColumn(0).data()
+        if index.data(SizeRole) < 0:
+            prefixes.append(obj_key)
+        else:
+            keys.append(obj_key)
+    if not keys and not prefixes:
+        return False
+    if 1 == len(keys) + len(prefixes):
+        text = "Do you want to delete {0}".format((keys + prefixes)[0])
+    else:
+        counts = []
+        if keys:
+            counts.append("{0} objects".format(len(keys)))
+        if prefixes:
+            counts.append("{0} folders".format(len(prefixes)))
+        text = "Do you want to delete {0}".format(" and ".join(counts))
+    if prefixes:
+        text += "?\nEverything under the selected folders will be deleted."
+    ret = QMessageBox.warning(None, "Delete Object", text,
                               QMessageBox.Yes | QMessageBox.No,
                               QMessageBox.Yes)
-    if ret == QMessageBox.Yes:
-        print("delete {0}".format(obj_key))
-        s3.delete_object(
-            Bucket = currentBucket,
-            Key = obj_key
-        )
-    update_objects_listview()
+    if ret != QMessageBox.Yes:
+        return False
+    print("delete {0} objects and {1} folders".format(len(keys), len(prefixes)))
+    S3Tasks.delete_objects(currentBucket, currentPrefix, keys, prefixes)
+    return True
+
+def copy_objects_from_indexes(indexes, dst_bucket, dst_prefix, move=False):
+    # server-side, Dir rows are copied with everything below them
+    keys = []
+    prefixes = []
+    for index in indexes:
+        obj_key = currentPrefix + index.siblingAtColumn(0).data()
+        size = index.data(SizeRole)
+        if size < 0:
+            prefixes.append(obj_key)
+        else:
+            keys.append((obj_key, size))
+    if not keys and not prefixes:
+        return False
+    if "" != dst_prefix and not dst_prefix.endswith("/"):
+        dst_prefix += "/"
+    if dst_bucket == currentBucket:
+        if dst_prefix == currentPrefix:
+            QMessageBox.warning(None, "Copy Object", "The objects are already in s3://{0}/{1}".format(dst_bucket, dst_prefix))
+            return False
+        inside = [p for p in prefixes if dst_prefix.startswith(p)]
+        if inside:
+            QMessageBox.warning(None, "Copy Object", "Cannot copy {0} into itself".format(inside[0]))
+            return False
+    print("{0} {1} objects and {2} folders to s3://{3}/{4}".format("move" if move else "copy", len(keys),
+                                                                  len(prefixes), dst_bucket, dst_prefix))
+    S3Tasks.copy_objects(currentBucket, currentPrefix, keys, prefixes, dst_bucket, dst_prefix, move)
+    return True
+
+def rename_object_from_index(index, name):
+    old_name = index.siblingAtColumn(0).data()
+    size = index.data(SizeRole)
+    # folders keep their trailing "/"
+    name = name.strip("/")
+    if size < 0:
+        name += "/"
+    if "" == name.strip("/") or name == old_name:
+        return False
+    S3Tasks.rename_object(currentBucket, currentPrefix + old_name, currentPrefix + name, max(size, 0))
+    return True
 
 def download_objects_from_indexes(indexes, dir):
     for index in indexes:
-        item = ObjectsModel.itemFromIndex(index)
-        obj_name = item.text()
-        obj_size = int(S3Object.currentObjectList[obj_name]["Size"])
+        obj_name = index.siblingAtColumn(0).data()
+        obj_size = index.data(SizeRole)
         obj_key = currentPrefix + obj_name
-        S3Tasks.download_file(currentBucket, obj_key, dir, obj_name, obj_size)
+        if obj_size < 0:
+            S3Tasks.download_prefix(currentBucket, obj_key, dir)
+        else:
+            S3Tasks.download_file(currentBucket, obj_key, dir, obj_name, obj_size)
 
 def create_folder(bucket, prefix, dir):
     if not dir.endswith('/'):
         dir = dir + '/'
-    s3.put_object(Body="", Bucket=bucket, Key=prefix+dir)
+    S3Client.for_bucket(bucket).put_object(Body="", Bucket=bucket, Key=prefix+dir)
+    KeyIndex.Index.put(bucket, prefix+dir, 0, time.time())
+    invalidate_listing(bucket, prefix)
+
 
+class ListSignals(QObject):
+    page_ready = Signal(int, object)
+    finished = Signal(int)
+    failed = Signal(int, str)
+
+class ListWorker(QRunnable):
+    def __init__(self, generation, bucketName, Delimiter, Prefix, prefetch=False, stale=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = ListSignals()
+        self.generation = generation
+        self.bucketName = bucketName
+        self.delimiter = Delimiter
+        self.prefix = Prefix
+        self.prefetch = prefetch
+        # the catalog listing on screen, replaced once the new listing is complete
+        self.stale = stale
+        # the whole listing, handed to the cache once it has been walked to the end
+        self.columns = ObjectColumns()
+        self.complete = False
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            for page in S3Engine.iter_object_pages(self.bucketName, Delimiter=self.delimiter, Prefix=self.prefix):
+                if self._cancelled.is_set():
+                    return
+                columns = ObjectColumns()
+                for obj in page.values():
+                    columns.append_object(obj)
+                self.columns.extend(columns)
+                if not self.prefetch and self.stale is None:
+                    self.signals.page_ready.emit(self.generation, columns)
+            self.complete = True
+            if not self.prefetch and "/" == self.delimiter:
+                S3Catalog.Catalog.put_listing(self.bucketName, self.prefix, len(self.columns), self.columns.dump())
+        except (ClientError, BotoCoreError) as e:
+            self.signals.failed.emit(self.generation, str(e))
+        finally:
+            self.signals.finished.emit(self.generation)
+
+
+class InventoryListWorker(QRunnable):
+    # a folder of a loaded inventory, paged like a listing; the folder totals are
+    # handed over with the last page
+    def __init__(self, generation, inventory, Prefix):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = ListSignals()
+        self.generation = generation
+        self.inventory = inventory
+        self.bucketName = inventory.bucket
+        self.prefix = Prefix
+        self.prefetch = False
+        # name -> (report time, SizeTotals) of the subfolders
+        self.sizes = {}
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            columns = ObjectColumns()
+            for item in self.inventory.iter_children(self.prefix):
+                if self._cancelled.is_set():
+                    return
+                if "Dir" == item[0]:
+                    columns.append(item[1])
+                else:
+                    _, key, size, mtime, storageClass, etag = item
+                    columns.append(key[len(self.prefix):], size, mtime, storageClass, etag)
+                if len(columns) >= Inventory.PAGE_ROWS:
+                    self.signals.page_ready.emit(self.generation, columns)
+                    columns = ObjectColumns()
+            self.signals.page_ready.emit(self.generation, columns)
+            self.sizes = {name: (self.inventory.created, totals)
+                          for name, totals in self.inventory.children_totals(self.prefix).items()}
+        except sqlite3.Error as e:
+            self.signals.failed.emit(self.generation, str(e))
+        finally:
+            self.signals.finished.emit(self.generation)
+
+
+class MetadataSignals(QObject):
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+class MetadataWorker(QRunnable):
+    def __init__(self, generation, bucketName, key, etag, isDir, listed):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = MetadataSignals()
+        self.generation = generation
+        self.bucketName = bucketName
+        self.key = key
+        self.etag = etag
+        self.isDir = isDir
+        # the listing's properties, shown together with the fetched ones
+        self.listed = listed
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        if self._cancelled.is_set():
+            self.signals.failed.emit(self.generation, "cancelled")
+            return
+        try:
+            if self.isDir:
+                properties = fetch_prefix_summary(self.bucketName, self.key, self._cancelled.is_set)
+                if properties is None:
+                    self.signals.failed.emit(self.generation, "cancelled")
+                    return
+            else:
+                properties = fetch_object_metadata(self.bucketName, self.key)
+        except (ClientError, BotoCoreError) as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.finished.emit(self.generation, properties)
 
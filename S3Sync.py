@@ -0,0 +1,187 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+
+import S3Config
+import S3Engine
+import TransferScheduler
+
+UPLOAD = "Upload"
+DOWNLOAD = "Download"
+DELETE_REMOTE = "Delete Remote"
+DELETE_LOCAL = "Delete Local"
+
+MB = 1024 * 1024
+HASH_BLOCK = 1024 * 1024
+
+
+class LocalIndex:
+    # remembers the ETag computed for (path, chunksize) while size and mtime are unchanged
+    def __init__(self, path=None):
+        if path is None:
+            path = S3Config.db_path("sync_index.db")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                chunksize INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                PRIMARY KEY (path, chunksize))""")
+
+    def etag(self, path, chunksize):
+        st = os.stat(path)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, etag FROM files WHERE path = ? AND chunksize = ?",
+                                   (path, chunksize)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        etag = compute_etag(path, chunksize)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                             (path, chunksize, st.st_size, st.st_mtime_ns, etag))
+        return etag
+
+
+def compute_etag(path, chunksize):
+    # chunksize 0 is a single PUT (plain MD5), otherwise the multipart ETag
+    whole = hashlib.md5()
+    parts = []
+    part = hashlib.md5()
+    in_part = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK if 0 == chunksize else min(HASH_BLOCK, chunksize - in_part))
+            if not block:
+                break
+            if 0 == chunksize:
+                whole.update(block)
+                continue
+            part.update(block)
+            in_part += len(block)
+            if in_part == chunksize:
+                parts.append(part.digest())
+                part = hashlib.md5()
+                in_part = 0
+    if 0 == chunksize:
+        return whole.hexdigest()
+    if in_part or not parts:
+        parts.append(part.digest())
+    return "{0}-{1}".format(hashlib.md5(b"".join(parts)).hexdigest(), len(parts))
+
+
+def etag_chunksize(etag, size):
+    # the part size a remote ETag was most likely produced with
+    if "-" not in etag:
+        return 0
+    count = int(etag.rsplit("-", 1)[1])
+    default = TransferScheduler.MULTIPART_CHUNKSIZE
+    if math.ceil(size / default) == count:
+        return default
+    return max(1, math.ceil(size / count / MB)) * MB
+
+
+def same_content(index, path, size, etag):
+    etag = etag.strip('"')
+    try:
+        return index.etag(path, etag_chunksize(etag, size)) == etag
+    except OSError:
+        return False
+
+
+def iter_local(local_dir):
+    for path, size in S3Engine.iter_local_files(local_dir):
+        rel = os.path.relpath(path, local_dir).replace(os.sep, '/')
+        yield rel, path, size
+
+
+def plan_sync(bucket, prefix, local_dir, direction, delete=False, index=None):
+    # returns the list of actions that would make the destination match the source
+    if index is None:
+        index = LocalIndex()
+    remote = {}
+    for obj in S3Engine.iter_prefix_objects(bucket, prefix):
+        rel = obj["Key"][len(prefix):]
+        if "" == rel or rel.endswith('/'):
+            continue
+        remote[rel] = obj
+    local = {}
+    for rel, path, size in iter_local(local_dir):
+        local[rel] = (path, size, os.path.getmtime(path))
+
+    plan = []
+    if UPLOAD == direction:
+        for rel, (path, size, mtime) in local.items():
+            obj = remote.get(rel)
+            if obj is None:
+                reason = "new"
+            elif obj["Size"] != size:
+                reason = "size"
+            elif mtime <= obj["LastModified"].timestamp():
+                continue
+            elif same_content(index, path, size, obj["ETag"]):
+                continue
+            else:
+                reason = "changed"
+            plan.append({"Action": UPLOAD, "Path": rel, "Key": prefix + rel, "LocalPath": path,
+                         "Size": size, "Reason": reason})
+        if delete:
+            for rel in remote.keys() - local.keys():
+                plan.append({"Action": DELETE_REMOTE, "Path": rel, "Key": prefix + rel, "LocalPath": "",
+                             "Size": remote[rel]["Size"], "Reason": "extraneous"})
+    else:
+        for rel, obj in remote.items():
+            target = S3Engine.local_target(local_dir, rel)
+            if target is None:
+                print("skipped {0}, it would be written outside {1}".format(obj["Key"], local_dir))
+                continue
+            entry = local.get(rel)
+            if entry is None:
+                reason = "new"
+            elif entry[1] != obj["Size"]:
+                reason = "size"
+            elif obj["LastModified"].timestamp() <= entry[2]:
+                continue
+            elif same_content(index, entry[0], entry[1], obj["ETag"]):
+                continue
+            else:
+                reason = "changed"
+            plan.append({"Action": DOWNLOAD, "Path": rel, "Key": obj["Key"],
+                         "LocalPath": target,
+                         "Size": obj["Size"], "Reason": reason})
+        if delete:
+            for rel in local.keys() - remote.keys():
+                plan.append({"Action": DELETE_LOCAL, "Path": rel, "Key": "", "LocalPath": local[rel][0],
+                             "Size": local[rel][1], "Reason": "extraneous"})
+    plan.sort(key=lambda action: action["Path"])
+    return plan
+
+
+def run_plan(engine, bucket, local_dir, plan):
+    # queues the transfers on engine and returns once the remote deletes are done,
+    # engine.wait_idle() waits for the transfers
+    remote_deletes = []
+    for action in plan:
+        if UPLOAD == action["Action"]:
+            engine.scheduler.wait_for_capacity(S3Engine.MAX_QUEUED_TRANSFERS)
+            engine.upload_file(bucket, action["Key"], action["LocalPath"], action["Size"])
+        elif DOWNLOAD == action["Action"]:
+            engine.scheduler.wait_for_capacity(S3Engine.MAX_QUEUED_TRANSFERS)
+            engine.download_file(bucket, action["Key"], os.path.dirname(action["LocalPath"]),
+                                 os.path.basename(action["LocalPath"]), action["Size"])
+        elif DELETE_LOCAL == action["Action"]:
+            try:
+                os.remove(action["LocalPath"])
+            except OSError as e:
+                print("delete {0} failed: {1}".format(action["LocalPath"], e))
+        elif DELETE_REMOTE == action["Action"]:
+            remote_deletes.append({"Key": action["Key"]})
+    if remote_deletes:
+        batches = [remote_deletes[i:i + S3Engine.DELETE_BATCH_SIZE]
+                   for i in range(0, len(remote_deletes), S3Engine.DELETE_BATCH_SIZE)]
+        return S3Engine.delete_objects_pipelined(bucket, batches)
+    return 0, 0
@@ -1,137 +1,674 @@
 import threading
-import sys
-import boto3
-from PySide6.QtGui import QStandardItemModel, QStandardItem, QIcon
-from PySide6.QtCore import QObject, Signal, Slot, Qt, QSize
+import time
+from collections import OrderedDict
+from botocore.exceptions import BotoCoreError, ClientError
+from PySide6.QtCore import QObject, QTimer, Signal, Slot, Qt, QSize
 from PySide6.QtWidgets import QStyledItemDelegate, QStyleOptionProgressBar, QApplication, QStyle
-from datetime import datetime
+import FolderSize
+import Inventory
+import KeyIndex
+import S3Engine
 import S3Object
+import S3Sync
+from S3Engine import FINISHED_STATES
+from ObjectTableModel import format_size
+from TaskTableModel import TaskTableModel, ProgressRole
+from TransferScheduler import QUEUED, COMPLETED, FAILED, CANCELLED
+
+# the Qt side of S3Engine: engine events become rows of TasksModel
 
-TasksModel = QStandardItemModel(0, 6)
 Tasks = {}
-s3 = boto3.client('s3')
+ArchivedTasks = OrderedDict()
+TasksModel = TaskTableModel(Tasks)
+# running transfers, their progress is read when the flush timer fires
+_progress = {}
+_dirty = set()
+_new_tasks = []
+_dirty_lock = threading.Lock()
+flushTimer = None
+# running size computations and inventory loads, cancelled through their event
+_size_cancels = {}
+# callbacks of running cleanup and index tasks, kept alive until their queued signals arrive
+_callbacks = {}
 
-def update_tasks():
-    # TasksModel.setHorizontalHeaderLabels(["Task", "Size", "%", "Progress", "Status", "Speed"])
-    TasksModel.setRowCount(0)
-    for task in Tasks.values():
-        item_task = QStandardItem(task["Task"])
-        item_size = QStandardItem(task["Size"])
-        item_p = QStandardItem(task["%"])
-        item_progress = QStandardItem()
-        item_progress.setData(task["Progress"], Qt.UserRole+1000)
-        item_status = QStandardItem(task["Status"])
-        item_speed = QStandardItem(task["Speed"])
-        TasksModel.appendRow([item_task, item_size, item_p,
-                              item_progress, item_status, item_speed])
-
-
-def add_upload_task(task):
-    i = TasksModel.rowCount()
-    item_task = QStandardItem(task["Task"])
-    item_size = QStandardItem(task["Size"])
-    item_p = QStandardItem(task["%"])
-    item_progress = QStandardItem(task["Progress"])
-    item_status = QStandardItem(task["Status"])
-    item_speed = QStandardItem(task["Speed"])
-    TasksModel.setItem(i, 0, item_task)
-    TasksModel.setItem(i, 1, item_size)
-    TasksModel.setItem(i, 2, item_p)
-    TasksModel.setItem(i, 3, item_progress)
-    TasksModel.setItem(i, 4, item_status)
-    TasksModel.setItem(i, 5, item_speed)
-    index_p = item_p.index()
-    index_progress = item_progress.index()
-    return index_p, index_progress
-
-
-def upload_file(bucket, key, file, size):
+PROGRESS_FLUSH_MS = 100
+MAX_FINISHED_TASKS = 100
+MAX_ARCHIVED_TASKS = 10000
+
+def start_flush_timer():
+    # called on the GUI thread once the application exists, before any task is added
+    global flushTimer
+    if flushTimer is None:
+        flushTimer = QTimer()
+        flushTimer.setInterval(PROGRESS_FLUSH_MS)
+        flushTimer.timeout.connect(flush_progress)
+        flushTimer.start()
+
+def add_task(task_id, task):
+    # safe from any thread, the row is inserted on the next flush
+    Tasks[task_id] = task
+    with _dirty_lock:
+        _new_tasks.append(task_id)
+
+def task_changed(task_id):
+    # safe from any thread, the row is repainted on the next flush
+    with _dirty_lock:
+        _dirty.add(task_id)
+
+def flush_progress():
+    global _dirty, _new_tasks
+    with _dirty_lock:
+        task_ids, _dirty = _dirty, set()
+        new_tasks, _new_tasks = _new_tasks, []
+    TasksModel.add_tasks([task_id for task_id in new_tasks if task_id in Tasks])
+    if not task_ids:
+        return
+    for task_id in task_ids:
+        _refresh_progress(task_id)
+    TasksModel.tasks_updated(task_ids)
+
+def _refresh_progress(task_id):
+    transfer_callback = _progress.get(task_id)
+    task = Tasks.get(task_id)
+    if transfer_callback is None or task is None:
+        return
+    transferred, speed = transfer_callback.snapshot()
+    target = transfer_callback.target_size
+    task["%"] = f"{(transferred / target) * 100:.2f}%"
+    if transfer_callback.ranges_total:
+        task["%"] += f" ({transfer_callback.ranges_done}/{transfer_callback.ranges_total} ranges)"
+    task["Progress"] = int(transferred / target * 100)
+    if speed is not None:
+        task["Speed"] = f"{(speed / 1024):.2f}KB/s"
+
+def _task_done(task_id):
+    _refresh_progress(task_id)
+    _progress.pop(task_id, None)
+    _size_cancels.pop(task_id, None)
+    _callbacks.pop(task_id, None)
+    TasksModel.tasks_updated([task_id])
+    archive_finished()
+
+def archive_finished():
+    # keep the live table small, only the newest finished tasks stay visible
+    finished = [task_id for task_id in TasksModel.task_ids() if Tasks[task_id]["Status"] in FINISHED_STATES]
+    if len(finished) <= MAX_FINISHED_TASKS:
+        return
+    excess = finished[:len(finished) - MAX_FINISHED_TASKS]
+    TasksModel.remove_tasks(excess)
+    for task_id in excess:
+        ArchivedTasks[task_id] = Tasks.pop(task_id)
+    while len(ArchivedTasks) > MAX_ARCHIVED_TASKS:
+        ArchivedTasks.popitem(last=False)
+
+def new_task_id():
+    return Engine.new_task_id()
+
+def task_id_at(row):
+    return TasksModel.task_id(row)
+
+def upload_file(bucket, key, file, size, priority=0, journal_id=None):
+    return Engine.upload_file(bucket, key, file, size, priority, journal_id)
+
+def download_file(currentBucket, obj_key, dir, file_name, obj_size, priority=0, journal_id=None):
+    return Engine.download_file(currentBucket, obj_key, dir, file_name, obj_size, priority, journal_id)
+
+def resume_journal():
+    Engine.resume_journal()
+
+def _cleanup_task(title, noun):
+    task_id = new_task_id()
+    _task = {
+        "Type": "Cleanup",
+        "Bucket": "",
+        "Key": "",
+        "Task": title,
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    add_task(task_id, _task)
+    cleanup_callback = CleanupCallback(task_id, noun)
+    cleanup_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    cleanup_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    _callbacks[task_id] = cleanup_callback
+    return cleanup_callback
+
+def discard_journal():
+    # aborts the journaled multipart uploads and removes partial downloads
+    cleanup_callback = _cleanup_task("Discard unfinished transfers", "transfers")
+    threading.Thread(target=_discard_journal, args=(cleanup_callback,), daemon=True).start()
+    return cleanup_callback
+
+def _discard_journal(cleanup_callback):
+    try:
+        Engine.discard_journal(progress=cleanup_callback)
+    except Exception as e:
+        cleanup_callback.task_failed.emit(cleanup_callback.task_id, str(e))
+        return
+    cleanup_callback.task_finished.emit(cleanup_callback.task_id)
+
+def find_stale_uploads(bucket, found):
+    # found(bucket, uploads) is called on the GUI thread once the listing is done
+    cleanup_callback = _cleanup_task("Find incomplete uploads in " + bucket, "uploads")
+    cleanup_callback.uploads_found.connect(found, type=Qt.QueuedConnection)
+    threading.Thread(target=_find_stale_uploads, args=(cleanup_callback, bucket), daemon=True).start()
+    return cleanup_callback
+
+def _find_stale_uploads(cleanup_callback, bucket):
+    try:
+        uploads = Engine.list_stale_uploads(bucket)
+    except Exception as e:
+        cleanup_callback.task_failed.emit(cleanup_callback.task_id, str(e))
+        return
+    cleanup_callback(len(uploads))
+    # before finishing, which drops the callback
+    cleanup_callback.uploads_found.emit(bucket, uploads)
+    cleanup_callback.task_finished.emit(cleanup_callback.task_id)
+
+def abort_stale_uploads(bucket, uploads):
+    cleanup_callback = _cleanup_task("Abort {0} incomplete uploads in {1}".format(len(uploads), bucket), "uploads")
+    threading.Thread(target=_abort_stale_uploads, args=(cleanup_callback, bucket, uploads), daemon=True).start()
+    return cleanup_callback
+
+def _abort_stale_uploads(cleanup_callback, bucket, uploads):
+    try:
+        Engine.abort_stale_uploads(bucket, uploads, progress=cleanup_callback)
+    except Exception as e:
+        cleanup_callback.task_failed.emit(cleanup_callback.task_id, str(e))
+        return
+    cleanup_callback.task_finished.emit(cleanup_callback.task_id)
+
+def upload_folder(bucket, prefix, folder):
+    threading.Thread(target=_upload_folder, args=(bucket, prefix, folder), daemon=True).start()
+
+def _upload_folder(bucket, prefix, folder):
+    Engine.upload_folder(bucket, prefix, folder)
+
+def download_prefix(bucket, prefix, dir):
+    threading.Thread(target=_download_prefix, args=(bucket, prefix, dir), daemon=True).start()
+
+def _download_prefix(bucket, prefix, dir):
+    try:
+        Engine.download_prefix(bucket, prefix, dir)
+    except (ClientError, BotoCoreError) as e:
+        print("list {0} failed: {1}".format(prefix, e))
+
+def run_sync_plan(bucket, local_dir, plan):
+    threading.Thread(target=_run_sync_plan, args=(bucket, local_dir, plan), daemon=True).start()
+
+def _run_sync_plan(bucket, local_dir, plan):
+    try:
+        S3Sync.run_plan(Engine, bucket, local_dir, plan)
+    except (ClientError, BotoCoreError) as e:
+        print("sync {0} failed: {1}".format(local_dir, e))
+
+def pause_task(task_id):
+    Engine.pause(task_id)
+
+def resume_task(task_id):
+    Engine.resume(task_id)
+
+def cancel_task(task_id):
+    if task_id in _size_cancels:
+        _size_cancels[task_id].set()
+        return
+    Engine.cancel(task_id)
+
+def prioritize_task(task_id):
+    Engine.prioritize(task_id)
+
+def delete_bucket(bucket):
+    task_id = new_task_id()
+    _task = {
+        "Type": "DeleteBucket",
+        "Bucket": bucket,
+        "Key": "",
+        "Task": "Delete bucket " + bucket,
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    add_task(task_id, _task)
+    delete_callback = DeleteCallback(task_id)
+    delete_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    delete_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    threading.Thread(target=_delete_bucket, args=(delete_callback, bucket)).start()
+    return delete_callback
+
+def delete_objects(bucket, prefix, keys, prefixes):
+    # one task for the whole selection, prefixes are deleted recursively
+    task_id = new_task_id()
+    names = [key[len(prefix):] for key in list(keys) + list(prefixes)]
+    if 1 == len(names):
+        title = "Delete s3://{0}/{1}{2}".format(bucket, prefix, names[0])
+    else:
+        title = "Delete {0} items in s3://{1}/{2}".format(len(names), bucket, prefix)
     _task = {
-        "Task": key,
-        "Size": str(size),
-        "%": 0,
-        "Progress": 0,
+        "Type": "Delete",
+        "Bucket": bucket,
+        "Key": prefix,
+        "Recursive": 0 != len(prefixes),
+        "Task": title,
+        "Size": "",
+        "%": "",
+        "Progress": None,
         "Status": "Started",
         "Speed": ""
     }
-    Tasks[file] = _task
-    transfer_callback = TransferCallback(file, size)
-    transfer_callback.task_percentageChanged.connect(on_update, type=Qt.QueuedConnection)
-    transfer_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
-    threading.Thread(target=_upload, args=(transfer_callback, bucket, key, file, size)).start()
+    add_task(task_id, _task)
+    delete_callback = DeleteCallback(task_id)
+    delete_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    delete_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    threading.Thread(target=_delete_objects, args=(delete_callback, bucket, keys, prefixes), daemon=True).start()
+    return delete_callback
 
+def copy_objects(bucket, prefix, keys, prefixes, dst_bucket, dst_prefix, move=False):
+    # keys are (key, size) of the selection in prefix, every item keeps its name under
+    # dst_prefix; each object is a Copy task of its own, this task sums them up
+    task_id = new_task_id()
+    names = [key[len(prefix):] for key, _ in keys] + [p[len(prefix):] for p in prefixes]
+    if 1 == len(names):
+        source = "s3://{0}/{1}{2}".format(bucket, prefix, names[0])
+    else:
+        source = "{0} items in s3://{1}/{2}".format(len(names), bucket, prefix)
+    title = "{0} {1} to s3://{2}/{3}".format("Move" if move else "Copy", source, dst_bucket, dst_prefix)
+    _task = {
+        "Type": "CopyBatch",
+        "Bucket": dst_bucket,
+        "Key": dst_prefix,
+        "SourceBucket": bucket,
+        "SourceKey": prefix,
+        "Move": move,
+        "Task": title,
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    return _start_copy(task_id, _task, bucket, keys, prefixes, dst_bucket, prefix, dst_prefix, move)
 
-def _upload(transfer_callback, bucket, key, file, size):
-    transfer_callback.task_started.emit()
-    s3.upload_file(file, bucket, key, Callback=transfer_callback)
-    transfer_callback.task_finished.emit(file)
+def rename_object(bucket, key, new_key, size=0):
+    # a folder is renamed with everything under it, keys ending in "/" are folders
+    task_id = new_task_id()
+    _task = {
+        "Type": "CopyBatch",
+        "Bucket": bucket,
+        "Key": S3Engine.parent_prefix(new_key),
+        "SourceBucket": bucket,
+        "SourceKey": S3Engine.parent_prefix(key),
+        "Move": True,
+        "Task": "Rename s3://{0}/{1} to {2}".format(bucket, key, new_key),
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    if key.endswith("/"):
+        keys, prefixes = [], [key]
+    else:
+        keys, prefixes = [(key, size)], []
+    return _start_copy(task_id, _task, bucket, keys, prefixes, bucket, key, new_key, True)
 
-def download_file(currentBucket, obj_key, dir, file_name, obj_size):
+def _start_copy(task_id, task, bucket, keys, prefixes, dst_bucket, base, dst_prefix, move):
+    add_task(task_id, task)
+    copy_callback = CopyCallback(task_id)
+    copy_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    copy_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    threading.Thread(target=_copy_objects,
+                     args=(copy_callback, bucket, keys, prefixes, dst_bucket, base, dst_prefix, move),
+                     daemon=True).start()
+    return copy_callback
+
+def _copy_objects(copy_callback, bucket, keys, prefixes, dst_bucket, base, dst_prefix, move):
+    try:
+        Engine.copy_objects(bucket, keys, prefixes, dst_bucket, base, dst_prefix, move, progress=copy_callback)
+    except Exception as e:
+        copy_callback.task_failed.emit(copy_callback.task_id, str(e))
+        return
+    copy_callback.task_finished.emit(copy_callback.task_id)
+
+def compute_folder_size(bucket, prefix):
+    # "" is the whole bucket
+    task_id = new_task_id()
     _task = {
-        "Task": obj_key,
-        "Size": str(obj_size),
-        "%": 0,
-        "Progress": 0,
+        "Type": "Size",
+        "Bucket": bucket,
+        "Key": prefix,
+        "Task": "Size of s3://{0}/{1}".format(bucket, prefix),
+        "Size": "",
+        "%": "",
+        "Progress": None,
         "Status": "Started",
         "Speed": ""
     }
-    Tasks[obj_key] = _task
-    transfer_callback = TransferCallback(obj_key, obj_size)
-    transfer_callback.task_percentageChanged.connect(on_update, type=Qt.QueuedConnection)
-    transfer_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
-    threading.Thread(target=_download, args=(transfer_callback, currentBucket,
-                                             obj_key, dir, file_name, obj_size)).start()
-
-def _download(transfer_callback, currentBucket, obj_key, dir, file_name, obj_size):
-    transfer_callback.task_started.emit()
-    s3.download_file(currentBucket, obj_key, dir+'/'+file_name, Callback=transfer_callback)
-    transfer_callback.task_finished.emit(obj_key)
+    add_task(task_id, _task)
+    size_callback = SizeCallback(task_id)
+    size_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    size_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    _size_cancels[task_id] = size_callback.cancelled
+    threading.Thread(target=_compute_folder_size, args=(size_callback, bucket, prefix), daemon=True).start()
+    return size_callback
+
+def _compute_folder_size(size_callback, bucket, prefix):
+    try:
+        result = FolderSize.compute(bucket, prefix, progress=size_callback, cancelled=size_callback.cancelled)
+    except Exception as e:
+        size_callback.task_failed.emit(size_callback.task_id, str(e))
+        return
+    if result is None:
+        SchedulerEvents.task_stateChanged.emit(size_callback.task_id, CANCELLED, "")
+        return
+    size_callback.task_finished.emit(size_callback.task_id)
+
+def build_index(bucket):
+    # a full listing into the search index, one at a time per bucket
+    for task in Tasks.values():
+        if "Index" == task["Type"] and bucket == task["Bucket"] and task["Status"] not in FINISHED_STATES:
+            return None
+    task_id = new_task_id()
+    _task = {
+        "Type": "Index",
+        "Bucket": bucket,
+        "Key": "",
+        "Task": "Index keys of " + bucket,
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    add_task(task_id, _task)
+    index_callback = IndexCallback(task_id)
+    index_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    index_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    _size_cancels[task_id] = index_callback.cancelled
+    _callbacks[task_id] = index_callback
+    threading.Thread(target=_build_index, args=(index_callback, bucket), daemon=True).start()
+    return index_callback
+
+def _build_index(index_callback, bucket):
+    try:
+        built = KeyIndex.build_index(bucket, progress=index_callback, cancelled=index_callback.cancelled)
+    except Exception as e:
+        index_callback.task_failed.emit(index_callback.task_id, str(e))
+        return
+    if not built:
+        SchedulerEvents.task_stateChanged.emit(index_callback.task_id, CANCELLED, "")
+        return
+    index_callback.task_finished.emit(index_callback.task_id)
+
+def load_inventory(bucket, location):
+    # location is the manifest.json of an inventory report of bucket, local or s3://
+    task_id = new_task_id()
+    _task = {
+        "Type": "Inventory",
+        "Bucket": bucket,
+        "Key": "",
+        "Task": "Load inventory of {0} from {1}".format(bucket, location),
+        "Size": "",
+        "%": "",
+        "Progress": None,
+        "Status": "Started",
+        "Speed": ""
+    }
+    add_task(task_id, _task)
+    inventory_callback = InventoryCallback(task_id)
+    inventory_callback.task_finished.connect(on_finished, type=Qt.QueuedConnection)
+    inventory_callback.task_failed.connect(on_failed, type=Qt.QueuedConnection)
+    _size_cancels[task_id] = inventory_callback.cancelled
+    threading.Thread(target=_load_inventory, args=(inventory_callback, bucket, location), daemon=True).start()
+    return inventory_callback
+
+def _load_inventory(inventory_callback, bucket, location):
+    try:
+        inventory = Inventory.load(location, progress=inventory_callback, cancelled=inventory_callback.cancelled)
+        if inventory is not None and inventory.bucket != bucket:
+            raise ValueError("the report is an inventory of {0}".format(inventory.bucket))
+    except Exception as e:
+        inventory_callback.task_failed.emit(inventory_callback.task_id, str(e))
+        return
+    if inventory is None:
+        SchedulerEvents.task_stateChanged.emit(inventory_callback.task_id, CANCELLED, "")
+        return
+    Inventory.Loaded.put(inventory)
+    inventory_callback.task_finished.emit(inventory_callback.task_id)
+
+def _delete_objects(delete_callback, bucket, keys, prefixes):
+    delete_callback.task_started.emit()
+    try:
+        S3Engine.delete_objects(bucket, keys, prefixes, progress=delete_callback)
+    except Exception as e:
+        delete_callback.task_failed.emit(delete_callback.task_id, str(e))
+        return
+    delete_callback.task_finished.emit(delete_callback.task_id)
+
+def _delete_bucket(delete_callback, bucket):
+    delete_callback.task_started.emit()
+    try:
+        S3Engine.delete_bucket(bucket, progress=delete_callback)
+    except Exception as e:
+        delete_callback.task_failed.emit(delete_callback.task_id, str(e))
+        return
+    delete_callback.task_finished.emit(delete_callback.task_id)
+
+@Slot()
+def on_state_changed(task_id, state, error):
+    if COMPLETED == state:
+        on_finished(task_id)
+    elif FAILED == state:
+        on_failed(task_id, error)
+    elif CANCELLED == state:
+        Tasks[task_id]["Status"] = state
+        _task_done(task_id)
+    else:
+        Tasks[task_id]["Status"] = state
+        TasksModel.tasks_updated([task_id])
 
 @Slot()
-def on_update():
-    update_tasks()
+def on_finished(task_id):
+    task = Tasks[task_id]
+    task["Status"] = COMPLETED
+    _task_done(task_id)
+    # downloads leave the bucket unchanged
+    if task["Type"] in ("Upload", "Copy"):
+        S3Object.request_refresh(task["Bucket"], S3Engine.parent_prefix(task["Key"]))
+    elif "Delete" == task["Type"]:
+        _refresh_deleted(task)
+    elif "CopyBatch" == task["Type"]:
+        _refresh_copied(task)
+    elif "Size" == task["Type"]:
+        S3Object.show_folder_sizes(task["Bucket"])
+    elif "Inventory" == task["Type"] and task["Bucket"] == S3Object.currentBucket:
+        S3Object.update_objects_listview()
 
 @Slot()
-def on_finished(file):
-    Tasks[file]["Status"] = "Completed"
-    update_tasks()
-    S3Object.update_objects_listview()
+def on_failed(task_id, message):
+    task = Tasks[task_id]
+    task["Status"] = FAILED
+    print("{0} failed: {1}".format(task["Task"], message))
+    _task_done(task_id)
+    # part of the selection may be gone already
+    if "Delete" == task["Type"]:
+        _refresh_deleted(task)
+    elif "CopyBatch" == task["Type"]:
+        _refresh_copied(task)
 
-class TransferCallback(QObject):
+def _refresh_copied(task):
+    # copied folders add listings below the destination, moves empty the source ones
+    S3Object.invalidate_listing(task["Bucket"])
+    S3Object.request_refresh(task["Bucket"], task["Key"])
+    if task["Move"]:
+        S3Object.invalidate_listing(task["SourceBucket"])
+        S3Object.request_refresh(task["SourceBucket"], task["SourceKey"])
+
+def _refresh_deleted(task):
+    if task["Recursive"]:
+        # listings below the deleted folders are stale as well
+        S3Object.invalidate_listing(task["Bucket"])
+    S3Object.request_refresh(task["Bucket"], task["Key"])
+
+class DeleteCallback(QObject):
     task_started = Signal()
     task_finished = Signal(str)
-    task_percentageChanged = Signal()
+    task_failed = Signal(str, str)
 
-    def __init__(self, target_file, target_size, parent=None):
+    def __init__(self, task_id, parent=None):
         super().__init__(parent)
-        self.__target_size = target_size
-        self.__target_file = target_file
-        self._total_transferred = 0
-        self.__start_time = datetime.now()
-        self._lock = threading.Lock()
-        self.thread_info = {}
-
-    def __call__(self, bytes_transferred):
-        thread = threading.current_thread()
-        with self._lock:
-            cur_time = datetime.now()
-            interval_time = (cur_time - self.__start_time).seconds
-            self._total_transferred += bytes_transferred
-            if 0 != interval_time:
-                speed = self._total_transferred / interval_time
-                Tasks[self.__target_file]["Speed"] = f"{(speed / 1024):.2f}KB/s"
-            if thread.ident not in self.thread_info.keys():
-                self.thread_info[thread.ident] = bytes_transferred
-            else:
-                self.thread_info[thread.ident] += bytes_transferred
-            target = self.__target_size
-            Tasks[self.__target_file]["%"] = f"{(self._total_transferred / target) * 100:.2f}%"
-            Tasks[self.__target_file]["Progress"] = int(self._total_transferred / target * 100)
-            self.task_percentageChanged.emit()
+        self.task_id = task_id
+        self.__start_time = time.monotonic()
+
+    def __call__(self, deleted, failed):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = f"{deleted} objects"
+        if failed:
+            task["%"] = f"{failed} failed"
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(deleted / elapsed):.1f} obj/s"
+        task_changed(self.task_id)
+
+class SizeCallback(QObject):
+    task_finished = Signal(str)
+    task_failed = Signal(str, str)
+
+    def __init__(self, task_id, parent=None):
+        super().__init__(parent)
+        self.task_id = task_id
+        self.cancelled = threading.Event()
+        self.__start_time = time.monotonic()
+
+    def __call__(self, totals):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = format_size(totals.bytes)
+        task["%"] = f"{totals.objects} objects"
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(totals.objects / elapsed):.0f} obj/s"
+        task_changed(self.task_id)
+
+class CleanupCallback(QObject):
+    task_finished = Signal(str)
+    task_failed = Signal(str, str)
+    uploads_found = Signal(str, object)
+
+    def __init__(self, task_id, noun, parent=None):
+        super().__init__(parent)
+        self.task_id = task_id
+        self.noun = noun
+        self.__start_time = time.monotonic()
+
+    def __call__(self, done):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = f"{done} {self.noun}"
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(done / elapsed):.1f} {self.noun}/s"
+        task_changed(self.task_id)
+
+class IndexCallback(QObject):
+    task_finished = Signal(str)
+    task_failed = Signal(str, str)
+
+    def __init__(self, task_id, parent=None):
+        super().__init__(parent)
+        self.task_id = task_id
+        self.cancelled = threading.Event()
+        self.__start_time = time.monotonic()
+
+    def __call__(self, keys):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = f"{keys} keys"
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(keys / elapsed):.0f} keys/s"
+        task_changed(self.task_id)
+
+class InventoryCallback(QObject):
+    task_finished = Signal(str)
+    task_failed = Signal(str, str)
+
+    def __init__(self, task_id, parent=None):
+        super().__init__(parent)
+        self.task_id = task_id
+        self.cancelled = threading.Event()
+        self.__start_time = time.monotonic()
+
+    def __call__(self, rows, files, of):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = f"{rows} objects"
+        task["%"] = f"{files}/{of} files"
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(rows / elapsed):.0f} obj/s"
+        task_changed(self.task_id)
+
+class CopyCallback(QObject):
+    task_finished = Signal(str)
+    task_failed = Signal(str, str)
+
+    def __init__(self, task_id, parent=None):
+        super().__init__(parent)
+        self.task_id = task_id
+        self.__start_time = time.monotonic()
+
+    def __call__(self, copied, failed, deleted):
+        elapsed = time.monotonic() - self.__start_time
+        task = Tasks[self.task_id]
+        task["Size"] = f"{copied} objects"
+        counts = [f"{failed} failed"] if failed else []
+        if task["Move"]:
+            counts.append(f"{deleted} deleted")
+        task["%"] = ", ".join(counts)
+        task["Status"] = "Running"
+        if elapsed > 0:
+            task["Speed"] = f"{(copied / elapsed):.1f} obj/s"
+        task_changed(self.task_id)
+
+class SchedulerSignals(QObject):
+    task_stateChanged = Signal(str, str, str)
+
+class GuiListener(S3Engine.EngineListener):
+    # runs on engine threads, the model only changes on the next flush
+    def task_added(self, task_id, task, progress):
+        _progress[task_id] = progress
+        title = task["Key"]
+        if "SourceKey" in task:
+            title = "Copy s3://{0}/{1} to s3://{2}/{3}".format(task["SourceBucket"], task["SourceKey"],
+                                                               task["Bucket"], task["Key"])
+        add_task(task_id, {
+            "Type": task["Type"],
+            "Bucket": task["Bucket"],
+            "Key": task["Key"],
+            "JournalId": task["JournalId"],
+            "Task": title,
+            "Size": str(task["Size"]),
+            "%": 0,
+            "Progress": 0,
+            "Status": QUEUED,
+            "Speed": ""
+        })
+
+    def task_progress(self, task_id):
+        task_changed(task_id)
+
+    def task_state(self, task_id, state, error):
+        SchedulerEvents.task_stateChanged.emit(task_id, state, error)
 
 class ProgressDelegate(QStyledItemDelegate):
     def paint(self, painter, option, index):
-        progress = index.data(Qt.UserRole + 1000)
+        progress = index.data(ProgressRole)
         if index.column() == 3 and progress != None:
             opt = QStyleOptionProgressBar()
             opt.rect = option.rect
@@ -146,3 +683,10 @@ class ProgressDelegate(QStyledItemDelegate):
             painter.restore()
         else:
             QStyledItemDelegate.paint(self, painter, option, index)
+
+
+SchedulerEvents = SchedulerSignals()
+SchedulerEvents.task_stateChanged.connect(on_state_changed, type=Qt.QueuedConnection)
+Engine = S3Engine.TransferEngine(listener=GuiListener())
+Scheduler = Engine.scheduler
+Journal = Engine.journal
@@ -0,0 +1,143 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtWidgets import QDialog, QDialogButtonBox, QVBoxLayout, QLabel, QWidget, \
+    QLineEdit, QHBoxLayout, QComboBox, QCheckBox, QPushButton, QFileDialog, QTableWidget, \
+    QTableWidgetItem, QHeaderView, QAbstractItemView
+
+import S3Sync
+from ObjectTableModel import format_size
+
+
+# keeps workers alive when the dialog is closed before they finish
+_running = set()
+
+
+class PlanSignals(QObject):
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class PlanWorker(QRunnable):
+    def __init__(self, bucket, prefix, local_dir, direction, delete):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = PlanSignals()
+        self.args = (bucket, prefix, local_dir, direction, delete)
+
+    def run(self):
+        try:
+            plan = S3Sync.plan_sync(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            _running.discard(self)
+        self.signals.finished.emit(plan)
+
+
+class SyncDialog(QDialog):
+    def __init__(self, bucket, prefix, parent=None):
+        super().__init__(parent)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.plan = None
+        self.worker = None
+
+        self.setWindowTitle("Sync s3://{0}/{1}".format(bucket, prefix))
+        self.resize(720, 480)
+        QBtn = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
+
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.button(QDialogButtonBox.Ok).setText("Sync")
+        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+
+        self.layout = QVBoxLayout()
+
+        folderWidget = QWidget()
+        folderLabel = QLabel("Local Folder: ")
+        self.folderInput = QLineEdit()
+        browseButton = QPushButton("Browse...")
+        browseButton.clicked.connect(self.browse)
+        folderLayout = QHBoxLayout()
+        folderLayout.addWidget(folderLabel)
+        folderLayout.addWidget(self.folderInput)
+        folderLayout.addWidget(browseButton)
+        folderWidget.setLayout(folderLayout)
+
+        optionWidget = QWidget()
+        self.directionSelect = QComboBox()
+        self.directionSelect.addItem("Local folder -> S3", S3Sync.UPLOAD)
+        self.directionSelect.addItem("S3 -> Local folder", S3Sync.DOWNLOAD)
+        self.deleteCheck = QCheckBox("Delete extraneous files")
+        self.previewButton = QPushButton("Preview")
+        self.previewButton.clicked.connect(self.preview)
+        optionLayout = QHBoxLayout()
+        optionLayout.addWidget(self.directionSelect)
+        optionLayout.addWidget(self.deleteCheck)
+        optionLayout.addWidget(self.previewButton)
+        optionWidget.setLayout(optionLayout)
+
+        self.planTable = QTableWidget(0, 4)
+        self.planTable.setHorizontalHeaderLabels(["Action", "Path", "Size", "Reason"])
+        self.planTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.planTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.summaryLabel = QLabel("")
+
+        # any option change invalidates the preview
+        self.folderInput.textChanged.connect(self.clear_plan)
+        self.directionSelect.currentIndexChanged.connect(self.clear_plan)
+        self.deleteCheck.stateChanged.connect(self.clear_plan)
+
+        self.layout.addWidget(folderWidget)
+        self.layout.addWidget(optionWidget)
+        self.layout.addWidget(self.planTable)
+        self.layout.addWidget(self.summaryLabel)
+        self.layout.addWidget(self.buttonBox)
+        self.setLayout(self.layout)
+
+    def browse(self):
+        folder = QFileDialog.getExistingDirectory(self, caption="Local Folder",
+                                                  options=QFileDialog.ShowDirsOnly | QFileDialog.DontResolveSymlinks)
+        if "" != folder:
+            self.folderInput.setText(folder)
+
+    def clear_plan(self):
+        self.plan = None
+        self.planTable.setRowCount(0)
+        self.summaryLabel.setText("")
+        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
+
+    def preview(self):
+        if "" == self.folderInput.text():
+            return
+        self.clear_plan()
+        self.previewButton.setEnabled(False)
+        self.summaryLabel.setText("Comparing...")
+        self.worker = PlanWorker(self.bucket, self.prefix, self.folderInput.text(),
+                                 self.directionSelect.currentData(), self.deleteCheck.isChecked())
+        self.worker.signals.finished.connect(self.on_plan, type=Qt.QueuedConnection)
+        self.worker.signals.failed.connect(self.on_plan_failed, type=Qt.QueuedConnection)
+        _running.add(self.worker)
+        QThreadPool.globalInstance().start(self.worker)
+
+    def on_plan(self, plan):
+        self.previewButton.setEnabled(True)
+        self.plan = plan
+        self.planTable.setRowCount(len(plan))
+        for i, action in enumerate(plan):
+            self.planTable.setItem(i, 0, QTableWidgetItem(action["Action"]))
+            self.planTable.setItem(i, 1, QTableWidgetItem(action["Path"]))
+            self.planTable.setItem(i, 2, QTableWidgetItem(format_size(action["Size"])))
+            self.planTable.setItem(i, 3, QTableWidgetItem(action["Reason"]))
+        total = sum(action["Size"] for action in plan
+                    if action["Action"] in (S3Sync.UPLOAD, S3Sync.DOWNLOAD))
+        self.summaryLabel.setText("{0} actions, {1} to transfer".format(len(plan), format_size(total)))
+        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(0 != len(plan))
+
+    def on_plan_failed(self, message):
+        self.previewButton.setEnabled(True)
+        self.summaryLabel.setText("Compare failed: {0}".format(message))
+
+    def get_sync_plan(self):
+        return self.folderInput.text(), self.plan
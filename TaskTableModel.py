@@ -0,0 +1,81 @@
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+HEADERS = ["Task", "Size", "%", "Progress", "Status", "Speed"]
+FIELDS = ["Task", "Size", "%", "Progress", "Status", "Speed"]
+
+# value painted by ProgressDelegate in the Progress column
+ProgressRole = Qt.UserRole + 1000
+
+
+class TaskTableModel(QAbstractTableModel):
+    # rows are task ids in insertion order, cells are read from the shared task dicts
+    def __init__(self, tasks, parent=None):
+        super().__init__(parent)
+        self._tasks = tasks
+        self._ids = []
+        self._rows = {}
+
+    def add_tasks(self, task_ids):
+        if not task_ids:
+            return
+        first = len(self._ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(task_ids) - 1)
+        for row, task_id in enumerate(task_ids, first):
+            self._ids.append(task_id)
+            self._rows[task_id] = row
+        self.endInsertRows()
+
+    def remove_tasks(self, task_ids):
+        rows = sorted((self._rows[task_id] for task_id in task_ids if task_id in self._rows), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._ids[row]
+            self.endRemoveRows()
+        self._rows = {task_id: row for row, task_id in enumerate(self._ids)}
+
+    def tasks_updated(self, task_ids):
+        rows = [self._rows[task_id] for task_id in task_ids if task_id in self._rows]
+        if not rows:
+            return
+        self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(HEADERS) - 1))
+
+    def task_id(self, row):
+        if 0 <= row < len(self._ids):
+            return self._ids[row]
+        return None
+
+    def task_ids(self):
+        return list(self._ids)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        task = self._tasks[self._ids[index.row()]]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if 3 == column:
+                return None
+            return str(task[FIELDS[column]])
+        if role == ProgressRole and 3 == column:
+            return task["Progress"]
+        return None
@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+import time
+
+import S3Config
+
+UPLOAD = "Upload"
+DOWNLOAD = "Download"
+
+
+class TransferJournal:
+    # every queued transfer is recorded until it completes or is cancelled; multipart
+    # uploads also keep their upload id and finished parts, downloads their finished
+    # byte ranges, so an interrupted transfer resumes where it stopped
+    def __init__(self, path=None):
+        if path is None:
+            path = S3Config.db_path("transfers.db")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS transfers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                upload_id TEXT,
+                chunksize INTEGER,
+                etag TEXT,
+                created REAL NOT NULL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS parts (
+                transfer_id INTEGER NOT NULL,
+                part_number INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                PRIMARY KEY (transfer_id, part_number))""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS ranges (
+                transfer_id INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                PRIMARY KEY (transfer_id, start))""")
+
+    def add(self, kind, bucket, key, local_path, size):
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO transfers (kind, bucket, key, local_path, size, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, bucket, key, local_path, size, time.time()))
+            return cursor.lastrowid
+
+    def get(self, transfer_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, bucket, key, local_path, size, upload_id, chunksize, etag, created "
+                "FROM transfers WHERE id = ?", (transfer_id,)).fetchone()
+        return _entry(row)
+
+    def pending(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, bucket, key, local_path, size, upload_id, chunksize, etag, created "
+                "FROM transfers ORDER BY id").fetchall()
+        return [_entry(row) for row in rows]
+
+    def remove(self, transfer_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM parts WHERE transfer_id = ?", (transfer_id,))
+            self._db.execute("DELETE FROM ranges WHERE transfer_id = ?", (transfer_id,))
+            self._db.execute("DELETE FROM transfers WHERE id = ?", (transfer_id,))
+
+    def set_upload(self, transfer_id, upload_id, chunksize):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM parts WHERE transfer_id = ?", (transfer_id,))
+            self._db.execute("UPDATE transfers SET upload_id = ?, chunksize = ? WHERE id = ?",
+                             (upload_id, chunksize, transfer_id))
+
+    def add_part(self, transfer_id, part_number, etag):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO parts VALUES (?, ?, ?)", (transfer_id, part_number, etag))
+
+    def parts(self, transfer_id):
+        with self._lock:
+            rows = self._db.execute("SELECT part_number, etag FROM parts WHERE transfer_id = ?",
+                                    (transfer_id,)).fetchall()
+        return dict(rows)
+
+    def set_download(self, transfer_id, etag, chunksize):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM ranges WHERE transfer_id = ?", (transfer_id,))
+            self._db.execute("UPDATE transfers SET etag = ?, chunksize = ? WHERE id = ?",
+                             (etag, chunksize, transfer_id))
+
+    def add_range(self, transfer_id, start, end):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO ranges VALUES (?, ?, ?)", (transfer_id, start, end))
+
+    def ranges(self, transfer_id):
+        with self._lock:
+            rows = self._db.execute("SELECT start, end FROM ranges WHERE transfer_id = ? ORDER BY start",
+                                    (transfer_id,)).fetchall()
+        return rows
+
+    def upload_ids(self, bucket):
+        with self._lock:
+            rows = self._db.execute("SELECT upload_id FROM transfers WHERE bucket = ? AND upload_id IS NOT NULL",
+                                    (bucket,)).fetchall()
+        return {row[0] for row in rows}
+
+
+def _entry(row):
+    if row is None:
+        return None
+    keys = ("Id", "Type", "Bucket", "Key", "LocalPath", "Size", "UploadId", "ChunkSize", "ETag", "Created")
+    return dict(zip(keys, row))
+
+
+def list_multipart_uploads(s3, bucket):
+    uploads = []
+    paginator = s3.get_paginator('list_multipart_uploads')
+    for response in paginator.paginate(Bucket=bucket):
+        uploads.extend(response.get("Uploads", []))
+    return uploads
+
+
+def abort_multipart_uploads(s3, bucket, uploads, progress=None):
+    # progress(aborted) is called after each upload
+    aborted = 0
+    for upload in uploads:
+        s3.abort_multipart_upload(Bucket=bucket, Key=upload["Key"], UploadId=upload["UploadId"])
+        aborted += 1
+        if progress is not None:
+            progress(aborted)
+    return aborted
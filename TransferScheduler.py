@@ -0,0 +1,180 @@
+import itertools
+import queue
+import threading
+
+from boto3.s3.transfer import TransferConfig
+
+MAX_CONCURRENT_FILES = 4
+MAX_CONCURRENT_PARTS = 32
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+QUEUED = "Queued"
+RUNNING = "Running"
+PAUSED = "Paused"
+COMPLETED = "Completed"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+class TransferJob:
+    def __init__(self, task_id, run, priority=0):
+        self.task_id = task_id
+        # run(job) does the transfer on a scheduler worker thread
+        self.run = run
+        self.priority = priority
+        self.state = QUEUED
+        self.error = ""
+        self.cancelled = False
+        self._seq = None
+        self._resume = threading.Event()
+        self._resume.set()
+
+    def checkpoint(self):
+        # called from transfer threads between chunks, blocks while paused
+        if self.cancelled:
+            raise TransferCancelled()
+        self._resume.wait()
+        if self.cancelled:
+            raise TransferCancelled()
+
+
+class TransferScheduler:
+    # a fixed pool of workers running queued jobs by priority (lower first);
+    # every job shares one TransferConfig so that files * parts stays bounded
+    def __init__(self, maxFiles=MAX_CONCURRENT_FILES, maxParts=MAX_CONCURRENT_PARTS, listener=None):
+        self.maxFiles = maxFiles
+        self.config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=max(1, maxParts // maxFiles),
+            use_threads=True
+        )
+        # listener(job) is called from worker threads on every state change
+        self.listener = listener
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        # queued, running and paused jobs, finished ones are dropped
+        self._jobs = {}
+        # task ids of the paused jobs, which take no capacity
+        self._paused = set()
+        self._lock = threading.Lock()
+        self._capacity = threading.Condition(self._lock)
+        self._workers = []
+
+    def submit(self, job):
+        with self._lock:
+            self._jobs[job.task_id] = job
+            job.state = QUEUED
+            self._put(job)
+            if len(self._workers) < self.maxFiles:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+        self._notify(job)
+
+    def job(self, task_id):
+        return self._jobs.get(task_id)
+
+    def wait_for_capacity(self, limit):
+        # lets producers of many jobs stay a bounded distance ahead of the workers;
+        # paused jobs are left out, a producer must not wait for the user to resume
+        with self._capacity:
+            while len(self._jobs) - len(self._paused) >= limit:
+                self._capacity.wait()
+
+    def set_priority(self, task_id, priority):
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None:
+                return
+            job.priority = priority
+            if QUEUED == job.state:
+                self._put(job)
+
+    def pause(self, task_id):
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None or job.state not in (QUEUED, RUNNING):
+                return
+            if RUNNING == job.state:
+                job._resume.clear()
+            else:
+                # dropped from the queue, resume puts it back
+                job._seq = None
+            job.state = PAUSED
+            self._paused.add(task_id)
+            self._capacity.notify_all()
+        self._notify(job)
+
+    def resume(self, task_id):
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None or PAUSED != job.state:
+                return
+            self._paused.discard(task_id)
+            if job._resume.is_set():
+                job.state = QUEUED
+                self._put(job)
+            else:
+                job.state = RUNNING
+                job._resume.set()
+        self._notify(job)
+
+    def cancel(self, task_id):
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is None or job.state in (COMPLETED, FAILED, CANCELLED):
+                return
+            job.cancelled = True
+            running = not job._resume.is_set() or RUNNING == job.state
+            job._resume.set()
+            if not running:
+                job._seq = None
+                job.state = CANCELLED
+                self._finish(job)
+        if not running:
+            self._notify(job)
+
+    def _put(self, job):
+        job._seq = next(self._seq)
+        self._queue.put((job.priority, job._seq, job))
+
+    def _work(self):
+        while True:
+            _, seq, job = self._queue.get()
+            with self._lock:
+                # stale entry of a re-prioritised, paused or cancelled job
+                if seq != job._seq or QUEUED != job.state:
+                    continue
+                job._seq = None
+                job.state = RUNNING
+            self._notify(job)
+            try:
+                job.run(job)
+                state = COMPLETED
+            except TransferCancelled:
+                state = CANCELLED
+            except Exception as e:
+                if job.cancelled:
+                    state = CANCELLED
+                else:
+                    job.error = str(e)
+                    state = FAILED
+            with self._lock:
+                job.state = state
+                self._finish(job)
+            self._notify(job)
+
+    def _finish(self, job):
+        self._jobs.pop(job.task_id, None)
+        self._paused.discard(job.task_id)
+        self._capacity.notify_all()
+
+    def _notify(self, job):
+        if self.listener is not None:
+            self.listener(job)
@@ -0,0 +1,247 @@
+# Benchmarks against a local S3 stand-in (moto_server or MinIO), for example:
+#   moto_server -p 5000 &
+#   python benchmark.py --endpoint http://127.0.0.1:5000 --output bench.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+POPULATE_WORKERS = 32
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="S3Tools benchmarks against a local S3-compatible server")
+    parser.add_argument("--endpoint", default=os.environ.get("AWS_ENDPOINT_URL", "http://127.0.0.1:5000"))
+    parser.add_argument("--bucket", default="s3tools-bench")
+    parser.add_argument("--output", default="benchmark-{0}.json".format(time.strftime("%Y%m%d-%H%M%S")))
+    parser.add_argument("--only", default="list,tasks,transfer,delete",
+                        help="comma separated benchmarks: list, tasks, transfer, delete")
+    parser.add_argument("--list-sizes", default="10000,100000,1000000")
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--callbacks", type=int, default=1000000)
+    parser.add_argument("--small-files", type=int, default=200)
+    parser.add_argument("--small-size", type=int, default=64 * 1024)
+    parser.add_argument("--large-files", type=int, default=2)
+    parser.add_argument("--large-size", type=int, default=128 * 1024 * 1024)
+    parser.add_argument("--delete-keys", type=int, default=100000)
+    return parser.parse_args()
+
+
+def setup_environment(args, config_dir):
+    # must run before the S3Tools modules are imported
+    os.environ["AWS_ENDPOINT_URL"] = args.endpoint
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ["S3TOOLS_CONFIG_DIR"] = config_dir
+
+
+def run_until(app, done, timeout):
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark step did not finish in {0}s".format(timeout))
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def ensure_bucket(bucket):
+    import S3Bucket
+    import S3Client
+    try:
+        S3Client.client().head_bucket(Bucket=bucket)
+    except Exception:
+        S3Bucket.new_bucket(bucket, S3Client.DEFAULT_REGION)
+
+
+def populate(bucket, prefix, count):
+    # empty objects, skipped when a marker says an earlier run already wrote them
+    import S3Client
+    s3 = S3Client.for_bucket(bucket)
+    marker = "bench-meta/{0}ready-{1}".format(prefix.replace("/", "_"), count)
+    try:
+        s3.head_object(Bucket=bucket, Key=marker)
+        return
+    except Exception:
+        pass
+    keys = ["{0}key{1:08d}".format(prefix, i) for i in range(count)]
+    with ThreadPoolExecutor(max_workers=POPULATE_WORKERS) as executor:
+        list(executor.map(lambda key: s3.put_object(Bucket=bucket, Key=key, Body=b""), keys, chunksize=256))
+    s3.put_object(Bucket=bucket, Key=marker, Body=b"")
+
+
+def bench_list(app, args, results):
+    import S3Engine
+    import S3Object
+    for count in [int(n) for n in args.list_sizes.split(",") if n]:
+        prefix = "list-{0}/".format(count)
+        populate(args.bucket, prefix, count)
+
+        start = time.perf_counter()
+        objects = S3Engine.list_objects(args.bucket, Prefix=prefix)
+        listed = time.perf_counter() - start
+        results.append({"name": "list_objects", "keys": count, "rows": len(objects), "seconds": listed,
+                        "keys_per_second": count / listed})
+
+        S3Object.ListingsCache.clear()
+        start = time.perf_counter()
+        S3Object.update_objects_model(args.bucket, app.style(), Prefix=prefix, cached=False)
+        generation = S3Object.viewGeneration
+        run_until(app, lambda: generation not in S3Object.ListWorkers, 3600)
+        modelled = time.perf_counter() - start
+        results.append({"name": "update_objects_model", "keys": count, "rows": S3Object.ObjectsModel.rowCount(),
+                        "seconds": modelled, "keys_per_second": count / modelled})
+        S3Object.update_objects_model("", app.style())
+
+
+def bench_tasks(app, args, results):
+    # many threads reporting progress for many tasks while the GUI thread flushes
+    import S3Engine
+    import S3Tasks
+    callbacks = []
+    for i in range(args.tasks):
+        task_id = S3Tasks.new_task_id()
+        S3Tasks.add_task(task_id, {"Type": "Upload", "Bucket": args.bucket, "Key": "storm", "Task": "storm " + task_id,
+                                   "Size": "1", "%": 0, "Progress": 0, "Status": "Running", "Speed": ""})
+        callback = S3Engine.TransferProgress(task_id, args.callbacks, S3Tasks.task_changed)
+        S3Tasks._progress[task_id] = callback
+        callbacks.append(callback)
+    threads = 8
+    per_thread = args.callbacks // threads
+
+    def storm(offset):
+        for i in range(per_thread):
+            callbacks[(offset + i) % len(callbacks)](1)
+
+    workers = [threading.Thread(target=storm, args=(n * 7919,)) for n in range(threads)]
+    stalls = []
+    last = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        stalls.append(now - last[0])
+        last[0] = now
+
+    from PySide6.QtCore import QTimer
+    timer = QTimer()
+    timer.setInterval(10)
+    timer.timeout.connect(tick)
+    timer.start()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    run_until(app, lambda: not any(worker.is_alive() for worker in workers), 3600)
+    elapsed = time.perf_counter() - start
+    timer.stop()
+    S3Tasks.flush_progress()
+    results.append({"name": "tasks_progress_storm", "tasks": args.tasks, "callbacks": per_thread * threads,
+                    "threads": threads, "seconds": elapsed, "callbacks_per_second": per_thread * threads / elapsed,
+                    "rows": S3Tasks.TasksModel.rowCount(), "max_event_loop_stall_ms": max(stalls or [0]) * 1000})
+    for callback in callbacks:
+        S3Tasks._progress.pop(callback.task_id, None)
+
+
+def transfer(app, label, ids, count, size, seconds, results):
+    import S3Tasks
+
+    def status(task_id):
+        task = S3Tasks.Tasks.get(task_id) or S3Tasks.ArchivedTasks.get(task_id)
+        return task["Status"]
+
+    run_until(app, lambda: all(status(task_id) in S3Tasks.FINISHED_STATES for task_id in ids), 3600)
+    elapsed = time.perf_counter() - seconds
+    failed = sum(1 for task_id in ids if status(task_id) != S3Tasks.COMPLETED)
+    results.append({"name": label, "files": count, "file_size": size, "failed": failed, "seconds": elapsed,
+                    "files_per_second": count / elapsed, "mb_per_second": count * size / elapsed / 1024 / 1024})
+
+
+def bench_transfer(app, args, results, workdir):
+    import S3Tasks
+    for kind, count, size in (("small", args.small_files, args.small_size), ("large", args.large_files, args.large_size)):
+        if 0 == count:
+            continue
+        src = os.path.join(workdir, "src-" + kind)
+        dst = os.path.join(workdir, "dst-" + kind)
+        os.makedirs(src, exist_ok=True)
+        block = os.urandom(min(size, 1024 * 1024))
+        for i in range(count):
+            with open(os.path.join(src, "f{0}".format(i)), "wb") as f:
+                written = 0
+                while written < size:
+                    f.write(block[:size - written])
+                    written += min(len(block), size - written)
+        start = time.perf_counter()
+        ids = [S3Tasks.upload_file(args.bucket, "transfer-{0}/f{1}".format(kind, i), os.path.join(src, "f{0}".format(i)),
+                                   size) for i in range(count)]
+        transfer(app, "upload_" + kind, ids, count, size, start, results)
+        start = time.perf_counter()
+        ids = [S3Tasks.download_file(args.bucket, "transfer-{0}/f{1}".format(kind, i), dst, "f{0}".format(i), size)
+               for i in range(count)]
+        transfer(app, "download_" + kind, ids, count, size, start, results)
+
+
+def bench_delete(app, args, results):
+    import S3Engine
+    bucket = args.bucket + "-delete"
+    ensure_bucket(bucket)
+    populate(bucket, "", args.delete_keys)
+    start = time.perf_counter()
+    S3Engine.delete_bucket(bucket)
+    elapsed = time.perf_counter() - start
+    results.append({"name": "delete_bucket", "keys": args.delete_keys, "seconds": elapsed,
+                    "keys_per_second": args.delete_keys / elapsed})
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    only = set(args.only.split(","))
+    with tempfile.TemporaryDirectory() as workdir:
+        setup_environment(args, os.path.join(workdir, "config"))
+        from PySide6.QtWidgets import QApplication
+        app = QApplication(sys.argv[:1])
+        import S3Tasks
+        S3Tasks.start_flush_timer()
+        ensure_bucket(args.bucket)
+        results = []
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "endpoint": args.endpoint,
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results,
+        }
+        if "list" in only:
+            bench_list(app, args, results)
+        if "tasks" in only:
+            bench_tasks(app, args, results)
+        if "transfer" in only:
+            bench_transfer(app, args, results, workdir)
+        if "delete" in only:
+            bench_delete(app, args, results)
+        import S3Metrics
+        report["requests"] = S3Metrics.ClientMetrics.snapshot()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        print(json.dumps(result))
+    print("written to {0}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
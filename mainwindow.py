@@ -6,30 +6,46 @@ from enum import Enum
 
 import boto3.resources.model
 from PySide6.QtWidgets import QApplication, QMainWindow, QAbstractItemView, QStyle, QFileDialog, \
-    QHeaderView, QInputDialog, QMessageBox, QCheckBox
-from PySide6.QtCore import QFile, QFileInfo
+    QHeaderView, QInputDialog, QMessageBox, QCheckBox, QMenu
+from PySide6.QtCore import QFile, QFileInfo, QTimer, Qt
+from PySide6.QtGui import QStandardItemModel, QStandardItem
 from PySide6.QtUiTools import QUiLoader
 
+import Inventory
+import KeyIndex
 import S3Bucket
+import S3Engine
+import S3Metrics
 import S3Object
 import S3Tasks
 from NewBucketDialog import NewBucketDialog
+from SyncDialog import SyncDialog
+from ObjectTableModel import SizeRole, format_size
 
 class TabIndex(Enum):
     PropertiesTabIndex = 0
     TasksTabIndex = 1
+    MetricsTabIndex = 2
+
+METRICS_HEADERS = ["Operation", "Calls", "Errors", "Retries", "Throttled", "Avg", "p50", "p95", "p99",
+                   "Bytes In", "Bytes Out"]
+METRICS_REFRESH_MS = 1000
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
         self.currentBucket = ""
         self.objPrefix = []
+        # a search result to select once its folder has been listed
+        self.pendingSelect = None
+        self.previewName = None
         self.load_ui()
         self.set_bucket_list()
         self.set_object_list()
         self.set_tab_list()
         self.setup_ui()
         self.connect_action()
+        QTimer.singleShot(0, self.OfferResume)
 
     def load_ui(self):
         loader = QUiLoader()
@@ -49,15 +65,23 @@ class MainWindow(QMainWindow):
         self.window.btnDelObject.setIcon(self.style().standardIcon(QStyle.SP_BrowserStop))
         self.window.btnRefleshObj.setIcon(self.style().standardIcon(QStyle.SP_BrowserReload))
         self.window.btnUploadObject.setIcon(self.style().standardIcon(QStyle.SP_ArrowUp))
+        self.window.btnUploadFolder.setIcon(self.style().standardIcon(QStyle.SP_DirIcon))
+        self.window.btnSyncObj.setIcon(self.style().standardIcon(QStyle.SP_BrowserReload))
         self.window.btnDownloadObject.setIcon(self.style().standardIcon(QStyle.SP_ArrowDown))
 
     def set_bucket_list(self):
-        self.btnBucketRefleshClick()
+        self.window.BucketlistView.setModel(S3Bucket.BucketsModel)
+        S3Bucket.update_buckets_model(self.style())
 
     def set_object_list(self):
-        self.window.ObjtableView.setModel(S3Object.ObjectsModel)
+        self.window.ObjtableView.setModel(S3Object.ObjectsProxyModel)
+        # listing order until a column header is clicked
+        self.window.ObjtableView.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.window.ObjtableView.setSortingEnabled(True)
         self.window.ObjtableView.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.window.ObjtableView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.window.ObjtableView.setContextMenuPolicy(Qt.CustomContextMenu)
+        S3Object.ObjectsModel.rowsInserted.connect(self.SelectPending)
 
     def set_tab_list(self):
         self.window.PropertiesTableView.setModel(S3Object.ObjectsPropertiesModel)
@@ -65,11 +89,22 @@ class MainWindow(QMainWindow):
 
         # Tasks list
         self.window.TaskListView.setModel(S3Tasks.TasksModel)
-        S3Tasks.TasksModel.setHorizontalHeaderLabels(["Task", "Size", "%", "Progress", "Status", "Speed"])
+        # tasks are added from worker threads too, the timer must exist first
+        S3Tasks.start_flush_timer()
         self.window.TaskListView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
         task_progress_delegate = S3Tasks.ProgressDelegate(self.window.TaskListView)
         self.window.TaskListView.setItemDelegateForColumn(3, task_progress_delegate)
-        # S3Tasks.update_tasks()
+        self.window.TaskListView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.window.TaskListView.setContextMenuPolicy(Qt.CustomContextMenu)
+
+        # Metrics, redrawn while the tab is visible
+        self.metricsModel = QStandardItemModel()
+        self.metricsModel.setHorizontalHeaderLabels(METRICS_HEADERS)
+        self.window.MetricsView.setModel(self.metricsModel)
+        self.window.MetricsView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.metricsTimer = QTimer(self)
+        self.metricsTimer.setInterval(METRICS_REFRESH_MS)
+        self.metricsTimer.timeout.connect(self.RefreshMetrics)
 
 
     def connect_action(self):
@@ -81,21 +116,40 @@ class MainWindow(QMainWindow):
         self.window.ObjtableView.clicked.connect(self.ObjListClick)
         self.window.btnPathUp.clicked.connect(self.PathUpClick)
         self.window.btnUploadObject.clicked.connect(self.UploadClick)
+        self.window.btnUploadFolder.clicked.connect(self.UploadFolderClick)
+        self.window.btnSyncObj.clicked.connect(self.SyncClick)
         self.window.btnRefleshObj.clicked.connect(self.ObjRefreshClick)
         self.window.btnDelObject.clicked.connect(self.ObjDeleteClick)
         self.window.btnDownloadObject.clicked.connect(self.ObjDownloadClick)
         self.window.btnNewObjFolder.clicked.connect(self.NewObjFolderClick)
+        self.window.btnPreviewObject.clicked.connect(self.PreviewClick)
+        self.window.TaskListView.customContextMenuRequested.connect(self.TaskContextMenu)
+        self.window.BucketlistView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.window.BucketlistView.customContextMenuRequested.connect(self.BucketContextMenu)
+        self.window.ObjtableView.customContextMenuRequested.connect(self.ObjContextMenu)
+        self.window.SearchInput.returnPressed.connect(self.SearchClick)
+        self.window.FilterInput.textChanged.connect(S3Object.ObjectsProxyModel.set_filter)
+        self.window.tabWidget.currentChanged.connect(self.TabChanged)
+        self.window.btnExportJson.clicked.connect(lambda: self.ExportMetrics("JSON (*.json)", S3Metrics.ClientMetrics.to_json))
+        self.window.btnExportPrometheus.clicked.connect(
+            lambda: self.ExportMetrics("Prometheus text (*.prom *.txt)", S3Metrics.ClientMetrics.to_prometheus))
+        self.window.btnResetMetrics.clicked.connect(self.ResetMetrics)
 
     # actions
     def btnBucketRefleshClick(self):
-        self.window.BucketlistView.setModel(S3Bucket.list_bucket_with_icon(self.style()))
+        S3Bucket.update_buckets_model(self.style(), cached=False)
 
     def BucketListClick(self, index):
         self.currentBucket = index.data()
         self.window.S3ObjPath.setText("")
         self.objPrefix = []
+        self.pendingSelect = None
+        self.window.SearchInput.clear()
+        self.window.SearchInput.setEnabled(True)
         S3Object.update_objects_model(index.data(), self.style())
         self.window.btnUploadObject.setEnabled(True)
+        self.window.btnUploadFolder.setEnabled(True)
+        self.window.btnSyncObj.setEnabled(True)
         self.window.btnRefleshObj.setEnabled(True)
         self.window.btnNewObjFolder.setEnabled(True)
         self.window.btnDelBucket.setEnabled(True)
@@ -113,11 +167,18 @@ class MainWindow(QMainWindow):
         cb.stateChanged.connect(lambda state: delButton.setEnabled(state))
         msgBox.exec()
         if (msgBox.clickedButton() == delButton):
-            S3Bucket.delete_bucket(self.currentBucket)
-            self.btnBucketRefleshClick()
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            deleted_bucket = self.currentBucket
+            delete_task = S3Tasks.delete_bucket(deleted_bucket)
+            delete_task.task_finished.connect(lambda _: self.BucketDeleted(deleted_bucket), type=Qt.QueuedConnection)
             self.currentBucket = ""
+            self.window.btnDelBucket.setEnabled(False)
             self.ObjRefreshClick()
 
+    def BucketDeleted(self, bucket):
+        S3Object.invalidate_listing(bucket)
+        self.btnBucketRefleshClick()
+
     def BucketNewClick(self):
         newBucketDlg = NewBucketDialog()
         if newBucketDlg.exec_():
@@ -131,12 +192,16 @@ class MainWindow(QMainWindow):
         model = index.model()
         name_index = index.siblingAtColumn(0)
         pathName = model.data(name_index)
-        if pathName.find('/') != -1:
+        if S3Object.searching:
+            self.OpenSearchResult(pathName)
+        elif index.data(SizeRole) < 0:
             currentPath = self.window.S3ObjPath.text()
             prefix = currentPath + pathName
             self.objPrefix.append(pathName)
             self.window.S3ObjPath.setText(prefix)
-            S3Object.update_objects_model(self.currentBucket, self.style(), Delimiter='', Prefix=prefix)
+            S3Object.update_objects_model(self.currentBucket, self.style(), Prefix=prefix)
+        else:
+            S3Object.preview_object(pathName, self)
 
     def ObjListClick(self, index):
         self.window.btnDelObject.setEnabled(True)
@@ -144,38 +209,60 @@ class MainWindow(QMainWindow):
         model = index.model()
         name_index = index.siblingAtColumn(0)
         obj_key = model.data(name_index)
+        self.previewName = None if S3Object.searching or index.data(SizeRole) < 0 else obj_key
+        self.window.btnPreviewObject.setEnabled(self.previewName is not None)
         # if obj_key.find('/') == -1:
         self.window.tabWidget.setCurrentIndex(TabIndex.PropertiesTabIndex.value)
         obj_key_full = self.window.S3ObjPath.text() + obj_key
         S3Object.update_object_properties_model(self.currentBucket, obj_key, obj_key_full)
 
+    def PreviewClick(self):
+        if self.previewName is not None:
+            S3Object.preview_object(self.previewName, self)
+
     def PathUpClick(self):
         curPath = self.window.S3ObjPath.text()
         upPath = "".join(self.objPrefix[0:len(self.objPrefix)-1])
         self.objPrefix = self.objPrefix[0:-1]
         self.window.S3ObjPath.setText(upPath)
-        S3Object.update_objects_model(self.currentBucket, self.style(), Delimiter='', Prefix=upPath)
+        S3Object.update_objects_model(self.currentBucket, self.style(), Prefix=upPath)
 
     def UploadClick(self):
-        fileName = QFileDialog.getOpenFileName(self, caption="Upload file", dir=".", filter="All Files (*.*)")
-        if not fileName[0] == "":
+        fileNames = QFileDialog.getOpenFileNames(self, caption="Upload file", dir=".", filter="All Files (*.*)")
+        prefix = self.window.S3ObjPath.text()
+        for fileName in fileNames[0]:
             # Upload file
-            fileInfo = QFileInfo(fileName[0])
+            fileInfo = QFileInfo(fileName)
             file = fileInfo.fileName()
             size = fileInfo.size()
-            prefix = self.window.S3ObjPath.text()
             key = prefix + file
-            S3Tasks.upload_file(self.currentBucket, key, fileName[0], size)
+            S3Tasks.upload_file(self.currentBucket, key, fileName, size)
+
+    def UploadFolderClick(self):
+        folder = QFileDialog.getExistingDirectory(self, caption="Upload Folder",
+                                                  options=QFileDialog.ShowDirsOnly | QFileDialog.DontResolveSymlinks)
+        if "" != folder:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            prefix = self.window.S3ObjPath.text()
+            S3Tasks.upload_folder(self.currentBucket, prefix, folder)
+
+    def SyncClick(self):
+        prefix = self.window.S3ObjPath.text()
+        syncDlg = SyncDialog(self.currentBucket, prefix, self)
+        if syncDlg.exec_():
+            local_dir, plan = syncDlg.get_sync_plan()
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.run_sync_plan(self.currentBucket, local_dir, plan)
 
     def ObjRefreshClick(self):
         obj_key_full = self.window.S3ObjPath.text()
-        S3Object.update_objects_model(self.currentBucket, self.style(), Delimiter='', Prefix=obj_key_full)
+        S3Object.update_objects_model(self.currentBucket, self.style(), Prefix=obj_key_full, cached=False)
 
     def ObjDeleteClick(self):
         model = self.window.ObjtableView.selectionModel()
         indexes = model.selectedRows()
-        for index in indexes:
-            S3Object.delete_object_with_item(index)
+        if S3Object.delete_objects_from_indexes(indexes):
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
 
     def ObjDownloadClick(self):
         download_dir = QFileDialog.getExistingDirectory(self, caption="Download File to ",
@@ -193,6 +280,240 @@ class MainWindow(QMainWindow):
             S3Object.create_folder(self.currentBucket, prefix, dir)
             self.ObjRefreshClick()
 
+    def SearchClick(self):
+        text = self.window.SearchInput.text().strip()
+        if "" == self.currentBucket:
+            return
+        if "" == text:
+            self.ObjRefreshClick()
+            return
+        pattern, after, before = KeyIndex.parse_query(text)
+        # the first search builds the index, later ones rebuild it once it is too old
+        building = KeyIndex.needs_build(self.currentBucket)
+        if building:
+            S3Tasks.build_index(self.currentBucket)
+        rows = KeyIndex.Index.search(self.currentBucket, pattern, after, before)
+        self.objPrefix = []
+        self.pendingSelect = None
+        self.window.S3ObjPath.setText("")
+        S3Object.show_search_results(self.currentBucket, self.style(), rows)
+        message = "{0} keys found".format(len(rows))
+        if len(rows) == KeyIndex.MAX_RESULTS:
+            message += " (first {0} shown)".format(KeyIndex.MAX_RESULTS)
+        if building:
+            message += ", the bucket is being indexed (see Tasks)"
+        self.window.statusbar.showMessage(message)
+
+    def OpenSearchResult(self, key):
+        # show the key in its folder
+        prefix = S3Engine.parent_prefix(key)
+        self.objPrefix = [part + "/" for part in prefix.split("/")[:-1]]
+        self.window.S3ObjPath.setText(prefix)
+        self.window.SearchInput.clear()
+        self.pendingSelect = key[len(prefix):]
+        S3Object.update_objects_model(self.currentBucket, self.style(), Prefix=prefix)
+
+    def SelectPending(self):
+        if self.pendingSelect is None:
+            return
+        row = S3Object.ObjectsModel.find(self.pendingSelect)
+        if -1 == row:
+            return
+        self.pendingSelect = None
+        index = S3Object.ObjectsProxyModel.mapFromSource(S3Object.ObjectsModel.index(row, 0))
+        if index.isValid():
+            self.window.ObjtableView.selectRow(index.row())
+            self.window.ObjtableView.scrollTo(index)
+
+    def TabChanged(self, index):
+        if TabIndex.MetricsTabIndex.value == index:
+            self.RefreshMetrics()
+            self.metricsTimer.start()
+        else:
+            self.metricsTimer.stop()
+
+    def RefreshMetrics(self):
+        snapshot = S3Metrics.ClientMetrics.snapshot()
+        self.window.MetricsSummary.setText(
+            "In flight: {0} calls, {1} HTTP requests (peak {2})".format(
+                snapshot["in_flight_calls"], snapshot["in_flight_requests"], snapshot["peak_requests"]))
+        rows = S3Metrics.ClientMetrics.rows()
+        self.metricsModel.setRowCount(len(rows))
+        for i, (name, stats) in enumerate(rows):
+            avg = stats.latencySum / stats.calls if stats.calls else 0
+            values = [name, stats.calls, stats.errors, stats.retries, stats.throttles,
+                      "{0:.0f} ms".format(avg * 1000)]
+            for q in (0.5, 0.95, 0.99):
+                bound = stats.quantile(q)
+                values.append("" if bound is None else "<= {0:g} ms".format(bound * 1000))
+            values += [format_size(stats.bytesIn), format_size(stats.bytesOut)]
+            for column, value in enumerate(values):
+                item = QStandardItem(str(value))
+                item.setEditable(False)
+                self.metricsModel.setItem(i, column, item)
+
+    def ExportMetrics(self, fileFilter, export):
+        fileName, _ = QFileDialog.getSaveFileName(self, caption="Export Metrics", dir=".", filter=fileFilter)
+        if "" != fileName:
+            with open(fileName, "w") as f:
+                f.write(export())
+
+    def ResetMetrics(self):
+        S3Metrics.ClientMetrics.reset()
+        self.RefreshMetrics()
+
+    def TaskContextMenu(self, pos):
+        rows = {index.row() for index in self.window.TaskListView.selectionModel().selectedRows()}
+        index = self.window.TaskListView.indexAt(pos)
+        if index.isValid():
+            rows.add(index.row())
+        task_ids = [S3Tasks.task_id_at(row) for row in sorted(rows)]
+        task_ids = [task_id for task_id in task_ids if task_id is not None]
+        if not task_ids:
+            return
+        menu = QMenu(self.window.TaskListView)
+        actions = {
+            menu.addAction("Pause"): S3Tasks.pause_task,
+            menu.addAction("Resume"): S3Tasks.resume_task,
+            menu.addAction("Cancel"): S3Tasks.cancel_task,
+            menu.addAction("Run Next"): S3Tasks.prioritize_task,
+        }
+        action = menu.exec(self.window.TaskListView.viewport().mapToGlobal(pos))
+        if action in actions:
+            for task_id in task_ids:
+                actions[action](task_id)
+
+    def BucketContextMenu(self, pos):
+        index = self.window.BucketlistView.indexAt(pos)
+        if not index.isValid():
+            return
+        menu = QMenu(self.window.BucketlistView)
+        sizeAction = menu.addAction("Compute Bucket Size")
+        abortAction = menu.addAction("Abort Incomplete Uploads...")
+        indexAction = menu.addAction("Build Search Index")
+        menu.addSeparator()
+        inventoryAction = menu.addAction("Browse From Inventory Report...")
+        unloadAction = None
+        if Inventory.Loaded.get(index.data()) is not None:
+            unloadAction = menu.addAction("Browse Live Listings")
+        action = menu.exec(self.window.BucketlistView.viewport().mapToGlobal(pos))
+        if action == sizeAction:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.compute_folder_size(index.data(), "")
+        elif action == abortAction:
+            self.AbortStaleUploads(index.data())
+        elif action == indexAction:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.build_index(index.data())
+        elif action == inventoryAction:
+            self.LoadInventory(index.data())
+        elif unloadAction is not None and action == unloadAction:
+            Inventory.Loaded.drop(index.data())
+            if index.data() == self.currentBucket:
+                self.ObjRefreshClick()
+
+    def LoadInventory(self, bucket):
+        # the manifest.json of a report, on disk or in its destination bucket
+        location, ok = QInputDialog.getText(self, "Inventory Report of " + bucket,
+                                            "manifest.json path or s3://bucket/.../manifest.json:")
+        location = location.strip()
+        if not ok or "" == location:
+            return
+        self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+        S3Tasks.load_inventory(bucket, location)
+
+    def ObjContextMenu(self, pos):
+        if "" == self.currentBucket or S3Object.searching:
+            return
+        prefix = self.window.S3ObjPath.text()
+        indexes = self.window.ObjtableView.selectionModel().selectedRows()
+        folders = [prefix + index.data() for index in indexes if index.data(SizeRole) < 0]
+        menu = QMenu(self.window.ObjtableView)
+        sizeAction = menu.addAction("Compute Folder Size" if folders else "Compute Size of This Folder")
+        copyAction = moveAction = renameAction = None
+        if indexes:
+            menu.addSeparator()
+            copyAction = menu.addAction("Copy To...")
+            moveAction = menu.addAction("Move To...")
+            if 1 == len(indexes):
+                renameAction = menu.addAction("Rename...")
+        action = menu.exec(self.window.ObjtableView.viewport().mapToGlobal(pos))
+        if action is None:
+            return
+        if action == sizeAction:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            for folder in folders or [prefix]:
+                S3Tasks.compute_folder_size(self.currentBucket, folder)
+        elif action in (copyAction, moveAction):
+            self.ObjCopyTo(indexes, action == moveAction)
+        elif action == renameAction:
+            self.ObjRename(indexes[0])
+
+    def ObjCopyTo(self, indexes, move):
+        title = "Move To" if move else "Copy To"
+        target, ok = QInputDialog.getText(self, title, "Destination (s3://bucket/prefix/):",
+                                          text="s3://{0}/{1}".format(self.currentBucket, self.window.S3ObjPath.text()))
+        if not ok or not target.startswith("s3://"):
+            return
+        dst_bucket, _, dst_prefix = target[len("s3://"):].partition("/")
+        if "" == dst_bucket:
+            return
+        if S3Object.copy_objects_from_indexes(indexes, dst_bucket, dst_prefix, move):
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+
+    def ObjRename(self, index):
+        name, ok = QInputDialog.getText(self, "Rename", "New name:", text=index.siblingAtColumn(0).data().rstrip("/"))
+        if ok and S3Object.rename_object_from_index(index, name):
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+
+    def AbortStaleUploads(self, bucket):
+        # listed on a worker, ConfirmAbortUploads asks once the listing is done
+        S3Tasks.find_stale_uploads(bucket, self.ConfirmAbortUploads)
+
+    def ConfirmAbortUploads(self, bucket, uploads):
+        if not uploads:
+            QMessageBox.information(self, "Incomplete Uploads", "No incomplete uploads in {0}".format(bucket))
+            return
+        ret = QMessageBox.question(self, "Incomplete Uploads",
+                                   "{0} incomplete multipart uploads in {1} are not resumable by any task.\n"
+                                   "Abort them and free their storage?".format(len(uploads), bucket))
+        if ret == QMessageBox.Yes:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.abort_stale_uploads(bucket, uploads)
+
+    def OfferResume(self):
+        pending = S3Tasks.Journal.pending()
+        if not pending:
+            return
+        # closing the prompt keeps the journal for the next start, only Discard drops it
+        msgBox = QMessageBox(self)
+        msgBox.setIcon(QMessageBox.Question)
+        msgBox.setWindowTitle("Resume Transfers")
+        msgBox.setText("{0} transfers did not finish last time. Resume them?".format(len(pending)))
+        resumeButton = msgBox.addButton("Resume", QMessageBox.AcceptRole)
+        discardButton = msgBox.addButton("Discard", QMessageBox.DestructiveRole)
+        laterButton = msgBox.addButton("Later", QMessageBox.RejectRole)
+        msgBox.setDefaultButton(resumeButton)
+        msgBox.setEscapeButton(laterButton)
+        msgBox.exec()
+        if msgBox.clickedButton() == resumeButton:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.resume_journal()
+        elif msgBox.clickedButton() == discardButton:
+            self.DiscardJournal(pending)
+
+    def DiscardJournal(self, pending):
+        uploads = sum(1 for entry in pending if entry["UploadId"] is not None)
+        downloads = sum(1 for entry in pending if S3Engine.DOWNLOAD == entry["Type"] and entry["ETag"])
+        ret = QMessageBox.warning(self, "Discard Transfers",
+                                  "Discarding aborts {0} multipart uploads, whose uploaded parts are lost, "
+                                  "and deletes {1} partly downloaded files.\n"
+                                  "Discard the unfinished transfers?".format(uploads, downloads),
+                                  QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if ret == QMessageBox.Yes:
+            self.window.tabWidget.setCurrentIndex(TabIndex.TasksTabIndex.value)
+            S3Tasks.discard_journal()
+
 if __name__ == "__main__":
     app = QApplication([])
     mainWindow = MainWindow()
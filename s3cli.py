@@ -0,0 +1,397 @@
+# Command line front end of S3Engine, no display or Qt needed, for example:
+#   python s3cli.py ls s3://bucket/logs/
+#   python s3cli.py cp -r ./photos s3://bucket/backup/
+#   python s3cli.py sync s3://bucket/backup/photos ./photos --delete
+#   python s3cli.py mv -r s3://bucket/old/ s3://other-bucket/new/
+#   python s3cli.py rm -r s3://bucket/tmp/
+#   python s3cli.py du s3://bucket/
+#   python s3cli.py ls --inventory s3://reports/bucket/daily/2024-01-01T01-00Z/manifest.json s3://bucket/logs/
+import argparse
+import os
+import sys
+import threading
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+
+import FolderSize
+import Inventory
+import S3Client
+import S3Engine
+import S3Sync
+from TransferScheduler import MAX_CONCURRENT_FILES, MAX_CONCURRENT_PARTS, COMPLETED, FAILED
+
+STATUS_INTERVAL = 1.0
+
+
+def parse_s3_url(url):
+    # (bucket, key) for s3://bucket/key, None for a local path
+    if not url.startswith("s3://"):
+        return None
+    bucket, _, key = url[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class CliListener(S3Engine.EngineListener):
+    # counts finished transfers and prints failures, an optional status line
+    # shows the throughput of the running ones
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # keeps lines from concurrent transfers apart
+        self.printLock = threading.Lock()
+        self.running = {}
+        self.tasks = {}
+        self.completed = 0
+        self.failed = 0
+        self.bytesDone = 0
+
+    def task_added(self, task_id, task, progress):
+        with self.lock:
+            self.tasks[task_id] = task
+            self.running[task_id] = progress
+
+    def task_state(self, task_id, state, error):
+        if state not in S3Engine.FINISHED_STATES:
+            return
+        with self.lock:
+            task = self.tasks[task_id]
+        # printed before the task counts as finished, so main cannot exit halfway through
+        target = "s3://{0}/{1}".format(task["Bucket"], task["Key"])
+        source = task["LocalPath"]
+        if "SourceKey" in task:
+            source = "s3://{0}/{1}".format(task["SourceBucket"], task["SourceKey"])
+        with self.printLock:
+            if FAILED == state:
+                print("failed: {0} {1}: {2}".format(task["Type"].lower(), target, error), file=sys.stderr)
+            elif not self.quiet:
+                print("{0}: {1} {2} {3}".format(state.lower(), task["Type"].lower(), source, target))
+        with self.lock:
+            del self.tasks[task_id]
+            self.running.pop(task_id, None)
+            if COMPLETED == state:
+                self.completed += 1
+                self.bytesDone += task["Size"]
+            elif FAILED == state:
+                self.failed += 1
+            self.idle.notify_all()
+
+    def status(self, started):
+        with self.lock:
+            transferred = self.bytesDone
+            speed = 0
+            for progress in self.running.values():
+                done, current = progress.snapshot()
+                transferred += done
+                speed += current or 0
+            return "{0} done, {1} failed, {2} running, {3:.1f} MB in {4:.0f}s, {5:.1f} MB/s".format(
+                self.completed, self.failed, len(self.running), transferred / 1024 / 1024,
+                time.monotonic() - started, speed / 1024 / 1024)
+
+    def wait_finished(self, timeout):
+        # True once every added task has reported its final state
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.tasks, timeout)
+
+
+def wait_for(engine, listener, quiet):
+    # every task is added before its job is submitted, so once the listener has
+    # seen them all finish the engine is idle as well
+    started = time.monotonic()
+    show = not quiet and sys.stderr.isatty()
+    while not listener.wait_finished(STATUS_INTERVAL):
+        if show:
+            print("\r" + listener.status(started), end="", file=sys.stderr, flush=True)
+    if show:
+        print("\r" + listener.status(started), file=sys.stderr)
+    return 0 if 0 == listener.failed else 1
+
+
+def load_inventory(args, bucket):
+    # the report given with --inventory, None to list from S3
+    if args.inventory is None:
+        return None
+    inventory = Inventory.load(args.inventory)
+    if inventory.bucket != bucket:
+        raise SystemExit("{0} is an inventory of {1}".format(args.inventory, inventory.bucket))
+    if not args.quiet:
+        print("{0} objects from the inventory of {1}".format(
+            len(inventory), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(inventory.created))), file=sys.stderr)
+    return inventory
+
+
+def ls_inventory(inventory, prefix, recursive):
+    def line(key, size, mtime):
+        return "{0}  {1:>12}  {2}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(mtime)), size, key)
+
+    if recursive:
+        for key, size, mtime, _, _ in inventory.iter_objects(prefix):
+            print(line(key, size, mtime))
+        return 0
+    for item in inventory.iter_children(prefix):
+        if "Dir" == item[0]:
+            print("{0:>19}  {1:>12}  {2}".format("", "PRE", prefix + item[1]))
+        else:
+            print(line(*item[1:4]))
+    return 0
+
+
+def cmd_ls(engine, listener, args):
+    location = parse_s3_url(args.path) if args.path else None
+    if location is None or "" == location[0]:
+        for bucket in S3Client.client().list_buckets()["Buckets"]:
+            print("{0}  {1}".format(bucket["CreationDate"].strftime("%Y-%m-%d %H:%M:%S"), bucket["Name"]))
+        return 0
+    bucket, prefix = location
+    inventory = load_inventory(args, bucket)
+    if inventory is not None:
+        return ls_inventory(inventory, prefix, args.recursive)
+    if args.recursive:
+        for obj in S3Engine.iter_prefix_objects(bucket, prefix):
+            print("{0}  {1:>12}  {2}".format(obj["LastModified"].strftime("%Y-%m-%d %H:%M:%S"), obj["Size"], obj["Key"]))
+        return 0
+    for page in S3Engine.iter_object_pages(bucket, Prefix=prefix):
+        for name, obj in page.items():
+            if "Dir" == obj["Type"]:
+                print("{0:>19}  {1:>12}  {2}".format("", "PRE", prefix + name))
+            else:
+                print("{0}  {1:>12}  {2}".format(obj["LastModified"].strftime("%Y-%m-%d %H:%M:%S"), obj["Size"],
+                                                 prefix + name))
+    return 0
+
+
+def copy_s3(engine, listener, args, source, destination, move):
+    # server-side, a single key or with -r everything under a prefix
+    (bucket, key), (dst_bucket, dst_key) = source, destination
+    if "" == key or key.endswith("/"):
+        if not args.recursive:
+            raise SystemExit("s3://{0}/{1} is a prefix, use -r".format(bucket, key))
+        if "" != dst_key and not dst_key.endswith("/"):
+            dst_key += "/"
+        # the prefix is copied into the destination under its own name
+        base = S3Engine.parent_prefix(key)
+        objects, prefixes = (), (key,)
+    else:
+        size = S3Client.for_bucket(bucket).head_object(Bucket=bucket, Key=key)["ContentLength"]
+        if "" == dst_key or dst_key.endswith("/"):
+            dst_key += key.rsplit("/", 1)[-1]
+        base = key
+        objects, prefixes = ((key, size),), ()
+
+    show = not args.quiet and sys.stderr.isatty()
+
+    def progress(copied, failed, deleted):
+        if show:
+            print("\r{0} copied, {1} failed, {2} deleted".format(copied, failed, deleted), end="", file=sys.stderr,
+                  flush=True)
+
+    try:
+        copied = engine.copy_objects(bucket, objects, prefixes, dst_bucket, base, dst_key, move, progress=progress)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        if show:
+            print(file=sys.stderr)
+    if not args.quiet:
+        print("{0} objects {1}".format(copied, "moved" if move else "copied"), file=sys.stderr)
+    return wait_for(engine, listener, True)
+
+
+def cmd_cp(engine, listener, args):
+    source = parse_s3_url(args.source)
+    destination = parse_s3_url(args.destination)
+    if source is not None and destination is not None:
+        return copy_s3(engine, listener, args, source, destination, False)
+    if (source is None) == (destination is None):
+        raise SystemExit("cp needs an s3:// location")
+    if destination is not None:
+        bucket, key = destination
+        if os.path.isdir(args.source):
+            if not args.recursive:
+                raise SystemExit("{0} is a directory, use -r".format(args.source))
+            if "" != key and not key.endswith("/"):
+                key += "/"
+            engine.upload_folder(bucket, key, args.source)
+        else:
+            if "" == key or key.endswith("/"):
+                key += os.path.basename(args.source)
+            engine.upload_file(bucket, key, args.source, os.path.getsize(args.source))
+    else:
+        bucket, key = source
+        if "" == key or key.endswith("/"):
+            if not args.recursive:
+                raise SystemExit("s3://{0}/{1} is a prefix, use -r".format(bucket, key))
+            engine.download_prefix(bucket, key, args.destination)
+        else:
+            size = S3Client.for_bucket(bucket).head_object(Bucket=bucket, Key=key)["ContentLength"]
+            if os.path.isdir(args.destination) or args.destination.endswith(os.sep):
+                dir, file_name = args.destination, key.rsplit("/", 1)[-1]
+            else:
+                dir, file_name = os.path.split(os.path.abspath(args.destination))
+            engine.download_file(bucket, key, dir, file_name, size)
+    return wait_for(engine, listener, args.quiet)
+
+
+def cmd_mv(engine, listener, args):
+    source = parse_s3_url(args.source)
+    destination = parse_s3_url(args.destination)
+    if source is None or destination is None:
+        raise SystemExit("mv needs two s3:// locations")
+    return copy_s3(engine, listener, args, source, destination, True)
+
+
+def cmd_rm(engine, listener, args):
+    location = parse_s3_url(args.path)
+    if location is None or "" == location[0]:
+        raise SystemExit("rm needs an s3:// location")
+    bucket, key = location
+    if args.recursive:
+        keys, prefixes = (), (key,)
+    else:
+        keys, prefixes = (key,), ()
+
+    def progress(deleted, failed):
+        if not args.quiet and sys.stderr.isatty():
+            print("\r{0} deleted, {1} failed".format(deleted, failed), end="", file=sys.stderr, flush=True)
+
+    deleted = S3Engine.delete_objects(bucket, keys, prefixes, progress=progress)
+    if not args.quiet:
+        print("\n{0} objects deleted".format(deleted), file=sys.stderr)
+    return 0
+
+
+def cmd_du(engine, listener, args):
+    location = parse_s3_url(args.path)
+    if location is None or "" == location[0]:
+        raise SystemExit("du needs an s3:// location")
+    bucket, prefix = location
+    if "" != prefix and not prefix.endswith("/"):
+        prefix += "/"
+    show = not args.quiet and sys.stderr.isatty()
+
+    def progress(totals):
+        if show:
+            print("\r{0} objects, {1:.1f} MB".format(totals.objects, totals.bytes / 1024 / 1024),
+                  end="", file=sys.stderr, flush=True)
+
+    started = time.monotonic()
+    inventory = load_inventory(args, bucket)
+    if inventory is not None:
+        total = inventory.totals(prefix)
+        children = inventory.children_totals(prefix)
+    else:
+        total, children = FolderSize.compute(bucket, prefix, progress=progress, workers=args.workers)
+    if show:
+        print(file=sys.stderr)
+    for name in sorted(children):
+        print("{0:>16}  {1:>12}  {2}".format(children[name].bytes, children[name].objects, prefix + name))
+    print("{0:>16}  {1:>12}  s3://{2}/{3}".format(total.bytes, total.objects, bucket, prefix))
+    for storageClass, (objects, size) in sorted(total.classes.items()):
+        print("{0:>16}  {1:>12}  {2}".format(size, objects, storageClass))
+    if not args.quiet:
+        print("listed in {0:.1f}s".format(time.monotonic() - started), file=sys.stderr)
+    return 0
+
+
+def cmd_sync(engine, listener, args):
+    source = parse_s3_url(args.source)
+    destination = parse_s3_url(args.destination)
+    if (source is None) == (destination is None):
+        raise SystemExit("sync needs exactly one s3:// location")
+    if destination is not None:
+        (bucket, prefix), local_dir, direction = destination, args.source, S3Sync.UPLOAD
+    else:
+        (bucket, prefix), local_dir, direction = source, args.destination, S3Sync.DOWNLOAD
+    if "" != prefix and not prefix.endswith("/"):
+        prefix += "/"
+    plan = S3Sync.plan_sync(bucket, prefix, local_dir, direction, delete=args.delete)
+    if args.dry_run or not args.quiet:
+        for action in plan:
+            print("{0}: {1} ({2})".format(action["Action"].lower(), action["Path"], action["Reason"]))
+    if args.dry_run:
+        return 0
+    deleted, failed = S3Sync.run_plan(engine, bucket, local_dir, plan)
+    if failed:
+        print("failed to delete {0} objects".format(failed), file=sys.stderr)
+    return max(wait_for(engine, listener, args.quiet), 1 if failed else 0)
+
+
+def cmd_resume(engine, listener, args):
+    pending = engine.journal.pending()
+    if args.discard:
+        engine.discard_journal()
+        print("{0} unfinished transfers discarded".format(len(pending)), file=sys.stderr)
+        return 0
+    print("{0} unfinished transfers resumed".format(len(pending)), file=sys.stderr)
+    engine.resume_journal()
+    return wait_for(engine, listener, args.quiet)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="S3Tools command line transfers")
+    parser.add_argument("--max-files", type=int, default=MAX_CONCURRENT_FILES,
+                        help="files transferred at once")
+    parser.add_argument("--max-parts", type=int, default=MAX_CONCURRENT_PARTS,
+                        help="parts in flight across all files")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print failures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ls = commands.add_parser("ls", help="list buckets or the keys under a prefix")
+    ls.add_argument("path", nargs="?", default="")
+    ls.add_argument("-r", "--recursive", action="store_true")
+    ls.add_argument("--inventory", metavar="MANIFEST", help="list from an S3 Inventory report instead of S3")
+    ls.set_defaults(run=cmd_ls)
+
+    cp = commands.add_parser("cp", help="upload or download files and folders, copy keys server-side")
+    cp.add_argument("source")
+    cp.add_argument("destination")
+    cp.add_argument("-r", "--recursive", action="store_true")
+    cp.set_defaults(run=cmd_cp)
+
+    mv = commands.add_parser("mv", help="move or rename keys server-side, prefixes with -r")
+    mv.add_argument("source")
+    mv.add_argument("destination")
+    mv.add_argument("-r", "--recursive", action="store_true")
+    mv.set_defaults(run=cmd_mv)
+
+    rm = commands.add_parser("rm", help="delete a key, or every key under a prefix with -r")
+    rm.add_argument("path")
+    rm.add_argument("-r", "--recursive", action="store_true")
+    rm.set_defaults(run=cmd_rm)
+
+    du = commands.add_parser("du", help="bytes and objects under a prefix, per child folder and storage class")
+    du.add_argument("path")
+    du.add_argument("--workers", type=int, default=FolderSize.SIZE_WORKERS, help="concurrent listings")
+    du.add_argument("--inventory", metavar="MANIFEST", help="sum an S3 Inventory report instead of listing")
+    du.set_defaults(run=cmd_du)
+
+    sync = commands.add_parser("sync", help="make a folder and a prefix match, in the direction given")
+    sync.add_argument("source")
+    sync.add_argument("destination")
+    sync.add_argument("--delete", action="store_true", help="also delete what the source does not have")
+    sync.add_argument("--dry-run", action="store_true", help="only print the plan")
+    sync.set_defaults(run=cmd_sync)
+
+    resume = commands.add_parser("resume", help="finish transfers left unfinished by an earlier run")
+    resume.add_argument("--discard", action="store_true", help="abort them instead")
+    resume.set_defaults(run=cmd_resume)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    listener = CliListener(args.quiet)
+    engine = S3Engine.TransferEngine(listener=listener, maxFiles=args.max_files, maxParts=args.max_parts)
+    try:
+        return args.run(engine, listener, args)
+    except (ClientError, BotoCoreError, OSError, RuntimeError, ValueError) as e:
+        print("error: {0}".format(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        # journaled transfers are picked up again by "resume"
+        print("\ninterrupted, run resume to finish the unfinished transfers", file=sys.stderr)
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# python -m unittest test_S3Engine, needs moto; S3 runs in process, nothing is sent
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.pop("AWS_ENDPOINT_URL", None)
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+os.environ["S3TOOLS_CONFIG_DIR"] = tempfile.mkdtemp()
+
+from moto import mock_aws
+
+import Checksums
+import S3Client
+import S3Engine
+
+BUCKET = "s3tools-test"
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class StateListener(S3Engine.EngineListener):
+    def __init__(self):
+        self.states = {}
+
+    def task_state(self, task_id, state, error):
+        self.states[task_id] = (state, error)
+
+
+class RangedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        S3Client._clients.clear()
+        S3Client._session = None
+        self.s3 = S3Client.client()
+        self.s3.create_bucket(Bucket=BUCKET)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.mock.stop()
+        S3Client._clients.clear()
+
+    def put_multipart(self, key, parts):
+        upload = self.s3.create_multipart_upload(Bucket=BUCKET, Key=key, ChecksumAlgorithm=Checksums.ALGORITHM)
+        done = []
+        for n, data in enumerate(parts, 1):
+            response = self.s3.upload_part(Bucket=BUCKET, Key=key, UploadId=upload["UploadId"], PartNumber=n,
+                                           Body=data, ChecksumAlgorithm=Checksums.ALGORITHM)
+            done.append({"PartNumber": n, "ETag": response["ETag"]})
+        self.s3.complete_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload["UploadId"],
+                                          MultipartUpload={"Parts": done})
+        return b"".join(parts)
+
+    def download(self, key, size):
+        listener = StateListener()
+        engine = S3Engine.TransferEngine(listener=listener)
+        task_id = engine.download_file(BUCKET, key, self.dir, os.path.basename(key), size)
+        engine.wait_idle()
+        return listener.states[task_id]
+
+    # objects from RESUMABLE_THRESHOLD up are fetched in ranges, lowered to keep the test small
+    @mock.patch("S3Engine.RESUMABLE_THRESHOLD", MIN_PART_SIZE)
+    @mock.patch("S3Engine.RANGE_SIZE", 2 * 1024 * 1024)
+    def test_download_above_threshold(self):
+        data = self.put_multipart("big.bin", [os.urandom(MIN_PART_SIZE), os.urandom(1024 * 1024 + 17)])
+        state, error = self.download("big.bin", len(data))
+        self.assertEqual(S3Engine.COMPLETED, state, error)
+        with open(os.path.join(self.dir, "big.bin"), "rb") as f:
+            self.assertEqual(data, f.read())
+
+    @mock.patch("S3Engine.RESUMABLE_THRESHOLD", MIN_PART_SIZE)
+    def test_replaced_object_fails(self):
+        data = self.put_multipart("big.bin", [os.urandom(MIN_PART_SIZE), os.urandom(1024)])
+        s3 = S3Client.for_bucket(BUCKET)
+        head = s3.head_object
+
+        def replaced(**kwargs):
+            # the object changes between the HEAD and the part lookup
+            response = head(**kwargs)
+            self.s3.put_object(Bucket=BUCKET, Key="big.bin", Body=b"new")
+            return response
+
+        with mock.patch.object(s3, "head_object", replaced):
+            state, error = self.download("big.bin", len(data))
+        self.assertEqual(S3Engine.FAILED, state)
+        self.assertIn("replaced", error)
+
+
+if __name__ == "__main__":
+    unittest.main()